@@ -39,6 +39,8 @@ from django.utils.decorators import method_decorator
 from django.utils.translation import ugettext as _, activate
 from django.conf import settings
 
+from uds.core.util.Config import GlobalConfig
+
 from .handlers import (
     Handler,
     HandlerError,
@@ -59,18 +61,36 @@ __all__ = [str(v) for v in ['Handler', 'Dispatcher']]
 AUTH_TOKEN_HEADER = 'X-Auth-Token'
 
 
+class Route:
+    """
+    Node of the compiled routes tree (see Dispatcher.compile)
+    """
+    __slots__ = ('children', 'handler', 'allowedMethods')
+
+    def __init__(self, handler, allowedMethods):
+        self.children = {}
+        self.handler = handler
+        self.allowedMethods = allowedMethods
+
+
 class Dispatcher(View):
     """
     This class is responsible of dispatching REST requests
     """
     # This attribute will contain all paths-->handler relations, added at Initialized method
     services = {'': None}  # Will include a default /rest handler, but rigth now this will be fine
+    # Compiled from services at initialize, with the allowed http methods of each handler precomputed
+    routes = Route(None, [])
+
+    # Content processor by content type (".xxx" extension or Content-Type header)
+    contentProcessors = {}
 
     @method_decorator(csrf_exempt)
     def dispatch(self, request, *args, **kwargs):
         """
         Processes the REST request and routes it wherever it needs to be routed
         """
+        start = time.perf_counter()
 
         # Remove session, so response middleware do nothing with this
         del request.session
@@ -78,38 +98,34 @@ class Dispatcher(View):
         path = kwargs['arguments'].split('/')
         del kwargs['arguments']
 
-        # Transverse service nodes too look for path
-        service = Dispatcher.services
+        # Transverse compiled routes too look for path
+        route = Dispatcher.routes
         full_path = []
         content_type = None
 
-        cls = None
         while len(path) > 0:
             # .json, .xml, ... will break path recursion
-            if path[0].find('.') != -1:
-                content_type = path[0].split('.')[1]
-
-            clean_path = path[0].split('.')[0]
-            if clean_path in service:
-                service = service[clean_path]
-                full_path.append(path[0])
-                path = path[1:]
-            else:
+            clean_path = path[0]
+            if '.' in clean_path:
+                clean_path, content_type = clean_path.split('.')[:2]
+
+            child = route.children.get(clean_path)
+            if child is None:
                 break
+            route = child
+            full_path.append(path[0])
+            path = path[1:]
 
         full_path = '/'.join(full_path)
-        logger.debug("REST request: %s (%s)",full_path, content_type)
+        logger.debug("REST request: %s (%s)", full_path, content_type)
 
-        # Here, service points to the path
-        cls = service['']
+        # Here, route points to the path
+        cls = route.handler
         if cls is None:
             return http.HttpResponseNotFound('method not found', content_type="text/plain")
 
         # Guess content type from content type header (post) or ".xxx" to method
-        try:
-            processor = processors.available_processors_ext_dict[content_type](request)
-        except Exception:
-            processor = processors.available_processors_mime_dict.get(request.META.get('CONTENT_TYPE', 'json'), processors.default_processor)(request)
+        processor = Dispatcher.processorFor(content_type, request.META.get('CONTENT_TYPE', 'json'))(request)
 
         # Obtain method to be invoked
         http_method = request.method.lower()
@@ -118,19 +134,18 @@ class Dispatcher(View):
 
         handler = None
 
+        routed = time.perf_counter()
         try:
             handler = cls(request, full_path, http_method, processor.processParameters(), *args, **kwargs)
-            operation = getattr(handler, http_method)
+            operation = getattr(handler, http_method, None)
+            if operation is None:
+                return http.HttpResponseNotAllowed(route.allowedMethods, content_type="text/plain")
         except processors.ParametersException as e:
             logger.debug('Path: %s', full_path)
             logger.debug('Error: %s', e)
             return http.HttpResponseServerError('Invalid parameters invoking {0}: {1}'.format(full_path, e), content_type="text/plain")
         except AttributeError:
-            allowedMethods = []
-            for n in ['get', 'post', 'put', 'delete']:
-                if hasattr(handler, n):
-                    allowedMethods.append(n)
-            return http.HttpResponseNotAllowed(allowedMethods, content_type="text/plain")
+            return http.HttpResponseNotAllowed(route.allowedMethods, content_type="text/plain")
         except AccessDenied:
             return http.HttpResponseForbidden('access denied', content_type="text/plain")
         except Exception:
@@ -141,11 +156,19 @@ class Dispatcher(View):
         # Invokes the handler's operation, add headers to response and returns
         try:
             response = operation()
+            handled = time.perf_counter()
 
             if not handler.raw:  # Raw handlers will return an HttpResponse Object
                 response = processor.getResponse(response)
             for k, val in handler.headers().items():
                 response[k] = val
+
+            rendered = time.perf_counter()
+            logger.debug('REST timings for %s %s: routing %.3f ms, handler %.3f ms, render %.3f ms', http_method, full_path, (routed - start) * 1000, (handled - routed) * 1000, (rendered - handled) * 1000)
+            if GlobalConfig.REST_TIMINGS.getBool():
+                response['Server-Timing'] = 'routing;dur={:.3f}, handler;dur={:.3f}, render;dur={:.3f}'.format(
+                    (routed - start) * 1000, (handled - routed) * 1000, (rendered - handled) * 1000
+                )
             return response
         except RequestError as e:
             return http.HttpResponseBadRequest(str(e), content_type="text/plain")
@@ -163,6 +186,22 @@ class Dispatcher(View):
             logger.exception('Error processing request')
             return http.HttpResponseServerError(str(e), content_type="text/plain")
 
+    @staticmethod
+    def processorFor(extension, contentType):
+        """
+        Returns the content processor class for an extension (".xxx" of path, if any) or, if not found, for a
+        Content-Type header
+        """
+        key = (extension, contentType)
+        processor = Dispatcher.contentProcessors.get(key)
+        if processor is None:
+            processor = processors.available_processors_ext_dict.get(extension)
+            if processor is None:
+                processor = processors.available_processors_mime_dict.get(contentType, processors.default_processor)
+            if len(Dispatcher.contentProcessors) < 256:  # Content-Type headers are set by clients, so do not grow without limit
+                Dispatcher.contentProcessors[key] = processor
+        return processor
+
     @staticmethod
     def registerSubclasses(classes):
         """
@@ -210,6 +249,20 @@ class Dispatcher(View):
             __import__(__name__ + '.' + package + '.' + name, globals(), locals(), [], 0)
 
         Dispatcher.registerSubclasses(Handler.__subclasses__())  # @UndefinedVariable
+        Dispatcher.routes = Dispatcher.compile(Dispatcher.services)
+
+    @staticmethod
+    def compile(services):
+        """
+        Compiles the services tree into routes, precomputing the allowed methods of each handler
+        """
+        handler = services.get('')
+        allowedMethods = [n for n in ['get', 'post', 'put', 'delete'] if handler is not None and hasattr(handler, n)]
+        route = Route(handler, allowedMethods)
+        for k, v in services.items():
+            if k != '':
+                route.children[k] = Dispatcher.compile(v)
+        return route
 
 
 Dispatcher.initialize()
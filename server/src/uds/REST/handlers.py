@@ -31,6 +31,9 @@
 @author: Adolfo Gómez, dkmaster at dkmon dot com
 """
 import typing
+import threading
+import copy
+import time
 import logging
 
 from django.contrib.sessions.backends.db import SessionStore
@@ -81,6 +84,73 @@ class NotSupportedError(HandlerError):
     """
 
 
+class SessionCache:
+    """
+    Process wide cache of authenticated REST sessions.
+    Keeps, for a short time (TTL seconds), the REST session data and the user of an auth token, so consecutive REST
+    requests do not need to load (and unpickle) the session and the user from database.
+    Entries are invalidated when session data is changed or the token is cleaned (logout) by this process. Changes made
+    by other processes (servers) will be visible, at most, TTL seconds later.
+    """
+    enabled: typing.ClassVar[bool] = True
+    TTL: typing.ClassVar[int] = 10  # Seconds a session is kept without reloading it from database
+    MAX_ENTRIES: typing.ClassVar[int] = 1000
+
+    _cache: typing.ClassVar[typing.Dict[str, typing.Tuple[float, typing.Dict, typing.Any]]] = {}
+    _lock: typing.ClassVar[threading.Lock] = threading.Lock()
+
+    # Counters, for performance checking
+    hits: typing.ClassVar[int] = 0
+    misses: typing.ClassVar[int] = 0
+
+    @staticmethod
+    def get(authToken):
+        """
+        Returns (session, user) of authToken if it is cached, or None
+        """
+        if not SessionCache.enabled:
+            return None
+        cached = SessionCache._cache.get(authToken)
+        if cached is None or cached[0] < time.time():
+            SessionCache.misses += 1
+            return None
+        SessionCache.hits += 1
+        session = SessionStore(session_key=authToken)
+        session._session_cache = copy.deepcopy(cached[1])  # pylint: disable=protected-access
+        return session, copy.deepcopy(cached[2])  # Each request gets its own user instance
+
+    @staticmethod
+    def put(authToken, session, user):
+        if not SessionCache.enabled:
+            return
+        now = time.time()
+        with SessionCache._lock:
+            if len(SessionCache._cache) >= SessionCache.MAX_ENTRIES:
+                for k in [k for k, v in SessionCache._cache.items() if v[0] < now]:
+                    del SessionCache._cache[k]
+                if len(SessionCache._cache) >= SessionCache.MAX_ENTRIES:
+                    SessionCache._cache.clear()
+            SessionCache._cache[authToken] = (now + SessionCache.TTL, copy.deepcopy(dict(session.items())), copy.deepcopy(user))
+
+    @staticmethod
+    def invalidate(authToken):
+        with SessionCache._lock:
+            SessionCache._cache.pop(authToken, None)
+
+    @staticmethod
+    def clear():
+        with SessionCache._lock:
+            SessionCache._cache.clear()
+
+    @staticmethod
+    def hitRatio():
+        """
+        Returns the ratio (0 to 1) of session lookups served from cache
+        """
+        total = SessionCache.hits + SessionCache.misses
+        return SessionCache.hits / total if total else 0.0
+
+
 class Handler:
     """
     REST requests handler base class
@@ -111,14 +181,18 @@ class Handler:
         self._authToken = None
         self._user = None
         if self.authenticated:  # Only retrieve auth related data on authenticated handlers
-            try:
-                self._authToken = self._request.META.get(AUTH_TOKEN_HEADER, '')
-                self._session = SessionStore(session_key=self._authToken)
-                if 'REST' not in self._session:
-                    raise Exception()  # No valid session, so auth_token is also invalid
-            except Exception:  # Couldn't authenticate
-                self._authToken = None
-                self._session = None
+            self._authToken = self._request.META.get(AUTH_TOKEN_HEADER, '')
+            cached = SessionCache.get(self._authToken)
+            if cached is not None:
+                self._session, self._user = cached
+            else:
+                try:
+                    self._session = SessionStore(session_key=self._authToken)
+                    if 'REST' not in self._session:
+                        raise Exception()  # No valid session, so auth_token is also invalid
+                except Exception:  # Couldn't authenticate
+                    self._authToken = None
+                    self._session = None
 
             if self._authToken is None:
                 raise AccessDenied()
@@ -129,7 +203,9 @@ class Handler:
             if self.needs_staff and not self.getValue('staff_member'):
                 raise AccessDenied()
 
-            self._user = self.getUser()
+            if self._user is None:
+                self._user = self.getUser()
+                SessionCache.put(self._authToken, self._session, self._user)
 
     def headers(self):
         """
@@ -183,6 +259,8 @@ class Handler:
         if is_admin:
             staff_member = True  # Make admins also staff members :-)
 
+        SessionCache.invalidate(session.session_key)
+
         session['REST'] = {
             'auth': id_auth,
             'username': username,
@@ -215,6 +293,8 @@ class Handler:
         """
         Cleans up the authentication token
         """
+        if self._authToken:
+            SessionCache.invalidate(self._authToken)
         self._authToken = None
         if self._session:
             self._session.delete()
@@ -238,6 +318,7 @@ class Handler:
             self._session['REST'][key] = value
             self._session.accessed = True
             self._session.save()
+            SessionCache.invalidate(self._authToken)
         except Exception:
             logger.exception('Got an exception setting session value %s to %s', key, value)
 
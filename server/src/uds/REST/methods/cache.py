@@ -47,11 +47,12 @@ class Cache(Handler):
 
     def get(self):
         """
-        Processes get method. Basically, clears & purges the cache, no matter what params
+        Processes get method. Without params, returns cache statistics of this server.
+        With any param, clears & purges the cache
         """
         logger.debug('Params: %s', self._params)
         if not self._args:
-            return {}
+            return uCache.stats()
 
         if len(self._args) != 1:
             raise RequestError('Invalid Request')
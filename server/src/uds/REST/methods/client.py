@@ -124,7 +124,7 @@ class Client(Handler):
         logger.debug('Got Ticket: %s, scrambled: %s, Hostname: %s, Ip: %s', ticket, scrambler, hostname, srcIp)
 
         try:
-            data = TicketStore.get(ticket)
+            data = TicketStore.get(ticket, owner=TicketStore.OWNER_CLIENT)
         except Exception:
             return Client.result(error=errors.ACCESS_DENIED)
 
@@ -151,7 +151,7 @@ class Client(Handler):
             })
         except ServiceNotReadyError as e:
             # Refresh ticket and make this retrayable
-            TicketStore.revalidate(ticket, 20)  # Retry will be in at most 5 seconds
+            TicketStore.revalidate(ticket, 20, owner=TicketStore.OWNER_CLIENT)  # Retry will be in at most 5 seconds
             return Client.result(error=errors.SERVICE_IN_PREPARATION, errorCode=e.code, retryable=True)
         except Exception as e:
             logger.exception("Exception")
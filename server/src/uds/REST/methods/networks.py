@@ -35,7 +35,6 @@ import logging
 from django.utils.translation import ugettext_lazy as _, ugettext
 
 from uds.models import Network
-from uds.core.util import net
 from uds.core.util import permissions
 from uds.core.ui.UserInterface import gui
 
@@ -65,9 +64,7 @@ class Networks(ModelHandler):
     def beforeSave(self, fields):
         logger.debug('Before {0}'.format(fields))
         try:
-            nr = net.networksFromString(fields['net_string'], False)
-            fields['net_start'] = nr[0]
-            fields['net_end'] = nr[1]
+            fields['net_start'], fields['net_end'], fields['version'] = Network.limitsFromString(fields['net_string'])
         except Exception as e:
             raise SaveException(ugettext('Invalid network: {}').format(e))
         logger.debug('Processed %s', fields)
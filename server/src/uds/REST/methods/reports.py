@@ -32,16 +32,25 @@
 """
 import logging
 
+from django.http import StreamingHttpResponse
 from django.utils.translation import ugettext_lazy as _
 
 from uds.REST import model
 from uds import reports
+from uds.core.reports import jobs
 
 
 logger = logging.getLogger(__name__)
 
 VALID_PARAMS = ('authId', 'authSmallName', 'auth', 'username', 'realname', 'password', 'groups', 'servicePool', 'transport')
 
+# Second argument of PUT that requests the report as a file download, streamed while generated
+STREAM = 'stream'
+# Second argument of PUT that requests the report to be generated on background
+ASYNC = 'async'
+# First argument of GET for background generated reports status & result
+STATUS, RESULT = 'status', 'result'
+
 
 # Enclosed methods under /actor path
 class Reports(model.BaseModelHandler):
@@ -89,6 +98,10 @@ class Reports(model.BaseModelHandler):
         if nArgs == 2:
             if self._args[0] == model.GUI:
                 return self.getGui(self._args[1])
+            elif self._args[0] == STATUS:
+                return jobs.status(self._args[1]) or self.invalidItemException()
+            elif self._args[0] == RESULT:
+                return jobs.result(self._args[1]) or self.invalidItemException()
 
         return self.invalidRequestException()
 
@@ -98,11 +111,17 @@ class Reports(model.BaseModelHandler):
         """
         logger.debug('method PUT for %s, %s, %s', self.__class__.__name__, self._args, self._params)
 
-        if len(self._args) != 1:
+        if len(self._args) not in (1, 2) or (len(self._args) == 2 and self._args[1] not in (STREAM, ASYNC)):
             return self.invalidRequestException()
 
         report = self._findReport(self._args[0], self._params)
 
+        if len(self._args) == 2:
+            if self._args[1] == ASYNC:
+                # Returns the job status, that can be polled using GET status/<id> until it is done, and then GET result/<id>
+                return jobs.submit(report)
+            return self.stream(report)
+
         try:
             logger.debug('Report: %s', report)
             result = report.generateEncoded()
@@ -119,6 +138,17 @@ class Reports(model.BaseModelHandler):
             logger.exception('Generating report')
             return self.invalidRequestException(str(e))
 
+    def stream(self, report):
+        """
+        Returns the report as a file download, sent while it is generated (tabular reports are generated
+        row by row, so big reports do not need to be kept on memory), instead of base64 encoded inside a json response
+        """
+        logger.debug('Streaming report: %s', report)
+        self.raw = True
+        response = StreamingHttpResponse(report.generateStream(), content_type=report.mime_type)
+        response['Content-Disposition'] = 'attachment; filename="{}"'.format(report.filename)
+        return response
+
     # Gui related
     def getGui(self, uuid):
         report = self._findReport(uuid)
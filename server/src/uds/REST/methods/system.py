@@ -37,6 +37,7 @@ from datetime import timedelta
 from uds.models import User, Group, Service, UserService, ServicePool, MetaPool, getSqlDatetime
 
 from uds.core.util.stats import counters
+from uds.core.jobs.DelayedTaskRunner import DelayedTaskRunner
 from uds.core.util.Cache import Cache
 from uds.core.util.State import State
 from uds.core.util import encoders
@@ -104,6 +105,8 @@ class System(Handler):
                     'user_services': user_services,
                     'restrained_services_pools': restrained_services_pools,
                 }
+            if self._args[0] == 'tasks':  # Delayed tasks metrics, per server
+                return DelayedTaskRunner.publishedStats()
 
         if len(self._args) == 2:
             if self._args[0] == 'stats':
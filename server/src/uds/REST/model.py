@@ -745,11 +745,12 @@ class ModelHandler(BaseModelHandler):
         raise Exception('Invalid code executed on processDetail')
 
     def getItems(self, *args, **kwargs) -> typing.Generator:
+        overview = kwargs.pop('overview', True)
         for item in self.model.objects.filter(*args, **kwargs):
             try:
                 if permissions.checkPermissions(self._user, item, permissions.PERMISSION_READ) is False:
                     continue
-                if kwargs.get('overview', True):
+                if overview:
                     yield self.item_as_dict_overview(item)
                 else:
                     res = self.item_as_dict(item)
@@ -771,8 +772,9 @@ class ModelHandler(BaseModelHandler):
         logger.debug('method GET for %s, %s', self.__class__.__name__, self._args)
         nArgs = len(self._args)
 
+        # Items lists are returned as generators, so they are streamed as they are rendered
         if nArgs == 0:
-            return list(self.getItems(overview=False))
+            return self.getItems(overview=False)
 
         # if has custom methods, look for if this request matches any of them
         for cm in self.custom_methods:
@@ -799,7 +801,7 @@ class ModelHandler(BaseModelHandler):
 
         if nArgs == 1:
             if self._args[0] == OVERVIEW:
-                return list(self.getItems())
+                return self.getItems()
             elif self._args[0] == TYPES:
                 return list(self.getTypes())
             elif self._args[0] == TABLEINFO:
@@ -31,6 +31,7 @@
 @author: Adolfo Gómez, dkmaster at dkmon dot com
 """
 import datetime
+import itertools
 import json
 import logging
 import time
@@ -39,6 +40,8 @@ import typing
 
 from django import http
 
+from uds.core.util.instances import InstanceCache
+
 # from xml_marshaller import xml_marshaller
 
 logger = logging.getLogger(__name__)
@@ -54,6 +57,7 @@ class ContentProcessor:
     """
     mime_type: typing.ClassVar[typing.Optional[str]] = None
     extensions: typing.ClassVar[typing.Iterable[str]] = []
+    stream_chunk_size: typing.ClassVar[int] = 65536  # Streamed responses are sent in chunks of (at least) this size
 
     def __init__(self, request):
         self._request = request
@@ -77,16 +81,40 @@ class ContentProcessor:
     def getResponse(self, obj):
         """
         Converts an obj to a response of specific type (json, XML, ...)
-        This is done using "render" method of specific type
+        This is done using "render" method of specific type.
+        Generators (i.e. lists of items from ModelHandler.getItems) are streamed using "renderStream"
         """
+        if isinstance(obj, types.GeneratorType):
+            # Gets first element here, so errors (i.e. on database query) are reported instead of breaking the stream
+            try:
+                first = next(obj)
+            except StopIteration:
+                obj = iter(())
+            else:
+                obj = itertools.chain((first,), obj)
+            return http.StreamingHttpResponse(self.__stream(obj), content_type=self.mime_type + "; charset=utf-8")
+
         return http.HttpResponse(content=self.render(obj), content_type=self.mime_type + "; charset=utf-8")
 
+    def __stream(self, items):
+        # Streamed content is rendered once the request has been processed (and its instances scope closed),
+        # so items are rendered inside its own scope
+        with InstanceCache.scope():
+            yield from self.renderStream(items)
+
     def render(self, obj):
         """
         Renders an obj to the spefific type
         """
         return str(obj)
 
+    def renderStream(self, items):
+        """
+        Renders a list of items as a sequence of chunks.
+        Processors that can render items one by one should override this
+        """
+        yield self.render(list(items))
+
     @staticmethod
     def procesForRender(obj):
         """
@@ -140,6 +168,23 @@ class MarshallerProcessor(ContentProcessor):
         # return json.dumps(obj)
 
 
+class JsonEncoder(json.JSONEncoder):
+    """
+    JSON encoder that converts in a single pass the types procesForRender converts
+    """
+    def default(self, o):  # pylint: disable=method-hidden
+        if isinstance(o, (datetime.datetime, datetime.date)):
+            return int(time.mktime(o.timetuple()))
+
+        if isinstance(o, bytes):
+            return o.decode('utf-8')
+
+        if isinstance(o, types.GeneratorType):
+            return list(o)
+
+        return str(o)
+
+
 # ---------------
 # Json Processor
 # ---------------
@@ -150,6 +195,25 @@ class JsonProcessor(MarshallerProcessor):
     mime_type = 'application/json'
     extensions = ['json']
     marshaller = json
+    encoder = JsonEncoder()
+
+    def render(self, obj):
+        return self.encoder.encode(obj)
+
+    def renderStream(self, items):
+        encode = self.encoder.encode
+        chunk, size, separator = ['['], 1, ''
+        for item in items:
+            data = encode(item)
+            chunk.append(separator)
+            chunk.append(data)
+            size += len(data) + 2
+            separator = ', '
+            if size >= self.stream_chunk_size:
+                yield ''.join(chunk)
+                chunk, size = [], 0
+        chunk.append(']')
+        yield ''.join(chunk)
 
 # ---------------
 # XML Processor
@@ -74,6 +74,8 @@ class UDSAppConfig(AppConfig):
         from . import dispatchers  # Ensure all dischatchers all also available
         from . import plugins  # To make sure plugins are loaded on memory
         from . import REST  # To make sure REST initializes all what it needs
+        from .web.util import catalog  # To make sure services catalog is invalidated on changes
+        from .core.util import netindex  # To make sure network index is invalidated on changes
 
 
 default_app_config = 'uds.UDSAppConfig'
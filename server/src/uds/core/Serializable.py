@@ -32,7 +32,8 @@
 """
 from __future__ import unicode_literals
 
-from uds.core.util import encoders
+import base64
+import six
 
 
 class Serializable(object):
@@ -80,10 +81,14 @@ class Serializable(object):
         """
         Serializes and "obfuscates' the data.
         """
-        return encoders.encode(self.marshal(), 'base64', asText=True)
+        data = self.marshal()
+        if isinstance(data, six.text_type):
+            data = data.encode('utf8')
+        return base64.b64encode(data).decode('ascii')
 
     def unserialize(self, str_):
         """
         des-obfuscates the data and then de-serializes it via unmarshal method
+        Data encoded with line breaks (as previous versions did) is also accepted
         """
-        return self.unmarshal(encoders.decode(str_, 'base64'))
+        return self.unmarshal(base64.b64decode(str_))
@@ -319,6 +319,7 @@ def webLogout(request, exit_url=None):
     Helper function to clear user related data from session. If this method is not used, the session we be cleaned anyway
     by django in regular basis.
     """
+    from uds.REST.handlers import SessionCache
 
     authenticator = request.user and request.user.manager.getInstance() or None
     username = request.user and request.user.name or None
@@ -328,6 +329,7 @@ def webLogout(request, exit_url=None):
         # Try yo invoke logout of auth
         events.addEvent(request.user.manager, events.ET_LOGOUT, username=request.user.name, srcip=request.ip)
 
+    SessionCache.invalidate(request.session.session_key)  # Session is also the REST auth token
     request.session.clear()
     if exit_url is None:
         exit_url = GlobalConfig.LOGIN_URL.get()
@@ -33,6 +33,7 @@
 from __future__ import unicode_literals
 
 from uds.core.Environment import Environmentable
+from uds.core.util.instances import InstanceCache
 import logging
 
 __updated__ = '2018-09-17'
@@ -54,7 +55,8 @@ class DelayedTask(Environmentable):
 
     def execute(self):
         try:
-            self.run()
+            with InstanceCache.scope():
+                self.run()
         except Exception as e:
             logger.error('Job {0} raised an exception: {1}'.format(self.__class__, e))
 
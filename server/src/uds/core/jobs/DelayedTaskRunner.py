@@ -32,11 +32,13 @@
 """
 from __future__ import unicode_literals
 
-from django.db import transaction, connection
+from django.db import transaction, connection, close_old_connections
 from django.db.models import Q
 from uds.models import DelayedTask as dbDelayedTask
 from uds.models import getSqlDatetime
 from uds.core.Environment import Environment
+from uds.core.util.ThreadPool import ThreadPool
+from uds.core.util.Config import GlobalConfig
 from uds.core.util import encoders
 from socket import gethostname
 from pickle import loads, dumps
@@ -45,33 +47,25 @@ import threading
 import time
 import logging
 
-__updated__ = '2018-09-17'
+__updated__ = '2019-02-12'
 
 logger = logging.getLogger(__name__)
 
 
-class DelayedTaskThread(threading.Thread):
-    """
-    Class responsible of executing a delayed task in its own thread
-    """
-
-    def __init__(self, taskInstance):
-        super(DelayedTaskThread, self).__init__()
-        self._taskInstance = taskInstance
-
-    def run(self):
-        try:
-            self._taskInstance.execute()
-        except Exception as e:
-            logger.exception("Exception in thread {0}: {1}".format(e.__class__, e))
-
-
 class DelayedTaskRunner(object):
     """
     Delayed task runner class
+
+    Due tasks are claimed in batches (as many as free workers), and executed on a bounded pool of workers.
+    When no task is due, the runner sleeps until next task execution time (at most "granularity" seconds, so
+    tasks inserted by other servers are also noticed). Tasks inserted by this process wakes the runner.
     """
-    # How often tasks r checked
+    # Maximum time between checks for tasks
     granularity = 2
+    # Minimum time between checks when no task could be claimed (due ones are being claimed by other servers)
+    minWait = 0.2
+    # Interval between stats publication, in seconds
+    statsInterval = 60
 
     # to keep singleton DelayedTaskRunner
     _runner = None
@@ -80,6 +74,20 @@ class DelayedTaskRunner(object):
         logger.debug("Initializing delayed task runner")
         self._hostname = gethostname()
         self._keepRunning = True
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._pool = None
+        self._workers = 0
+        self._inFlight = 0
+        self._nextStats = 0
+        # Metrics
+        self._executed = 0
+        self._failed = 0
+        self._lastLag = 0.0
+        self._maxLag = 0.0
+        self._lastExecTime = 0.0
+        self._totalExecTime = 0.0
+        self._maxExecTime = 0.0
 
     def notifyTermination(self):
         """
@@ -87,43 +95,149 @@ class DelayedTaskRunner(object):
         It will mark the thread to "stop" ASAP
         """
         self._keepRunning = False
+        self._wakeup.set()
 
     @staticmethod
     def runner():
         """
         Static method that returns an instance (singleton instance) to a Delayed Runner.
-        There is only one instance of DelayedTaksRunner, but its "run" method is executed on
-        many thread (depending on configuration). They all share common Instance data
+        There is only one instance of DelayedTaksRunner, whose "run" method claims due tasks and
+        executes them on its pool of workers (the number of workers depends on configuration)
         """
         if DelayedTaskRunner._runner is None:
             DelayedTaskRunner._runner = DelayedTaskRunner()
         return DelayedTaskRunner._runner
 
-    def executeOneDelayedTask(self):
+    def __executeTask(self, taskInstance, lag):
+        close_old_connections()
+        start = time.time()
+        failed = False
+        try:
+            taskInstance.execute()
+        except Exception as e:
+            failed = True
+            logger.exception("Exception in delayed task {0}: {1}".format(e.__class__, e))
+        finally:
+            elapsed = time.time() - start
+            with self._lock:
+                self._failed += failed
+                self._inFlight -= 1
+                self._executed += 1
+                self._lastLag = lag
+                self._maxLag = max(self._maxLag, lag)
+                self._lastExecTime = elapsed
+                self._totalExecTime += elapsed
+                self._maxExecTime = max(self._maxExecTime, elapsed)
+            self._wakeup.set()  # A worker is free
+
+    def claimDelayedTasks(self, limit):
+        """
+        Claims (removes from database) up to "limit" due tasks
+        Returns a list of (taskInstance, lag), and the execution time of the next non claimed task (or None)
+        """
         now = getSqlDatetime()
         filt = Q(execution_time__lt=now) | Q(insert_date__gt=now + timedelta(seconds=30))
         # If next execution is before now or last execution is in the future (clock changed on this server, we take that task as executable)
+        skipLocked = connection.features.has_select_for_update_skip_locked
+        with transaction.atomic():  # Encloses
+            tasks = list(dbDelayedTask.objects.select_for_update(skip_locked=skipLocked).filter(filt).order_by('execution_time')[:limit])  # @UndefinedVariable
+            if tasks:
+                dbDelayedTask.objects.filter(id__in=[t.id for t in tasks]).delete()  # @UndefinedVariable
+
+        if len(tasks) < limit:
+            nextTask = dbDelayedTask.objects.order_by('execution_time').values_list('execution_time', flat=True).first()  # @UndefinedVariable
+        else:
+            nextTask = now  # Probably there are more tasks waiting
+
+        res = []
+        for task in tasks:
+            if task.insert_date > now + timedelta(seconds=30):
+                logger.warning('EXecuted {} due to insert_date being in the future!'.format(task.type))
+            try:
+                taskInstance = loads(encoders.decode(task.instance, 'base64'))
+            except Exception:
+                # Note that is taskInstance can't be loaded, this task will not be retried
+                logger.exception('Loading delayed task {}'.format(task))
+                continue
+            if taskInstance is not None:
+                logger.debug('Executing delayedTask:>{0}<'.format(task))
+                taskInstance.env = Environment.getEnvForType(taskInstance.__class__)
+                res.append((taskInstance, max(0.0, (now - task.execution_time).total_seconds())))
+
+        return res, nextTask
+
+    def executeDelayedTasks(self):
+        """
+        Claims as many due tasks as free workers, and send them to workers
+        Returns the number of seconds to wait until next check
+        """
+        free = self._workers - self._inFlight
+        if free <= 0:
+            return self.granularity  # Woken up as soon as a worker gets free
+
+        tasks, nextTask = self.claimDelayedTasks(free)
+        for taskInstance, lag in tasks:
+            with self._lock:
+                self._inFlight += 1
+            self._pool.add_task(self.__executeTask, taskInstance, lag)
+
+        if nextTask is None:
+            return self.granularity
+        wait = min(max((nextTask - getSqlDatetime()).total_seconds(), 0), self.granularity)
+        if not tasks:
+            wait = max(wait, self.minWait)  # Due tasks locked by other servers, do not spin on database
+        return wait
+
+    def stats(self):
+        """
+        Returns runner metrics (queue depth, lag and execution times)
+        """
+        with self._lock:
+            executed = self._executed
+            res = {
+                'host': self._hostname,
+                'workers': self._workers,
+                'in_flight': self._inFlight,
+                'executed': executed,
+                'failed': self._failed,
+                'last_lag': self._lastLag,
+                'max_lag': self._maxLag,
+                'last_exec_time': self._lastExecTime,
+                'avg_exec_time': self._totalExecTime / executed if executed else 0.0,
+                'max_exec_time': self._maxExecTime,
+            }
         try:
-            with transaction.atomic():  # Encloses
-                # Throws exception if no delayed task is avilable
-                task = dbDelayedTask.objects.select_for_update().filter(filt).order_by('execution_time')[0]  # @UndefinedVariable
-                if task.insert_date > now + timedelta(seconds=30):
-                    logger.warning('EXecuted {} due to insert_date being in the future!'.format(task.type))
-                taskInstanceDump = encoders.decode(task.instance, 'base64')
-                task.delete()
-            taskInstance = loads(taskInstanceDump)
-        except IndexError:
-            return  # No problem, there is no waiting delayed task
+            res['queue_depth'] = dbDelayedTask.objects.filter(execution_time__lt=getSqlDatetime()).count()  # @UndefinedVariable
         except Exception:
-            # Transaction have been rolled back using the "with atomic", so here just return
-            # Note that is taskInstance can't be loaded, this task will not be retried
-            logger.exception('Executing one task')
-            return
+            res['queue_depth'] = -1
+        return res
+
+    def publishStats(self):
+        """
+        Logs & stores current metrics on cache, so they can be accesed from any server
+        """
+        from uds.core.util.Cache import Cache
+        stats = self.stats()
+        logger.info('Delayed tasks: {}'.format(stats))
+        cache = Cache('DelayedTaskRunner')
+        hosts = cache.get('hosts') or []
+        if self._hostname not in hosts:
+            cache.put('hosts', hosts + [self._hostname], self.statsInterval * 10)
+        cache.put(self._hostname, stats, self.statsInterval * 2)
 
-        if taskInstance is not None:
-            logger.debug('Executing delayedTask:>{0}<'.format(task))
-            taskInstance.env = Environment.getEnvForType(taskInstance.__class__)
-            DelayedTaskThread(taskInstance).start()
+    @staticmethod
+    def publishedStats():
+        """
+        Returns metrics published by every server
+        """
+        from uds.core.util.Cache import Cache
+        cache = Cache('DelayedTaskRunner')
+        res = []
+        for host in cache.get('hosts') or []:
+            stats = cache.get(host)
+            if stats is not None:
+                res.append(stats)
+        return res
 
     def __insert(self, instance, delay, tag):
         now = getSqlDatetime()
@@ -137,6 +251,9 @@ class DelayedTaskRunner(object):
         dbDelayedTask.objects.create(type=typeName, instance=instanceDump,  # @UndefinedVariable
                                      insert_date=now, execution_delay=delay, execution_time=exec_time, tag=tag)
 
+        if delay < self.granularity:
+            self._wakeup.set()
+
     def insert(self, instance, delay, tag=''):
         retries = 3
         while retries > 0:
@@ -178,14 +295,23 @@ class DelayedTaskRunner(object):
 
     def run(self):
         logger.debug("At loop")
+        self._workers = max(GlobalConfig.DELAYED_TASKS_THREADS.getInt(), 1)
+        self._pool = ThreadPool(self._workers, self._workers)
         while self._keepRunning:
+            wait = self.granularity
+            self._wakeup.clear()
             try:
-                time.sleep(self.granularity)
-                self.executeOneDelayedTask()
+                wait = self.executeDelayedTasks()
+                if time.time() >= self._nextStats:
+                    self._nextStats = time.time() + self.statsInterval
+                    self.publishStats()
             except Exception as e:
                 logger.error('Unexpected exception at run loop {0}: {1}'.format(e.__class__, e))
                 try:
                     connection.close()
                 except Exception:
                     logger.exception('Exception clossing connection at delayed task')
+            if wait > 0:
+                self._wakeup.wait(wait)
         logger.info('Exiting DelayedTask Runner because stop has been requested')
+        self._pool.wait_completion()
@@ -33,6 +33,7 @@
 from __future__ import unicode_literals
 
 from uds.core import Environmentable
+from uds.core.util.instances import InstanceCache
 import logging
 
 __updated__ = '2014-11-26'
@@ -46,6 +47,7 @@ class Job(Environmentable):
     frecuency = 24 * 3600 + 3  # Defaults to a big one, and i know frecuency is written as frequency, but this is an "historical mistake" :)
     frecuency_cfg = None  # If we use a configuration variable from DB, we need to update the frecuency asap, but not before app is ready
     friendly_name = 'Unknown'
+    concurrency = 1  # Max simultaneous executions of this job inside a server scheduler pool (cluster wide, the job is locked while running)
 
     def __init__(self, environment):
         """
@@ -67,7 +69,8 @@ class Job(Environmentable):
 
     def execute(self):
         try:
-            self.run()
+            with InstanceCache.scope():
+                self.run()
         except Exception:
             logger.exception('Job {0} raised an exception:'.format(self.__class__))
 
@@ -33,9 +33,11 @@
 from __future__ import unicode_literals
 
 from django.db.models import Q
-from django.db import transaction, DatabaseError, connection
+from django.db import transaction, DatabaseError, connection, close_old_connections
 from uds.models import Scheduler as dbScheduler, getSqlDatetime
 from uds.core.util.State import State
+from uds.core.util.ThreadPool import ThreadPool
+from uds.core.util.Config import GlobalConfig
 from uds.core.jobs.JobsFactory import JobsFactory
 from datetime import timedelta
 import platform
@@ -43,61 +45,76 @@ import threading
 import time
 import logging
 
-__updated__ = '2018-03-02'
+__updated__ = '2019-02-13'
 
 logger = logging.getLogger(__name__)
 
 
-class JobThread(threading.Thread):
+class JobRun(object):
     """
     Class responsible of executing one job.
     This class:
       Ensures that the job is executed in a controlled way (any exception will be catch & processed)
-      Ensures that the scheduler db entry is released after run
+      Ensures that the scheduler db entry is released after run, and that execution metrics are stored on it
     """
+    maxReleaseWait = 60  # Max seconds between release retries
+
     def __init__(self, jobInstance, dbJob):
-        super(JobThread, self).__init__()
         self._jobInstance = jobInstance
         self._dbJobId = dbJob.id
 
     def run(self):
+        """
+        Executes the job and releases it
+        """
+        close_old_connections()
+        start = time.time()
         try:
             self._jobInstance.execute()
         except Exception:
             logger.warning("Exception executing job {0}".format(self._dbJobId))
         finally:
-            self.jobDone()
+            self.jobDone(time.time() - start)
 
-    def jobDone(self):
+    def jobDone(self, duration):
         """
         Invoked whenever a job is is finished (with or without exception)
+        Release is retried until done (waiting more between retries, up to maxReleaseWait seconds), as nobody else
+        releases a job owned by a running server
         """
-        done = False
-        while done is False:
+        wait = 1
+        while True:
             try:
-                self.__updateDb()
-                done = True
+                self.__updateDb(duration)
+                break
             except Exception:
                 # Databases locked, maybe because we are on a multitask environment, let's try again in a while
                 try:
                     connection.close()
                 except Exception as e:
                     logger.error('On job executor, closing db connection: {}'.format(e))
-                # logger.info('Database access failed... Retrying')
-                time.sleep(1)
+                if wait >= self.maxReleaseWait:
+                    logger.error('Could not release job {0} yet, retrying'.format(self._dbJobId))
+                time.sleep(wait)
+                wait = min(wait * 2, self.maxReleaseWait)
 
         # Ensures DB connection is released after job is done
         connection.close()
 
-    def __updateDb(self):
+    def __updateDb(self, duration):
         """
-        Atomically updates the scheduler db to "release" this job
+        Atomically updates the scheduler db to "release" this job, storing its execution metrics
         """
         with transaction.atomic():
             job = dbScheduler.objects.select_for_update().get(id=self._dbJobId)  # @UndefinedVariable
             job.state = State.FOR_EXECUTE
             job.owner_server = ''
             job.next_execution = getSqlDatetime() + timedelta(seconds=job.frecuency)
+            job.executions += 1
+            job.last_duration = duration
+            job.total_duration += duration
+            if duration > job.frecuency:
+                job.overruns += 1
             # Update state and last execution time at database
             job.save()
 
@@ -105,6 +122,9 @@ class JobThread(threading.Thread):
 class Scheduler(object):
     """
     Class responsible of maintain/execute scheduled jobs
+
+    Due jobs are claimed (as many as free workers) and executed on a pool of SCHEDULER_THREADS workers.
+    No more than "concurrency" executions of a job class are run at once on this server.
     """
     granularity = 2  # We check for cron jobs every THIS seconds
 
@@ -114,6 +134,11 @@ class Scheduler(object):
     def __init__(self):
         self._hostname = platform.node()
         self._keepRunning = True
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._pool = None
+        self._workers = 0
+        self._running = {}  # Job class -> executions of it running on this server
         logger.info('Initialized scheduler for host "{}"'.format(self._hostname))
 
     @staticmethod
@@ -130,37 +155,71 @@ class Scheduler(object):
         Invoked to signal that termination of scheduler task(s) is requested
         """
         self._keepRunning = False
+        self._wakeup.set()
 
-    def executeOneJob(self):
+    def __executeJob(self, jobRun, jobClass):
+        try:
+            jobRun.run()
+        finally:
+            with self._lock:
+                self._running[jobClass] -= 1
+            self._wakeup.set()  # A worker is free
+
+    def claimJobs(self, limit):
         """
-        Looks for the best waiting job and executes it
+        Claims (marks as running by this server) up to "limit" due jobs, skipping those whose class
+        has already reached its concurrency
+        Returns a list of (jobInstance, dbJob)
         """
-        jobInstance = None
-        try:
-            now = getSqlDatetime()  # Datetimes are based on database server times
-            fltr = Q(state=State.FOR_EXECUTE) & (Q(last_execution__gt=now) | Q(next_execution__lt=now))
-            with transaction.atomic():
-                # If next execution is before now or last execution is in the future (clock changed on this server, we take that task as executable)
-                # This params are all set inside fltr (look at __init__)
-                job = dbScheduler.objects.select_for_update().filter(fltr).order_by('next_execution')[0]  # @UndefinedVariable
+        now = getSqlDatetime()  # Datetimes are based on database server times
+        fltr = Q(state=State.FOR_EXECUTE) & (Q(last_execution__gt=now) | Q(next_execution__lt=now))
+        with self._lock:
+            running = dict(self._running)
+        saturated = [name for name, cls in JobsFactory.factory().jobs().items() if running.get(cls, 0) >= cls.concurrency]
+
+        res = []
+        with transaction.atomic():
+            # If next execution is before now or last execution is in the future (clock changed on this server, we take that task as executable)
+            # This params are all set inside fltr (look at __init__)
+            for job in dbScheduler.objects.select_for_update().filter(fltr).exclude(name__in=saturated).order_by('next_execution')[:limit]:  # @UndefinedVariable
+                jobInstance = job.getInstance()
+
+                if jobInstance is None:
+                    logger.error('Job instance can\'t be resolved for {0}, removing it'.format(job))
+                    job.delete()
+                    continue
+
+                jobClass = jobInstance.__class__
+                if running.get(jobClass, 0) >= jobClass.concurrency:
+                    continue  # Several scheduled jobs of same class
+                running[jobClass] = running.get(jobClass, 0) + 1
+
                 if job.last_execution > now:
                     logger.warning('EXecuted {} due to last_execution being in the future!'.format(job.name))
                 job.state = State.RUNNING
                 job.owner_server = self._hostname
                 job.last_execution = now
                 job.save()
+                res.append((jobInstance, job))
 
-            jobInstance = job.getInstance()
+        # Claimed jobs are accounted once they are really claimed (transaction commited)
+        with self._lock:
+            for jobInstance, _ in res:
+                self._running[jobInstance.__class__] = self._running.get(jobInstance.__class__, 0) + 1
+        return res
 
-            if jobInstance is None:
-                logger.error('Job instance can\'t be resolved for {0}, removing it'.format(job))
-                job.delete()
-                return
-            logger.debug('Executing job:>{0}<'.format(job.name))
-            JobThread(jobInstance, job).start()  # Do not instatiate thread, just run it
-        except IndexError:
-            # Do nothing, there is no jobs for execution
-            return
+    def executeJobs(self):
+        """
+        Claims as many due jobs as free workers, and send them to workers
+        Returns the number of seconds to wait until next check
+        """
+        with self._lock:
+            free = self._workers - sum(self._running.values())
+        if free <= 0:
+            return self.granularity  # Woken up as soon as a worker gets free
+
+        try:
+            jobs = self.claimJobs(free)
         except DatabaseError as e:
             # Whis will happen whenever a connection error or a deadlock error happens
             # This in fact means that we have to retry operation, and retry will happen on main loop
@@ -169,6 +228,12 @@ class Scheduler(object):
             # logger.debug('Deadlock, no problem at all :-) (sounds hards, but really, no problem, will retry later :-) )')
             raise DatabaseError('Database access problems. Retrying connection ({})'.format(e))
 
+        for jobInstance, job in jobs:
+            logger.debug('Executing job:>{0}<'.format(job.name))
+            self._pool.add_task(self.__executeJob, JobRun(jobInstance, job), jobInstance.__class__)
+
+        return self.granularity
+
     @staticmethod
     def releaseOwnShedules():
         """
@@ -177,22 +242,24 @@ class Scheduler(object):
         logger.debug('Releasing all owned scheduled tasks')
         with transaction.atomic():
             dbScheduler.objects.select_for_update().filter(owner_server=platform.node()).update(owner_server='')  # @UndefinedVariable
-            dbScheduler.objects.select_for_update().filter(last_execution__lt=getSqlDatetime() - timedelta(minutes=15), state=State.RUNNING).update(owner_server='', state=State.FOR_EXECUTE)  # @UndefinedVariable
+            dbScheduler.objects.select_for_update().filter(last_execution__lt=getSqlDatetime(strict=True) - timedelta(minutes=15), state=State.RUNNING).update(owner_server='', state=State.FOR_EXECUTE)  # @UndefinedVariable
             dbScheduler.objects.select_for_update().filter(owner_server='').update(state=State.FOR_EXECUTE)  # @UndefinedVariable
 
     def run(self):
         """
-        Loop that executes scheduled tasks
-        Can be executed more than once, in differents threads
+        Loop that claims scheduled jobs and sends them to the workers pool
         """
         # We ensure that the jobs are also in database so we can
         logger.debug('Run Scheduler thread')
         JobsFactory.factory().ensureJobsInDatabase()
+        self._workers = max(GlobalConfig.SCHEDULER_THREADS.getInt(), 1)
+        self._pool = ThreadPool(self._workers, self._workers)
         logger.debug("At loop")
         while self._keepRunning:
+            wait = self.granularity
+            self._wakeup.clear()
             try:
-                time.sleep(self.granularity)
-                self.executeOneJob()
+                wait = self.executeJobs()
             except Exception as e:
                 # This can happen often on sqlite, and this is not problem at all as we recover it.
                 # The log is removed so we do not get increased workers.log file size with no information at all
@@ -202,5 +269,8 @@ class Scheduler(object):
                     connection.close()
                 except Exception:
                     logger.exception('Exception clossing connection at delayed task')
+            if wait > 0:
+                self._wakeup.wait(wait)
         logger.info('Exiting Scheduler because stop has been requested')
+        self._pool.wait_completion()
         self.releaseOwnShedules()
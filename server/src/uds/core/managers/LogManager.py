@@ -39,10 +39,15 @@ from uds.models import (
     MetaPool
 )
 
+from django.db import transaction, OperationalError, InterfaceError
+
 from uds.core.util import log
+from uds.core.util.BufferedWriter import BufferedWriter
 
 from uds.core.util.Config import GlobalConfig
 
+import collections
+import threading
 import logging
 
 logger = logging.getLogger(__name__)
@@ -66,11 +71,23 @@ transDict = {
 class LogManager(object):
     """
     Manager for logging (at database) events
+
+    Log entries are queued in memory (a ring buffer, so if database can't keep up the oldest entries are dropped)
+    and written in batches by a background flusher thread, that also trims the logs of the owners it has written to.
+    Duplicates are avoided against the last messages logged by this process.
     """
     _manager = None
 
+    QUEUE_SIZE = 10000  # Max entries pending to be written
+    BATCH_SIZE = 500  # Entries written at once
+    FLUSH_INTERVAL = 1  # Seconds between flushes
+    TAIL_SIZE = 10000  # Last messages (by owner, level & source) kept for avoiding duplicates
+
     def __init__(self):
-        pass
+        self._lock = threading.Lock()
+        self._tail = collections.OrderedDict()
+        self._writer = BufferedWriter('Log', self.__write, LogManager.QUEUE_SIZE, LogManager.BATCH_SIZE, LogManager.FLUSH_INTERVAL)
+        self.duplicates = 0
 
     @staticmethod
     def manager():
@@ -80,35 +97,80 @@ class LogManager(object):
 
     def __log(self, owner_type, owner_id, level, message, source, avoidDuplicates):
         """
-        Logs a message associated to owner
+        Queues a message associated to owner
         """
         from uds.models import getSqlDatetime
-        from uds.models import Log
+
+        if owner_id is None:  # Some objects will not get logged, such as System administrator objects
+            return
 
         # Ensure message fits on space
         message = message[:255]
 
+        with self._lock:
+            key = (owner_type, owner_id, level, source)
+            if avoidDuplicates is True and self._tail.get(key) == message:
+                # Do not log again, already logged
+                self.duplicates += 1
+                return
+            self._tail[key] = message
+            self._tail.move_to_end(key)
+            if len(self._tail) > LogManager.TAIL_SIZE:
+                self._tail.popitem(last=False)
+
+        self._writer.put((owner_type, owner_id, getSqlDatetime(), source, level, message))
+
+    def __trim(self, owner_type, owner_id, maxLogs):
+        """
+        Removes the logs of an owner over maxLogs (oldest ones), with a single delete
+        """
+        from uds.models import Log
+
         qs = Log.objects.filter(owner_id=owner_id, owner_type=owner_type)
-        # First, ensure we do not have more than requested logs, and we can put one more log item
-        if qs.count() >= GlobalConfig.MAX_LOGS_PER_ELEMENT.getInt():
-            for i in qs.order_by('-created',)[GlobalConfig.MAX_LOGS_PER_ELEMENT.getInt() - 1:]:
-                i.delete()
-
-        if avoidDuplicates is True:
-            try:
-                lg = Log.objects.filter(owner_id=owner_id, owner_type=owner_type, level=level, source=source).order_by('-created', '-id')[0]
-                if lg.message == message:
-                    # Do not log again, already logged
-                    return
-            except Exception:  # Do not exists log
-                pass
-
-        # now, we add new log
+        limit = qs.order_by('-id').values_list('id', flat=True)[maxLogs:maxLogs + 1]
+        if limit:
+            qs.filter(id__lte=limit[0]).delete()
+
+    def __write(self, batch):
+        """
+        Writes to database a batch of queued log entries, and trims the logs of the affected owners
+        """
+        from uds.models import Log
+
+        entries = [
+            Log(owner_type=owner_type, owner_id=owner_id, created=created, source=source, level=level, data=message)
+            for owner_type, owner_id, created, source, level, message in batch
+        ]
+        try:
+            with transaction.atomic():
+                Log.objects.bulk_create(entries)
+            written = len(entries)
+        except (OperationalError, InterfaceError):
+            raise  # Database connection lost, batch will be retried
+        except Exception:
+            # Some objects will not get logged, store what we can
+            written = 0
+            for entry in entries:
+                try:
+                    entry.save()
+                    written += 1
+                except Exception:
+                    pass
+
         try:
-            Log.objects.create(owner_type=owner_type, owner_id=owner_id, created=getSqlDatetime(), source=source, level=level, data=message)
-        except:
-            # Some objects will not get logged, such as System administrator objects
-            pass
+            maxLogs = GlobalConfig.MAX_LOGS_PER_ELEMENT.getInt()
+            for owner_type, owner_id in set((e[0], e[1]) for e in batch):
+                self.__trim(owner_type, owner_id, maxLogs)
+        except Exception as e:
+            logger.error('Exception trimming logs: %s', e)
+
+        return written
+
+    def flush(self):
+        """
+        Writes to database the queued log entries
+        """
+        self._writer.flush()
 
     def __getLogs(self, owner_type, owner_id, limit):
         """
@@ -116,6 +178,8 @@ class LogManager(object):
         """
         from uds.models import Log
 
+        self.flush()  # So pending entries are also returned
+
         qs = Log.objects.filter(owner_id=owner_id, owner_type=owner_type)
         return [{'date': x.created, 'level': x.level, 'source': x.source, 'message': x.data} for x in reversed(qs.order_by('-created', '-id')[:limit])]
 
@@ -125,7 +189,14 @@ class LogManager(object):
         """
         from uds.models import Log
 
-        Log.objects.filter(owner_id=owner_id, owner_type=owner_type).delete()
+        # Holding flush lock, so entries being written right now are not written after deletion
+        with self._writer.flushLock:
+            self._writer.discard(lambda e: e[0] == owner_type and e[1] == owner_id)
+            with self._lock:
+                for key in [k for k in self._tail if k[0] == owner_type and k[1] == owner_id]:
+                    del self._tail[key]
+
+            Log.objects.filter(owner_id=owner_id, owner_type=owner_type).delete()
 
     def doLog(self, wichObject, level, message, source, avoidDuplicates=True):
         """
@@ -33,8 +33,15 @@ from __future__ import unicode_literals
 
 from uds.core.util.Config import GlobalConfig
 from uds.models import StatsCounters
+from uds.models import StatsCountersAccum
 from uds.models import getSqlDatetime
 from uds.models import StatsEvents
+
+from uds.core.util.BufferedWriter import BufferedWriter
+
+from django.db import transaction, OperationalError, InterfaceError
+
+import collections
 import datetime
 import time
 import six
@@ -51,11 +58,18 @@ class StatsManager(object):
     Right now, we are going to provide an interface to "counter stats", that is, statistics
     that has counters (such as how many users is at a time active at platform, how many services
     are assigned, are in use, in cache, etc...
+
+    Counters and events are not written at once, but queued on a bounded buffer (if it gets full, oldest ones are dropped)
+    and bulk inserted by a background flusher thread when BATCH_SIZE elements are queued or every FLUSH_INTERVAL seconds.
     """
     _manager = None
 
+    QUEUE_SIZE = 20000  # Max stats pending to be written
+    BATCH_SIZE = 1000  # Stats written at once
+    FLUSH_INTERVAL = 2  # Seconds between flushes
+
     def __init__(self):
-        pass
+        self._writer = BufferedWriter('Stats', self.__write, StatsManager.QUEUE_SIZE, StatsManager.BATCH_SIZE, StatsManager.FLUSH_INTERVAL)
 
     @staticmethod
     def manager():
@@ -63,6 +77,32 @@ class StatsManager(object):
             StatsManager._manager = StatsManager()
         return StatsManager._manager
 
+    def __write(self, batch):
+        """
+        Writes to database a batch of queued counters and events
+        """
+        byModel = collections.defaultdict(list)
+        for stat in batch:
+            byModel[type(stat)].append(stat)
+
+        try:
+            with transaction.atomic():  # So a batch is retried (on connection errors) as a whole
+                for model, stats in byModel.items():
+                    model.objects.bulk_create(stats)
+        except (OperationalError, InterfaceError):
+            raise  # Database connection lost, batch will be retried
+        except Exception:
+            logger.exception('Exception handling stats saving (maybe database is full?)')
+            return 0
+
+        return len(batch)
+
+    def flush(self):
+        """
+        Writes to database the queued counters and events
+        """
+        self._writer.flush()
+
     def __doCleanup(self, model):
         minTime = time.mktime((getSqlDatetime() - datetime.timedelta(days=GlobalConfig.STATS_DURATION.getInt())).timetuple())
 
@@ -72,7 +112,7 @@ class StatsManager(object):
     # Counter stats
     def addCounter(self, owner_type, owner_id, counterType, counterValue, stamp=None):
         """
-        Adds a new counter stats to database.
+        Adds a new counter stats to database (queued, written by the stats flusher).
 
         Args:
 
@@ -93,12 +133,8 @@ class StatsManager(object):
         # To Unix epoch
         stamp = int(time.mktime(stamp.timetuple()))  # pylint: disable=maybe-no-member
 
-        try:
-            StatsCounters.objects.create(owner_type=owner_type, owner_id=owner_id, counter_type=counterType, value=counterValue, stamp=stamp)
-            return True
-        except Exception:
-            logger.error('Exception handling counter stats saving (maybe database is full?)')
-        return False
+        self._writer.put(StatsCounters(owner_type=owner_type, owner_id=owner_id, counter_type=counterType, value=counterValue, stamp=stamp))
+        return True
 
     def getCounters(self, ownerType, counterType, ownerIds, since, to, limit, use_max=False):
         """
@@ -116,17 +152,39 @@ class StatsManager(object):
 
             Iterator, containing (date, counter) each element
         """
+        self.flush()  # So pending counters are also returned
+
         # To Unix epoch
         since = int(time.mktime(since.timetuple()))
         to = int(time.mktime(to.timetuple()))
 
+        # Use the coarsest rollup whose intervals are not bigger than the requested points intervals
+        # Counters after the last complete rollup interval are obtained from counters table
+        for intervalType in (StatsCountersAccum.DAY, StatsCountersAccum.HOUR) if limit else ():
+            first = StatsCountersAccum.firstStamp(intervalType)
+            last = StatsCountersAccum.lastStamp(intervalType)
+            if first is None or last <= since:
+                continue
+            since = max(since, first)
+            # Rounded up (and a point less, as since is not aligned to intervals), so no more than limit points are returned
+            interval = -(-(to - since) // max(limit - 1, 1))
+            if interval < intervalType:
+                continue
+            interval += -interval % intervalType
+            last -= last % interval  # So points from rollups and from counters do not share intervals
+            result = StatsCountersAccum.get_grouped(ownerType, counterType, intervalType, owner_id=ownerIds, since=since, to=min(to, last - 1), interval=interval, use_max=use_max)
+            if to >= last:
+                result.extend(StatsCounters.get_grouped(ownerType, counterType, owner_id=ownerIds, since=last, to=to, interval=interval, use_max=use_max))
+            return result
+
         return StatsCounters.get_grouped(ownerType, counterType, owner_id=ownerIds, since=since, to=to, limit=limit, use_max=use_max)
 
     def cleanupCounters(self):
         """
-        Removes all counters previous to configured max keep time for stat information from database.
+        Removes all counters (and its rollups) previous to configured max keep time for stat information from database.
         """
         self.__doCleanup(StatsCounters)
+        self.__doCleanup(StatsCountersAccum)
 
     def getEventFldFor(self, fld):
         return {
@@ -142,7 +200,7 @@ class StatsManager(object):
     # Event stats
     def addEvent(self, owner_type, owner_id, eventType, **kwargs):
         """
-        Adds a new event stat to database.
+        Adds a new event stat to database (queued, written by the stats flusher).
 
         stamp=None, fld1=None, fld2=None, fld3=None
         Args:
@@ -176,10 +234,10 @@ class StatsManager(object):
             fld3 = noneToEmpty(kwargs.get('fld3', kwargs.get('dstip', kwargs.get('version', ''))))
             fld4 = noneToEmpty(kwargs.get('fld4', kwargs.get('uniqueid', '')))
 
-            StatsEvents.objects.create(owner_type=owner_type, owner_id=owner_id, event_type=eventType, stamp=stamp, fld1=fld1, fld2=fld2, fld3=fld3, fld4=fld4)
+            self._writer.put(StatsEvents(owner_type=owner_type, owner_id=owner_id, event_type=eventType, stamp=stamp, fld1=fld1, fld2=fld2, fld3=fld3, fld4=fld4))
             return True
         except Exception:
-            logger.exception('Exception handling event stats saving (maybe database is full?)')
+            logger.exception('Exception handling event stats (invalid values?)')
         return False
 
     def getEvents(self, ownerType, eventType, **kwargs):
@@ -197,6 +255,7 @@ class StatsManager(object):
 
             Iterator, containing (date, counter) each element
         """
+        self.flush()  # So pending events are also returned
         return StatsEvents.get_stats(ownerType, eventType, **kwargs)
 
     def cleanupEvents(self):
@@ -108,17 +108,15 @@ class TaskManager(object):
         logger.info('Starting {0} schedulers and {1} task executors'.format(noSchedulers, noDelayedTasks))
 
         threads = []
-        for _ in range(noSchedulers):
-            thread = SchedulerThread()
-            thread.start()
-            threads.append(thread)
-            time.sleep(0.5)
-
-        for _ in range(noDelayedTasks):
-            thread = DelayedTaskThread()
-            thread.start()
-            threads.append(thread)
-            time.sleep(0.5)
+        # Scheduler uses its own pool of SCHEDULER_THREADS workers
+        thread = SchedulerThread()
+        thread.start()
+        threads.append(thread)
+
+        # Delayed task runner uses its own pool of DELAYED_TASKS_THREADS workers
+        thread = DelayedTaskThread()
+        thread.start()
+        threads.append(thread)
 
         signal.signal(signal.SIGTERM, TaskManager.sigTerm)
 
@@ -134,4 +132,10 @@ class TaskManager(object):
         for thread in threads:
             thread.notifyTermination()
 
-        # The join of threads will happen before termination, so its fine to just return here
+        for thread in threads:
+            thread.join()
+
+        # Buffered stats & logs generated by jobs and tasks are written before exiting
+        from uds.core.managers import statsManager, logManager
+        statsManager().shutdown()
+        logManager().shutdown()
@@ -33,7 +33,7 @@
 from __future__ import unicode_literals
 
 from django.utils.translation import ugettext as _
-from django.db.models import Q
+from django.db.models import Q, Count
 from django.db import transaction
 from uds.core.services.Exceptions import OperationException
 from uds.core.util.State import State
@@ -52,6 +52,7 @@ from uds.core.services import Service
 from uds.core.util.stats import events
 
 from .userservice.opchecker  import UserServiceOpChecker
+from .userservice.governor import ProviderGovernor
 
 import requests
 import json
@@ -343,32 +344,54 @@ class UserServiceManager(object):
         events.addEvent(ds, events.ET_CACHE_MISS, fld1=0)
         return self.createAssignedFor(ds, user)
 
+    @staticmethod
+    def getCountersByPool(servicePoolsIds=None, states=None):
+        """
+        Returns, using a single grouped query, the number of user services of each service pool
+        by cache level and state, as a dictionary {servicePoolId: {(cacheLevel, state): count}}
+
+        Args:
+            servicePoolsIds: If not None, only this service pools are counted
+            states: States to count. Defaults to valid states (preparing & usable)
+        """
+        qs = UserService.objects.filter(state__in=states or State.VALID_STATES)
+        if servicePoolsIds is not None:
+            qs = qs.filter(deployed_service_id__in=servicePoolsIds)
+        res = {}
+        for v in qs.values('deployed_service_id', 'cache_level', 'state').annotate(how_many=Count('id')).order_by():
+            res.setdefault(v['deployed_service_id'], {})[(v['cache_level'], v['state'])] = v['how_many']
+        return res
+
+    @staticmethod
+    def getCountersByProvider(state):
+        """
+        Returns, using a single grouped query, the number of user services in "state" of each provider,
+        as a dictionary {providerId: count}
+        """
+        return dict(
+            UserService.objects.filter(state=state).values_list('deployed_service__service__provider_id').annotate(how_many=Count('id')).order_by()
+        )
+
     def getServicesInStateForProvider(self, provider_id, state):
         """
         Returns the number of services of a service provider in the state indicated
+        PREPARING and REMOVING counters are kept by the provider governor, so no database count is needed
         """
+        if state in ProviderGovernor.STATES:
+            return ProviderGovernor.governor().count(provider_id, state)
         return UserService.objects.filter(deployed_service__service__provider__id=provider_id, state=state).count()
 
     def canRemoveServiceFromDeployedService(self, ds):
         """
         checks if we can do a "remove" from a deployed service
-        serviceIsntance is just a helper, so if we already have unserialized deployedService
         """
-        removing = self.getServicesInStateForProvider(ds.service.provider_id, State.REMOVING)
-        serviceInstance = ds.service.getInstance()
-        if removing >= serviceInstance.parent().getMaxRemovingServices() and serviceInstance.parent().getIgnoreLimits() is False:
-            return False
-        return True
+        return ProviderGovernor.governor().canRemove(ds)
 
     def canInitiateServiceFromDeployedService(self, ds):
         """
         Checks if we can start a new service
         """
-        preparing = self.getServicesInStateForProvider(ds.service.provider_id, State.PREPARING)
-        serviceInstance = ds.service.getInstance()
-        if preparing >= serviceInstance.parent().getMaxPreparingServices() and serviceInstance.parent().getIgnoreLimits() is False:
-            return False
-        return True
+        return ProviderGovernor.governor().canStart(ds)
 
     def isReady(self, uService):
         UserService.objects.update()
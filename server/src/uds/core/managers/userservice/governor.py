@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (c) 2012 Virtual Cable S.L.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright notice,
+#      this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#    * Neither the name of Virtual Cable S.L. nor the names of its contributors
+#      may be used to endorse or promote products derived from this software
+#      without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+'''
+@author: Adolfo Gómez, dkmaster at dkmon dot com
+'''
+from __future__ import unicode_literals
+
+from django.db.models import signals
+
+from uds.core.util.State import State
+from uds.models import UserService, ServicePool
+
+import threading
+import time
+import logging
+
+__updated__ = '2019-05-10'
+
+logger = logging.getLogger(__name__)
+
+
+class ProviderGovernor(object):
+    """
+    Keeps, per service provider, the number of user services in PREPARING and REMOVING states, so
+    limits (maxPreparingServices & maxRemovingServices) can be checked without counting them at database.
+
+    Counters are loaded from database using a single grouped query every SYNC_INTERVAL seconds (so transitions done
+    by other servers are also taken into account), and between syncs they are updated on every user service state
+    transition done by this process (slots are acquired when entering one of this states and released when leaving them).
+    """
+    SYNC_INTERVAL = 15
+    STATES = (State.PREPARING, State.REMOVING)
+
+    _governor = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}  # (providerId, state) -> number of user services
+        self._limits = {}  # providerId -> (maxPreparing, maxRemoving, ignoreLimits)
+        self._providers = {}  # servicePoolId -> providerId
+        self._nextSync = 0
+
+    @staticmethod
+    def governor():
+        if ProviderGovernor._governor is None:
+            ProviderGovernor._governor = ProviderGovernor()
+        return ProviderGovernor._governor
+
+    def sync(self, force=False):
+        """
+        Reloads counters (and discards cached limits) from database if SYNC_INTERVAL has elapsed since last sync
+        """
+        if force is False and time.monotonic() < self._nextSync:
+            return
+        from uds.core.managers.UserServiceManager import UserServiceManager
+
+        counters = {}
+        for state in ProviderGovernor.STATES:
+            for providerId, count in UserServiceManager.getCountersByProvider(state).items():
+                counters[(providerId, state)] = count
+        with self._lock:
+            self._counters = counters
+            self._limits = {}
+            self._nextSync = time.monotonic() + ProviderGovernor.SYNC_INTERVAL
+
+    def count(self, providerId, state):
+        self.sync()
+        return self._counters.get((providerId, state), 0)
+
+    def providerFor(self, servicePoolId):
+        """
+        Returns the provider id of a service pool (cached, the service of a service pool can't be changed)
+        """
+        providerId = self._providers.get(servicePoolId)
+        if providerId is None:
+            providerId = self._providers[servicePoolId] = ServicePool.objects.filter(id=servicePoolId).values_list('service__provider_id', flat=True).first()
+        return providerId
+
+    def limits(self, servicePool):
+        """
+        Returns (maxPreparing, maxRemoving, ignoreLimits) for the provider of this service pool
+        """
+        self.sync()
+        providerId = servicePool.service.provider_id
+        limits = self._limits.get(providerId)
+        if limits is None:
+            provider = servicePool.service.getInstance().parent()
+            limits = self._limits[providerId] = (provider.getMaxPreparingServices(), provider.getMaxRemovingServices(), provider.getIgnoreLimits())
+        return limits
+
+    def available(self, servicePool, state):
+        """
+        Returns the number of free slots of "state" (PREPARING or REMOVING) on the provider of this service pool,
+        or None if the provider ignores limits
+        """
+        maxPreparing, maxRemoving, ignoreLimits = self.limits(servicePool)
+        if ignoreLimits:
+            return None
+        return (maxPreparing if state == State.PREPARING else maxRemoving) - self.count(servicePool.service.provider_id, state)
+
+    def canStart(self, servicePool):
+        available = self.available(servicePool, State.PREPARING)
+        return available is None or available > 0
+
+    def canRemove(self, servicePool):
+        available = self.available(servicePool, State.REMOVING)
+        return available is None or available > 0
+
+    def transition(self, servicePoolId, oldState, newState):
+        """
+        Updates counters of the provider of the service pool, releasing the slot of oldState and acquiring one of newState
+        """
+        if oldState == newState or (oldState not in ProviderGovernor.STATES and newState not in ProviderGovernor.STATES):
+            return
+        providerId = self.providerFor(servicePoolId)
+        with self._lock:
+            if oldState in ProviderGovernor.STATES:
+                key = (providerId, oldState)
+                self._counters[key] = max(self._counters.get(key, 0) - 1, 0)
+            if newState in ProviderGovernor.STATES:
+                key = (providerId, newState)
+                self._counters[key] = self._counters.get(key, 0) + 1
+
+    # Signals
+    @staticmethod
+    def _postInit(sender, instance, **kwargs):
+        # Use __dict__ so deferred state is not loaded
+        instance._governorState = instance.__dict__.get('state')
+
+    @staticmethod
+    def _postSave(sender, instance, created, **kwargs):
+        oldState = None if created else getattr(instance, '_governorState', None)
+        newState = instance.__dict__.get('state')
+        instance._governorState = newState
+        if instance.deployed_service_id is not None:
+            ProviderGovernor.governor().transition(instance.deployed_service_id, oldState, newState)
+
+    @staticmethod
+    def _postDelete(sender, instance, **kwargs):
+        if instance.deployed_service_id is not None:
+            ProviderGovernor.governor().transition(instance.deployed_service_id, getattr(instance, '_governorState', None), None)
+
+
+signals.post_init.connect(ProviderGovernor._postInit, sender=UserService)
+signals.post_save.connect(ProviderGovernor._postSave, sender=UserService)
+signals.post_delete.connect(ProviderGovernor._postDelete, sender=UserService)
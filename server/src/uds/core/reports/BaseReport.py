@@ -42,6 +42,7 @@ from . import stock
 from weasyprint import HTML, CSS, default_url_fetcher
 from datetime import datetime
 
+import csv
 import logging
 import six
 
@@ -50,6 +51,14 @@ logger = logging.getLogger(__name__)
 __updated__ = '2018-02-08'
 
 
+class _Echo(object):
+    """
+    File-like object that returns what it is written, so a csv.writer returns the formated rows
+    """
+    def write(self, value):
+        return value
+
+
 class Report(UserInterface):
     mime_type = 'application/pdf'  # Report returns pdfs by default, but could be anything else
     name = _('Base Report')  # Report name
@@ -58,6 +67,8 @@ class Report(UserInterface):
     group = ''  # So we can "group" reports by kind?
     encoded = True  # If the report is mean to be encoded (binary reports as PDFs == True, text reports must be False so utf-8 is correctly threated
     uuid = None
+    chunkSize = 64 * 1024  # Approximate size of the chunks of streamed tabular reports
+    progressCallback = None  # If set, invoked with report generation progress (0-100), see progress method
 
     @classmethod
     def translated_name(cls):
@@ -176,12 +187,50 @@ class Report(UserInterface):
         """
         raise NotImplementedError()
 
+    def progress(self, value):
+        """
+        Reports can invoke this to notify generation progress (percentage) to background report jobs
+        """
+        if self.progressCallback is not None:
+            self.progressCallback(int(value))
+
+    def generateRows(self):
+        """
+        Tabular (CSV) reports can implement this as a generator of rows (lists of values, first one being the header)
+        instead of generate, so they are produced (and can be sent) in chunks, using constant memory.
+
+        Returns None for non tabular reports
+        """
+        return None
+
+    def generateStream(self):
+        """
+        Generator of the report contents, in chunks.
+        Tabular reports are produced as they are generated (see generateRows), any other report at once (see generate)
+        """
+        rows = self.generateRows()
+        if rows is None:
+            yield self.generate()
+            return
+
+        writer = csv.writer(_Echo())
+        chunk, size = [], 0
+        for row in rows:
+            line = writer.writerow(row)
+            chunk.append(line)
+            size += len(line)
+            if size >= self.chunkSize:
+                yield ''.join(chunk)
+                chunk, size = [], 0
+        if chunk:
+            yield ''.join(chunk)
+
     def generateEncoded(self):
         """
         Generated base 64 encoded report.
-        Basically calls generate and encodes resuslt as base64
+        Basically calls generate (or generateRows) and encodes resuslt as base64
         """
-        data = self.generate()
+        data = self.generate() if self.generateRows() is None else ''.join(self.generateStream())
         if self.encoded:
             data = encoders.encode(data, 'base64', asText=True).replace('\n', '')
 
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (c) 2015 Virtual Cable S.L.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright notice,
+#      this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#    * Neither the name of Virtual Cable S.L. nor the names of its contributors
+#      may be used to endorse or promote products derived from this software
+#      without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+.. moduleauthor:: Adolfo Gómez, dkmaster at dkmon dot com
+"""
+from __future__ import unicode_literals
+
+from uds.core.jobs.DelayedTask import DelayedTask
+from uds.core.util.Cache import Cache
+from uds.core.util import encoders
+from uds.models import DBFile, getSqlDatetime
+
+from django.db import connection
+
+import threading
+import datetime
+import hashlib
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Report jobs states
+QUEUED, RUNNING, DONE, ERROR = 'queued', 'running', 'done', 'error'
+
+# Time that generated reports are kept (and served again for same report and parameters)
+RESULT_VALIDITY = 3600
+# Running jobs refresh its status every HEARTBEAT seconds. If a queued or running job status is not updated in
+# STALE_TIME seconds (and it is not waiting to be executed), its generation was lost
+HEARTBEAT = 30
+STALE_TIME = 120
+
+OWNER = 'reports'
+TAG_PREFIX = 'report-'
+
+cache = Cache('ReportJobs')
+
+
+def findReport(uuid, values=None):
+    """
+    Returns an instance of the report with the uuid, or None if not found
+    """
+    from uds import reports
+
+    for i in reports.availableReports:
+        if i.getUuid() == uuid:
+            return i(values)
+    return None
+
+
+def jobKey(report):
+    """
+    Key of a report run, that depends on the report and the values of its parameters
+    """
+    values = json.dumps(report.valuesDict(), sort_keys=True)
+    return hashlib.sha1('{}:{}'.format(report.getUuid(), values).encode('utf8')).hexdigest()
+
+
+def status(jobId):
+    """
+    Returns the status of a report job (dictionary with, at least, 'id', 'state' and 'progress'), or None if unknown (or expired)
+    Jobs whose generation was lost (i.e. the server running it was stopped) are marked as failed
+    """
+    from uds.core.jobs.DelayedTaskRunner import DelayedTaskRunner
+
+    current = cache.get(jobId)
+    if current is not None and current['state'] in (QUEUED, RUNNING) and current.get('updated', 0) < getSqlDatetime(True) - STALE_TIME:
+        if current['state'] == RUNNING or not DelayedTaskRunner.runner().checkExists(TAG_PREFIX + jobId):
+            current = setStatus(jobId, ERROR, error='Report generation was interrupted', **dict((k, current[k]) for k in ('mime_type', 'encoded', 'filename') if k in current))
+    return current
+
+
+def setStatus(jobId, state, progress=0, **kwargs):
+    data = dict(kwargs, id=jobId, state=state, progress=progress, updated=getSqlDatetime(True))
+    cache.put(jobId, data, RESULT_VALIDITY)
+    return data
+
+
+def submit(report):
+    """
+    Queues the generation of a report (if it is not already generated or being generated with same parameters)
+    Returns its status
+    """
+    id_ = jobKey(report)
+    current = status(id_)
+    if current is not None and current['state'] in (QUEUED, RUNNING, DONE):
+        return current
+
+    current = setStatus(id_, QUEUED, mime_type=report.mime_type, encoded=report.encoded, filename=report.filename)
+    ReportJob(report.getUuid(), report.valuesDict(), id_).register(0, TAG_PREFIX + id_, True)
+    return current
+
+
+def result(jobId):
+    """
+    Returns the generated report, in same format that synchronous report generation (dictionary with mime_type,
+    encoded, filename and data), or None if the report is not (or is no more) available.
+    If the stored report can't be read, the job is marked as failed and its (error) status is returned
+    """
+    current = status(jobId)
+    if current is None or current['state'] != DONE:
+        return None
+    try:
+        data = DBFile.objects.get(name=TAG_PREFIX + jobId).data
+    except DBFile.DoesNotExist:
+        return None
+
+    if not isinstance(data, bytes):  # Could not be decoded (and DBFile has been removed)
+        return setStatus(jobId, ERROR, error='Generated report is corrupt')
+
+    return {
+        'mime_type': current['mime_type'],
+        'encoded': current['encoded'],
+        'filename': current['filename'],
+        'data': encoders.encode(data, 'base64', asText=True).replace('\n', '') if current['encoded'] else data.decode('utf8')
+    }
+
+
+class ReportJob(DelayedTask):
+    """
+    Generates a report on background, storing the result as a DBFile
+    """
+
+    def __init__(self, reportUuid, values, jobId):
+        super(ReportJob, self).__init__()
+        self._reportUuid = reportUuid
+        self._values = values
+        self._jobId = jobId
+
+    def run(self):
+        report = findReport(self._reportUuid, self._values)
+        if report is None:
+            setStatus(self._jobId, ERROR, error='Report not found')
+            return
+
+        info = {'mime_type': report.mime_type, 'encoded': report.encoded, 'filename': report.filename}
+        progress = [0]
+        stop = threading.Event()
+
+        def setProgress(value):
+            progress[0] = value
+            setStatus(self._jobId, RUNNING, value, **info)
+
+        def heartbeat():
+            try:
+                while not stop.wait(HEARTBEAT):
+                    setStatus(self._jobId, RUNNING, progress[0], **info)
+            finally:
+                connection.close()  # Executed on its own thread
+
+        setProgress(0)
+        report.progressCallback = setProgress
+        beat = threading.Thread(target=heartbeat, name='ReportHeartbeat')
+        beat.daemon = True
+        beat.start()
+
+        try:
+            data = report.generate() if report.generateRows() is None else ''.join(report.generateStream())
+            if not isinstance(data, bytes):
+                data = data.encode('utf8')
+
+            now = getSqlDatetime()
+            name = TAG_PREFIX + self._jobId
+            dbFile = DBFile.objects.filter(name=name).first() or DBFile(owner=OWNER, name=name, created=now)
+            dbFile.data = data
+            dbFile.modified = now
+            dbFile.save()
+            final = {'state': DONE, 'progress': 100}
+        except Exception as e:
+            logger.exception('Generating report %s', report)
+            final = {'state': ERROR, 'error': str(e)}
+        finally:
+            stop.set()
+            beat.join()  # So a heartbeat is not stored after final status
+
+        setStatus(self._jobId, **dict(final, **info))
+
+        # Removes expired results
+        DBFile.objects.filter(owner=OWNER, modified__lt=getSqlDatetime() - datetime.timedelta(seconds=RESULT_VALIDITY)).delete()
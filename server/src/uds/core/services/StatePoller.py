@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (c) 2019 Virtual Cable S.L.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright notice,
+#      this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#    * Neither the name of Virtual Cable S.L. nor the names of its contributors
+#      may be used to endorse or promote products derived from this software
+#      without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+.. moduleauthor:: Adolfo Gómez, dkmaster at dkmon dot com
+"""
+from __future__ import unicode_literals
+
+import threading
+import time
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class StatePoller(object):
+    """
+    Gets states of machines of a provider (or service) in bulk.
+
+    While a lot of user services are being deployed, every one checks its machine state on its own, one request each.
+    Instead, a poller remembers the machines whose state has been requested recently ("in flight" machines),
+    and gets the states of all of them with a single request, keeping the result as a short lived snapshot that is used
+    to answer next state requests.
+
+    Modules get the poller for its provider (using its environment key) and use getState instead of requesting
+    the state directly. Operations that changes the state of a machine (start, stop, ...) must invalidate it.
+    """
+    SNAPSHOT_TIME = 3  # Seconds a snapshot of states is valid
+    INFLIGHT_TIME = 60  # Machines whose state has been requested on last INFLIGHT_TIME seconds are polled together
+
+    _pollers = {}
+    _pollersLock = threading.Lock()
+
+    # Counters, for performance checking
+    requests = 0
+    fetches = 0
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._fetchLock = threading.Lock()
+        self._inflight = {}  # machine id -> last time its state was requested
+        self._states = {}
+        self._stamp = 0
+        self._invalidated = set()  # Machines invalidated while fetching states
+        self._pid = os.getpid()
+
+    @staticmethod
+    def poller(key):
+        """
+        Returns the poller for key (the environment key of the provider or service whose machines are polled)
+        """
+        with StatePoller._pollersLock:
+            poller = StatePoller._pollers.get(key)
+            if poller is None or poller._pid != os.getpid():
+                poller = StatePoller._pollers[key] = StatePoller()
+            return poller
+
+    def __cached(self, machineId, now):
+        if now - self._stamp < StatePoller.SNAPSHOT_TIME and machineId in self._states:
+            return True, self._states[machineId]
+        return False, None
+
+    def getState(self, machineId, fetchStates, fetchState=None):
+        """
+        Returns the state of machineId.
+
+        Args:
+            machineId: Id of the machine
+            fetchStates: Callable that gets the states of a list of machines ids, returning a dictionary id -> state
+            fetchState: Callable that gets the state of a single machine, used if machine is not on fetchStates result
+                        (so errors for unknown machines are the same than without poller)
+        """
+        StatePoller.requests += 1
+        now = time.time()
+        with self._lock:
+            self._inflight[machineId] = now
+            found, state = self.__cached(machineId, now)
+        if found:
+            return state
+
+        # Only one fetch at a time. If another thread has just fetched our machine state, use it
+        with self._fetchLock:
+            with self._lock:
+                found, state = self.__cached(machineId, time.time())
+                if not found:
+                    self._inflight = {k: v for k, v in self._inflight.items() if now - v < StatePoller.INFLIGHT_TIME}
+                    machinesIds = list(self._inflight)
+                    self._invalidated.clear()
+            if found:
+                return state
+
+            StatePoller.fetches += 1
+            states = fetchStates(machinesIds)
+            logger.debug('Polled states of %s machines', len(machinesIds))
+            with self._lock:
+                self._states = {k: v for k, v in states.items() if k not in self._invalidated}
+                self._stamp = time.time()
+
+        if machineId not in states and fetchState is not None:
+            return fetchState(machineId)
+        return states.get(machineId)
+
+    def invalidate(self, machineId, forget=False):
+        """
+        Removes the state of machineId from current snapshot (because it is changing)
+        If forget is True, machine is also removed from "in flight" machines (because it is being removed)
+        """
+        with self._lock:
+            self._states.pop(machineId, None)
+            self._invalidated.add(machineId)
+            if forget:
+                self._inflight.pop(machineId, None)
@@ -38,6 +38,7 @@ from .BaseServiceProvider import ServiceProvider
 from .BaseService import Service
 from .BasePublication import Publication
 from .BaseDeployed import UserDeployment
+from .StatePoller import StatePoller
 
 from . import types
 
@@ -32,6 +32,7 @@
 """
 from django.utils.translation import get_language, ugettext as _, ugettext_noop
 from uds.core.util import encoders
+from uds.core.util import serializer
 import datetime
 import time
 import six
@@ -897,10 +898,7 @@ class UserInterface(object, metaclass=UserInterfaceType):
     def serializeForm(self):
         """
         All values stored at form fields are serialized and returned as a single
-        string
-        Separating char is
-
-        The returned string is zipped and then converted to base 64
+        binary string (see :py:mod:`uds.core.util.serializer`)
 
         Note: Hidens are not serialized, they are ignored
 
@@ -909,7 +907,7 @@ class UserInterface(object, metaclass=UserInterfaceType):
         # import inspect
         # logger.debug('Caller is : {}'.format(inspect.stack()))
 
-        arr = []
+        values = {}
         for k, v in self._gui.items():
             logger.debug('serializing Key: {0}/{1}'.format(k, v.value))
             if v.isType(gui.InputField.HIDDEN_TYPE) and v.isSerializable() is False:
@@ -920,27 +918,25 @@ class UserInterface(object, metaclass=UserInterfaceType):
                 continue
             if v.isType(gui.InputField.EDITABLE_LIST) or v.isType(gui.InputField.MULTI_CHOICE_TYPE):
                 # logger.debug('Serializing value {0}'.format(v.value))
-                val = b'\001' + pickle.dumps(v.value, protocol=0)
+                val = list(v.value)
             elif v.isType(gui.InputField.NUMERIC_TYPE):
-                val = str(int(v.num())).encode('utf8')
+                val = str(int(v.num()))
             elif v.isType(gui.InputField.CHECKBOX_TYPE):
-                val = v.isTrue()
+                val = gui.TRUE if v.isTrue() else gui.FALSE
             else:
-                val = v.value.encode('utf8')
-            if val is True:
-                val = gui.TRUE.encode('utf8')
-            elif val is False:
-                val = gui.FALSE.encode('utf8')
+                val = v.value
 
-            arr.append(k.encode('utf8') + b'\003' + val)
-        logger.debug('Arr, >>%s<<', arr)
-        return encoders.encode(b'\002'.join(arr), 'zip')
+            values[k] = val
+        logger.debug('Values, >>%s<<', values)
+        return serializer.dumps(values)
 
     def unserializeForm(self, values):
         """
         This method unserializes the values previously obtained using
         :py:meth:`serializeForm`, and stores
         the valid values form form fileds inside its corresponding field
+
+        Values serialized by previous versions (zipped and pickled) are also accepted
         """
         if values == b'':  # Has nothing
             return
@@ -953,32 +949,44 @@ class UserInterface(object, metaclass=UserInterfaceType):
                     continue
                 self._gui[k].value = self._gui[k].defValue
 
-            values = encoders.decode(values, 'zip')
-            if values == b'':  # Has nothing
+            if serializer.isSerialized(values):
+                for k, val in six.iteritems(serializer.loads(values)):
+                    if k in self._gui:
+                        self._gui[k].value = val
                 return
 
-            for txt in values.split(b'\002'):
-                k, v = txt.split(b'\003')
-                k = k.decode('utf8')  # Convert name to unicode
-                if k in self._gui:
-                    try:
-                        if v[0] == 1:
-                            val = pickle.loads(v[1:])
-                        else:
-                            val = v
-                            # Ensure "legacy bytes" values are loaded correctly as unicode
-                            if isinstance(val, bytes):
-                                val = val.decode('utf_8')
-                    except Exception:
-                        # logger.exception('Pickling')
-                        val = ''
-                    self._gui[k].value = val
-                # logger.debug('Value for {0}:{1}'.format(k, val))
+            self.__unserializeLegacyForm(values)
         except Exception:
             logger.exception('Exception on unserialization on {}'.format(self.__class__))
             # Values can contain invalid characters, so we log every single char
             # logger.info('Invalid serialization data on {0} {1}'.format(self, values.encode('hex')))
 
+    def __unserializeLegacyForm(self, values):
+        """
+        Unserializes values stored by previous versions (pickled fields, joined and zipped)
+        """
+        values = encoders.decode(values, 'zip')
+        if values == b'':  # Has nothing
+            return
+
+        for txt in values.split(b'\002'):
+            k, v = txt.split(b'\003')
+            k = k.decode('utf8')  # Convert name to unicode
+            if k in self._gui:
+                try:
+                    if v[0] == 1:
+                        val = pickle.loads(v[1:])
+                    else:
+                        val = v
+                        # Ensure "legacy bytes" values are loaded correctly as unicode
+                        if isinstance(val, bytes):
+                            val = val.decode('utf_8')
+                except Exception:
+                    # logger.exception('Pickling')
+                    val = ''
+                self._gui[k].value = val
+            # logger.debug('Value for {0}:{1}'.format(k, val))
+
     @classmethod
     def guiDescription(cls, obj=None):
         """
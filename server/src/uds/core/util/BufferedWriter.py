@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (c) 2012 Virtual Cable S.L.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright notice,
+#      this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#    * Neither the name of Virtual Cable S.L. nor the names of its contributors
+#      may be used to endorse or promote products derived from this software
+#      without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+@author: Adolfo Gómez, dkmaster at dkmon dot com
+"""
+from __future__ import unicode_literals
+
+from django.db import connection, close_old_connections, OperationalError, InterfaceError
+
+import collections
+import threading
+import atexit
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class BufferedWriter(object):
+    """
+    Queues elements on a bounded buffer (if it gets full, oldest ones are dropped) that are written to database
+    in batches by a background flusher thread, when batchSize elements are queued or every flushInterval seconds.
+
+    write receives a batch (list of elements) and returns how many of them were stored. If it raises a connection
+    error (OperationalError or InterfaceError), the connection is closed and the batch is queued again to be retried
+    on next flush, so write must not store anything of a batch it fails with one of these.
+    """
+
+    def __init__(self, name, write, queueSize, batchSize, flushInterval):
+        self.name = name
+        self._write = write
+        self._queueSize = queueSize
+        self._batchSize = batchSize
+        self._flushInterval = flushInterval
+        self._lock = threading.Lock()
+        self.flushLock = threading.Lock()  # Held while writing, so queued elements can be safely discarded
+        self._wakeup = threading.Event()
+        self._queue = collections.deque(maxlen=queueSize)
+        self._flusher = None
+        self.dropped = 0
+        self.written = 0
+        atexit.register(self.shutdown)
+
+    def shutdown(self):
+        """
+        Writes pending elements before process ends
+        """
+        try:
+            self.flush()
+        except Exception:
+            logger.exception('Flushing %s at shutdown', self.name)
+
+    def __ensureFlusher(self):
+        if self._flusher is None or not self._flusher.is_alive():
+            self._flusher = threading.Thread(target=self.__flusherLoop, name=self.name + 'Flusher')
+            self._flusher.daemon = True
+            self._flusher.start()
+
+    def __flusherLoop(self):
+        while True:
+            self._wakeup.wait(self._flushInterval)
+            self._wakeup.clear()
+            # Discard the connection of this thread if broken or timed out by database since last flush
+            close_old_connections()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error('Exception flushing {}: {}: {}'.format(self.name, e.__class__, e))
+
+    def __requeue(self, batch):
+        with self._lock:
+            excess = len(self._queue) + len(batch) - self._queueSize
+            if excess > 0:  # Oldest ones are dropped
+                self.dropped += excess
+                batch = batch[excess:]
+            self._queue.extendleft(reversed(batch))
+
+    def put(self, element):
+        with self._lock:
+            if len(self._queue) == self._queueSize:
+                self.dropped += 1  # Appending will drop the oldest one
+            self._queue.append(element)
+            pending = len(self._queue)
+
+        self.__ensureFlusher()
+        if pending >= self._batchSize:
+            self._wakeup.set()
+
+    def discard(self, predicate):
+        """
+        Removes from queue the elements for which predicate is True
+        Hold flushLock while invoking it if the elements being written right now must also be taken into account
+        """
+        with self._lock:
+            pending = [e for e in self._queue if not predicate(e)]
+            self._queue.clear()
+            self._queue.extend(pending)
+
+    def flush(self):
+        """
+        Writes to database the queued elements
+        """
+        with self.flushLock:
+            while True:
+                with self._lock:
+                    batch = [self._queue.popleft() for _ in range(min(len(self._queue), self._batchSize))]
+                if not batch:
+                    break
+
+                try:
+                    written = self._write(batch)
+                except (OperationalError, InterfaceError) as e:
+                    logger.warning('Database not available writing %s, will be retried: %s', self.name, e)
+                    self.__requeue(batch)
+                    if not connection.in_atomic_block:
+                        connection.close()  # Will reconnect on next write
+                    break
+
+                self.written += written
+                self.dropped += len(batch) - written
@@ -31,11 +31,15 @@
 @author: Adolfo Gómez, dkmaster at dkmon dot com
 """
 from __future__ import unicode_literals
-from django.db import transaction
+from django.db import transaction, connection
 import uds.models.Cache
+from uds.models.CacheGeneration import CacheGeneration
 from uds.models.Util import getSqlDatetime
 from uds.core.util import encoders
-from datetime import datetime, timedelta
+from datetime import timedelta
+from collections import OrderedDict
+import threading
+import time
 import six
 import hashlib
 import logging
@@ -43,6 +47,152 @@ import pickle
 
 logger = logging.getLogger(__name__)
 
+# Generation owner used to invalidate every cached item (purge & delete without owner)
+GLOBAL_GENERATION = '*'
+
+
+class _LocalCache(object):
+    """
+    In-process, bounded LRU front for database cache.
+
+    Items are stored pickled (so callers never share mutable objects) along with its
+    local expiration time and the generation of its owner when it was read.
+    Generations are synchronized with database (CacheGeneration) at most every SYNC_INTERVAL seconds,
+    so writes on other servers invalidates items of that owner on this one.
+    Writes increment the generation of its owner at most once every SYNC_INTERVAL seconds (see bump).
+    """
+    MAX_ITEMS = 4096
+    MAX_OWNERS = 1024  # Max owners with its own hits/misses counters (the rest are counted together)
+    SYNC_INTERVAL = 2  # Seconds between generations check
+    SYNC_MARGIN = 10  # Overlap (seconds) on generations check, to cover not yet commited transactions
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._items = OrderedDict()  # key -> (owner, data, expires, validity, generation)
+        self._generations = {}  # owner -> generation
+        self._globalGeneration = 0
+        self._lastSync = None
+        self._nextSync = 0
+        self._stats = {}  # owner -> [hits, misses]
+        self._bumps = {}  # owner -> monotonic time until next generation increment must be deferred
+        self._pendingBumps = set()  # owners with a deferred generation increment
+
+    def _sync(self):
+        now = time.monotonic()
+        if now < self._nextSync:
+            return
+        self._nextSync = now + _LocalCache.SYNC_INTERVAL
+        try:
+            dbNow = getSqlDatetime()
+            if self._lastSync is not None:
+                changed = list(CacheGeneration.changedSince(self._lastSync - timedelta(seconds=_LocalCache.SYNC_MARGIN)))
+                with self._lock:
+                    for owner, generation, _ in changed:
+                        if owner == GLOBAL_GENERATION:
+                            if generation != self._globalGeneration:
+                                self._globalGeneration = generation
+                                self._items.clear()
+                        else:
+                            self._generations[owner] = generation
+            self._lastSync = dbNow
+        except Exception as e:
+            # If generations can't be checked, local items can't be trusted
+            logger.debug('Cache generations not accesible: %s', e)
+            self.clear()
+
+    def _count(self, owner, hit):
+        counters = self._stats.get(owner)
+        if counters is None:
+            if len(self._stats) >= _LocalCache.MAX_OWNERS:
+                owner = None  # Other owners
+            counters = self._stats.setdefault(owner, [0, 0])
+        counters[0 if hit else 1] += 1
+
+    @staticmethod
+    def _doBump(owner):
+        try:
+            CacheGeneration.bump(owner)
+        except Exception as e:
+            logger.debug('Could not update cache generation for %s: %s', owner, e)
+
+    def _deferredBump(self, owner):
+        with self._lock:
+            self._pendingBumps.discard(owner)
+            self._bumps[owner] = time.monotonic() + _LocalCache.SYNC_INTERVAL
+        try:
+            _LocalCache._doBump(owner)
+        finally:
+            connection.close()  # Executed on its own thread
+
+    def bump(self, owner):
+        """
+        Notifies other servers that items of this owner has changed, incrementing its generation.
+        As other servers check generations every SYNC_INTERVAL seconds, an owner generation is incremented at most
+        once in that interval: writes inside it are notified by a single (deferred) increment at its end.
+        """
+        now = time.monotonic()
+        with self._lock:
+            nextBump = self._bumps.get(owner, 0)
+            if now < nextBump:
+                if owner not in self._pendingBumps:
+                    self._pendingBumps.add(owner)
+                    timer = threading.Timer(nextBump - now, self._deferredBump, (owner,))
+                    timer.daemon = True
+                    timer.start()
+                return
+            if len(self._bumps) >= _LocalCache.MAX_OWNERS:
+                self._bumps = dict((k, v) for k, v in six.iteritems(self._bumps) if v > now)
+            self._bumps[owner] = now + _LocalCache.SYNC_INTERVAL
+        _LocalCache._doBump(owner)
+
+    def get(self, key, owner):
+        self._sync()
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None:
+                if item[2] > time.monotonic() and item[4] == self._generations.get(owner, 0):
+                    self._items.move_to_end(key)
+                    self._count(owner, True)
+                    return item[1]
+                del self._items[key]
+            self._count(owner, False)
+        return None
+
+    def put(self, key, owner, data, remaining, validity):
+        if remaining <= 0:
+            return
+        with self._lock:
+            self._items[key] = (owner, data, time.monotonic() + remaining, validity, self._generations.get(owner, 0))
+            self._items.move_to_end(key)
+            while len(self._items) > _LocalCache.MAX_ITEMS:
+                self._items.popitem(last=False)
+
+    def refresh(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None:
+                self._items[key] = item[:2] + (time.monotonic() + item[3],) + item[3:]
+
+    def remove(self, key):
+        with self._lock:
+            self._items.pop(key, None)
+
+    def removeOwner(self, owner):
+        with self._lock:
+            for k in [k for k, v in six.iteritems(self._items) if v[0] == owner]:
+                del self._items[k]
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'items': len(self._items),
+                'owners': dict((k if k is not None else '(others)', {'hits': v[0], 'misses': v[1]}) for k, v in six.iteritems(self._stats))
+            }
+
 
 class Cache(object):
     # Simple hits vs missses counters
@@ -51,8 +201,15 @@ class Cache(object):
 
     DEFAULT_VALIDITY = 60
 
+    local = _LocalCache()
+
     def __init__(self, owner):
         self._owner = owner.encode('utf-8') if isinstance(owner, six.text_type) else owner
+        self._ownerName = Cache.__ownerName(owner)
+
+    @staticmethod
+    def __ownerName(owner):
+        return owner.decode('utf-8') if isinstance(owner, six.binary_type) else owner
 
     def __getKey(self, key):
         h = hashlib.md5()
@@ -62,22 +219,28 @@ class Cache(object):
         return h.hexdigest()
 
     def get(self, skey, defValue=None):
-        now = getSqlDatetime()
         logger.debug('Requesting key "{}" for cache "{}"'.format(skey, self._owner))
         try:
             key = self.__getKey(skey)
             logger.debug('Key: {}'.format(key))
+            data = Cache.local.get(key, self._ownerName)
+            if data is not None:
+                Cache.hits += 1
+                return pickle.loads(data)
+            now = getSqlDatetime()
             c = uds.models.Cache.objects.get(pk=key)  # @UndefinedVariable
-            expired = now > c.created + timedelta(seconds=c.validity)
-            if expired:
+            remaining = (c.created + timedelta(seconds=c.validity) - now).total_seconds()
+            if remaining < 0:  # Expired
                 return defValue
             try:
                 logger.debug('value: {}'.format(c.value))
-                val = pickle.loads(encoders.decode(c.value, 'base64'))
+                data = encoders.decode(c.value, 'base64')
+                val = pickle.loads(data)
             except Exception:  # If invalid, simple do no tuse it
                 logger.exception('Invalid pickle from cache')
                 c.delete()
                 return defValue
+            Cache.local.put(key, self._ownerName, data, remaining, c.validity)
             Cache.hits += 1
             return val
         except uds.models.Cache.DoesNotExist:  # @UndefinedVariable
@@ -95,9 +258,11 @@ class Cache(object):
         If cached item does not exists, nothing happens (no exception thrown)
         """
         # logger.debug('Removing key "%s" for uService "%s"' % (skey, self._owner))
+        key = self.__getKey(skey)
+        Cache.local.remove(key)
         try:
-            key = self.__getKey(skey)
             uds.models.Cache.objects.get(pk=key).delete()  # @UndefinedVariable
+            Cache.local.bump(self._ownerName)
             return True
         except uds.models.Cache.DoesNotExist:  # @UndefinedVariable
             logger.debug('key not found')
@@ -111,6 +276,7 @@ class Cache(object):
         if validity is None:
             validity = Cache.DEFAULT_VALIDITY
         key = self.__getKey(skey)
+        Cache.local.remove(key)
         value = encoders.encode(pickle.dumps(value), 'base64', asText=True)
         now = getSqlDatetime()
         try:
@@ -127,6 +293,8 @@ class Cache(object):
                 c.save()
             except transaction.TransactionManagementError:
                 logger.debug('Transaction in course, cannot store value')
+                return
+        Cache.local.bump(self._ownerName)
 
     def refresh(self, skey):
         # logger.debug('Refreshing key "%s" for cache "%s"' % (skey, self._owner,))
@@ -135,13 +303,25 @@ class Cache(object):
             c = uds.models.Cache.objects.get(pk=key)  # @UndefinedVariable
             c.created = getSqlDatetime()
             c.save()
+            Cache.local.refresh(key)
         except uds.models.Cache.DoesNotExist:  # @UndefinedVariable
             logger.debug('Can\'t refresh cache key %s because it doesn\'t exists' % skey)
             return
 
+    @staticmethod
+    def stats():
+        """
+        Returns hits/misses of this server, global and per owner for the in-process cache
+        """
+        stats = Cache.local.stats()
+        stats.update({'hits': Cache.hits, 'misses': Cache.misses})
+        return stats
+
     @staticmethod
     def purge():
         uds.models.Cache.objects.all().delete()  # @UndefinedVariable
+        Cache.local.clear()
+        _LocalCache._doBump(GLOBAL_GENERATION)
 
     @staticmethod
     def cleanUp():
@@ -155,3 +335,10 @@ class Cache(object):
         else:
             objects = uds.models.Cache.objects.filter(owner=owner)  # @UndefinedVariable
         objects.delete()
+        if owner is None:
+            Cache.local.clear()
+            _LocalCache._doBump(GLOBAL_GENERATION)
+        else:
+            owner = Cache.__ownerName(owner)
+            Cache.local.removeOwner(owner)
+            _LocalCache._doBump(owner)  # Not deferred, cleaning an owner is not frequent
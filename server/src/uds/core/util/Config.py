@@ -249,6 +249,8 @@ class GlobalConfig(object):
     IGNORE_LIMITS = Config.section(GLOBAL_SECTION).value('ignoreLimits', '0', type=Config.BOOLEAN_FIELD)
     # Number of services to initiate removal per run of CacheCleaner
     USER_SERVICE_CLEAN_NUMBER = Config.section(GLOBAL_SECTION).value('userServiceCleanNumber', '3', type=Config.NUMERIC_FIELD)  # Defaults to 3 per wun
+    # Max number of cache creations or removals per service pool on each run of cache updater
+    CACHE_OPERATIONS_PER_POOL = Config.section(GLOBAL_SECTION).value('cacheOperationsPerPool', '5', type=Config.NUMERIC_FIELD)  # Defaults to 5 per run
     # Removal Check time for cache, publications and deployed services
     REMOVAL_CHECK = Config.section(GLOBAL_SECTION).value('removalCheck', '31', type=Config.NUMERIC_FIELD)  # Defaults to 30 seconds
     # Login URL
@@ -339,6 +341,13 @@ class GlobalConfig(object):
     # Global UDS ID (common for all servers on the same cluster)
     UDS_ID = Config.section(GLOBAL_SECTION).value('UDS ID', CryptoManager.manager().uuid(), type=Config.READ_FIELD)
 
+    # Owners of tickets stored only on this server (shared memory) instead of database. Comma separated (i.e. "client,tunnel,pam")
+    # Only for single server installations (tickets are not visible to other servers)
+    LOCAL_TICKETS = Config.section(GLOBAL_SECTION).value('Local tickets owners', '', type=Config.TEXT_FIELD)
+
+    # If true, REST responses include a Server-Timing header with routing, handler and render times
+    REST_TIMINGS = Config.section(GLOBAL_SECTION).value('REST timings', '0', type=Config.BOOLEAN_FIELD)
+
     initDone = False
 
     @staticmethod
@@ -43,14 +43,14 @@ class Worker(Thread):
     def __init__(self, tasks):
         Thread.__init__(self)
         self._tasks = tasks
-        self._stop = False
+        self._stopRequested = False
         self.start()
 
     def notifyStop(self):
-        self._stop = True
+        self._stopRequested = True
 
     def run(self):
-        while self._stop is False:
+        while self._stopRequested is False:
             try:
                 func, args, kargs = self._tasks.get(block=True, timeout=1)
             except six.moves.queue.Empty:
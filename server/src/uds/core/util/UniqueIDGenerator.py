@@ -33,9 +33,15 @@
 from __future__ import unicode_literals
 
 from django.db import transaction, OperationalError, connection
+from django.db.models import Q
 from django.db.utils import IntegrityError
 from uds.models.UniqueId import UniqueId
 from uds.models import getSqlDatetime
+import threading
+import platform
+import atexit
+import bisect
+import os
 import logging
 import time
 
@@ -43,11 +49,104 @@ logger = logging.getLogger(__name__)
 
 MAX_SEQ = 1000000000000000
 
+# Owners of reserved (not yet used) ids start with this
+RESERVED_PREFIX = '#'
+
 
 class CreateNewIdException(Exception):
     pass
 
 
+class Reservations(object):
+    """
+    Ids reserved by this process, by basename.
+
+    Ids are reserved on database in blocks (marked as assigned to a "reservation owner" of this process), and kept here
+    in sorted lists, so getting an id is just taking it from the list and changing the owner of its record.
+    Reservations older than TTL are considered abandoned (i.e. process died), and can be reused by anyone.
+    """
+    BLOCK_SIZE = 32
+    TTL = 600
+
+    _reservations = None
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.pid = None
+        self.owner = None
+        self.free = {}  # basename -> sorted list of reserved seqs
+        self.stamps = {}  # basename -> stamp of oldest reservation on list
+        self.blocks = 0  # Number of blocks reserved, for performance checking
+
+    @staticmethod
+    def reservations():
+        if Reservations._reservations is None:
+            Reservations._reservations = Reservations()
+            atexit.register(Reservations._reservations.returnAll)
+        return Reservations._reservations
+
+    def check(self):
+        """
+        Ensures that reservations belongs to this process (a forked process must not use the ones of its parent)
+        Must be invoked with lock held
+        """
+        if self.pid != os.getpid():
+            self.pid = os.getpid()
+            self.owner = '{}{}:{}'.format(RESERVED_PREFIX, platform.node()[:96], self.pid)
+            self.free = {}
+            self.stamps = {}
+
+    def add(self, basename, seqs, stamp):
+        with self.lock:
+            self.check()
+            free = self.free.setdefault(basename, [])
+            if not free:
+                self.stamps[basename] = stamp
+            for seq in seqs:
+                bisect.insort(free, seq)
+
+    def take(self, basename, rangeStart, rangeEnd, stamp):
+        """
+        Takes the lowest reserved seq of the range, or None if there is none
+        Reservations near to expire are returned to database, so nobody else can reuse them while they are being used
+        """
+        with self.lock:
+            self.check()
+            if stamp - self.stamps.get(basename, stamp) > Reservations.TTL // 2:
+                self.giveBack(basename)
+            free = self.free.get(basename)
+            if not free:
+                return None
+            pos = bisect.bisect_left(free, rangeStart)
+            if pos == len(free) or free[pos] > rangeEnd:
+                return None
+            return free.pop(pos)
+
+    def giveBack(self, basename):
+        """
+        Returns the reserved seqs of basename to database, as free ones
+        """
+        with self.lock:
+            self.check()
+            free = self.free.pop(basename, None)
+            self.stamps.pop(basename, None)
+            if free:
+                UniqueId.objects.filter(basename=basename, owner=self.owner, seq__in=free).update(assigned=False, owner='')
+
+    def returnAll(self):
+        """
+        Returns all reserved ids (used at process exit)
+        """
+        try:
+            with self.lock:
+                if self.owner is not None and self.pid == os.getpid():
+                    UniqueId.objects.filter(owner=self.owner).update(assigned=False, owner='')
+                self.free = {}
+                self.stamps = {}
+        except Exception:
+            logger.exception('Returning reserved unique ids')
+
+
 class UniqueIDGenerator(object):
 
     def __init__(self, typeName, owner, baseName=None):
@@ -63,73 +162,85 @@ class UniqueIDGenerator(object):
         obj = UniqueId.objects.select_for_update() if forUpdate else UniqueId.objects
         return obj.filter(basename=self._baseName, seq__gte=rangeStart, seq__lte=rangeEnd)  # @UndefinedVariable
 
-    def get(self, rangeStart=0, rangeEnd=MAX_SEQ):
+    def __reserve(self, rangeStart, rangeEnd, stamp):
         """
-        Tries to generate a new unique id in the range provided. This unique id
-        is global to "unique ids' database
+        Reserves a block of ids of the range (lowest free ones, or new ones after the last one) in a single transaction
+        Returns False if no id could be reserved (range is full)
         """
-        # First look for a name in the range defined
-        stamp = getSqlDatetime(True)
-        seq = rangeStart
-        # logger.debug(UniqueId)
+        reservations = Reservations.reservations()
+        size = max(1, min(Reservations.BLOCK_SIZE, (rangeEnd - rangeStart + 1) // 16))
         counter = 0
         while True:
             counter += 1
             try:
-                # logger.debug('Creating new seq in range {}-{}'.format(rangeStart, rangeEnd))
-                with transaction.atomic():
-                    flt = self.__filter(rangeStart, rangeEnd, forUpdate=True)
-                    try:
-                        item = flt.filter(assigned=False).order_by('seq')[0]
-                        item.owner = self._owner
-                        item.assigned = True
-                        item.stamp = stamp
-                        item.save()
-                        # UniqueId.objects.filter(id=item.id).update(owner=self._owner, assigned=True, stamp=stamp)  # @UndefinedVariable
-                        seq = item.seq
-                        break
-                    except IndexError:  # No free element found
-                        item = None
-
-                    # No item was found on first instance (already created, but freed)
-                    if item is None:
-                        # logger.debug('No free found, creating new one')
-                        try:
-                            last = flt.filter(assigned=True)[0]  # DB Returns correct order so the 0 item is the last
-                            seq = last.seq + 1
-                        except IndexError:  # If there is no assigned at database
-                            seq = rangeStart
-                        # logger.debug('Found seq {0}'.format(seq))
-                        if seq > rangeEnd:
-                            return -1  # No ids free in range
-                        # May ocurr on some circustance that a concurrency access gives same item twice, in this case, we
-                        # will get an "duplicate key error",
-                        UniqueId.objects.create(owner=self._owner, basename=self._baseName, seq=seq, assigned=True, stamp=stamp)  # @UndefinedVariable
-                        break
+                with reservations.lock:
+                    reservations.check()
+                    with transaction.atomic():
+                        flt = self.__filter(rangeStart, rangeEnd, forUpdate=True)
+                        # Free ones, or reserved by someone long ago (abandoned)
+                        seqs = list(
+                            flt.filter(Q(assigned=False) | Q(owner__startswith=RESERVED_PREFIX, stamp__lt=stamp - Reservations.TTL)).order_by('seq').values_list('seq', flat=True)[:size]
+                        )
+                        if seqs:
+                            flt.filter(seq__in=seqs).update(owner=reservations.owner, assigned=True, stamp=stamp)
+                        if len(seqs) < size:
+                            last = flt.order_by('-seq').values_list('seq', flat=True).first()
+                            start = rangeStart if last is None else last + 1
+                            new = list(range(start, min(start + size - len(seqs), rangeEnd + 1)))
+                            # May ocurr on some circustance that a concurrency access gives same item twice, in this case, we
+                            # will get an "duplicate key error",
+                            UniqueId.objects.bulk_create([
+                                UniqueId(owner=reservations.owner, basename=self._baseName, seq=seq, assigned=True, stamp=stamp) for seq in new
+                            ])
+                            seqs += new
+                    reservations.blocks += 1
+                    reservations.add(self._baseName, seqs, stamp)
+                return len(seqs) > 0
             except OperationalError:  # Locked, may ocurr for example on sqlite. We will wait a bit
-                # logger.exception('Got database locked')
                 if counter % 5 == 0:
                     connection.close()
-                time.sleep(1)
+                time.sleep(0.1)
             except IntegrityError:  # Concurrent creation, may fail, simply retry
                 pass
-            except Exception:
-                logger.exception('Error')
-                return -1
 
-        # logger.debug('Seq: {}'.format(seq))
-        return seq
+    def get(self, rangeStart=0, rangeEnd=MAX_SEQ):
+        """
+        Tries to generate a new unique id in the range provided. This unique id
+        is global to "unique ids' database
+        Ids are taken from the ones reserved by this process, reserving a new block when needed
+        """
+        reservations = Reservations.reservations()
+        stamp = getSqlDatetime(True)
+        try:
+            for _ in range(8):
+                seq = reservations.take(self._baseName, rangeStart, rangeEnd, stamp)
+                if seq is None:
+                    if not self.__reserve(rangeStart, rangeEnd, stamp):
+                        return -1  # No ids free in range
+                    continue
+                # Reserved record is now ours. If it is not reserved anymore (reservation expired and reused), drop the reservations
+                if UniqueId.objects.filter(basename=self._baseName, seq=seq, owner=reservations.owner).update(owner=self._owner, stamp=stamp) == 1:
+                    return seq
+                reservations.giveBack(self._baseName)
+        except Exception:
+            logger.exception('Error')
+        return -1
 
     def transfer(self, seq, toUidGen):
         self.__filter(0, forUpdate=True).filter(owner=self._owner, seq=seq).update(owner=toUidGen._owner, basename=toUidGen._baseName, stamp=getSqlDatetime(True))
         return True
 
     def free(self, seq):
+        """
+        Frees the seq, keeping it reserved for this process so it can be reused without accesing database
+        """
         logger.debug('Freeing seq {} from {}  ({})'.format(seq, self._owner, self._baseName))
-        with transaction.atomic():
-            flt = self.__filter(0, forUpdate=True).filter(owner=self._owner, seq=seq).update(owner='', assigned=False, stamp=getSqlDatetime(True))
-        if flt > 0:
-            self.__purge()
+        reservations = Reservations.reservations()
+        stamp = getSqlDatetime(True)
+        with reservations.lock:
+            reservations.check()
+            if self.__filter(0).filter(owner=self._owner, seq=seq).update(owner=reservations.owner, stamp=stamp) > 0:
+                reservations.add(self._baseName, [seq], stamp)
 
     def __purge(self):
         logger.debug('Purging UniqueID database')
@@ -33,51 +33,48 @@
 # pylint: disable=maybe-no-member
 from __future__ import unicode_literals
 
-from uds.models.Util import NEVER
 from uds.models.Util import getSqlDatetime
 
-from uds.models.Calendar import Calendar
-
-from uds.core.util.Cache import Cache
-
+import collections
 import datetime
-import time
-import six
+import threading
 import bitarray
 import logging
 
-__updated__ = '2017-12-12'
+__updated__ = '2019-05-14'
 
 logger = logging.getLogger(__name__)
 
+MINUTES_PER_DAY = 60 * 24
 
-class CalendarChecker(object):
-    calendar = None
 
-    # For performance checking
-    updates = 0
-    cache_hit = 0
-    hits = 0
-
-    cache = Cache('calChecker')
-
-    def __init__(self, calendar):
-        self.calendar = calendar
+class CompiledCalendar(object):
+    """
+    Minute granularity bitmaps of the rules of a calendar, precomputed for a window of days:
+      * active: minutes where any rule is active
+      * starts: minutes where an occurrence of any rule begins
+      * ends: minutes where an occurrence of any rule ends
+    """
 
-    def _updateData(self, dtime):
-        logger.debug('Updating {}'.format(dtime))
-        # Else, update the array
-        CalendarChecker.updates += 1
+    def __init__(self, rules, startDate, days):
+        self.start = datetime.datetime.combine(startDate, datetime.datetime.min.time())
+        self.end = self.start + datetime.timedelta(days=days)
+        # If any rule starts on a non exact minute, events can't be obtained from bitmaps
+        self.exactEvents = True
 
-        data = bitarray.bitarray(60 * 24)  # Granurality is minute
-        data.setall(False)
+        size = days * MINUTES_PER_DAY
+        self.active = bitarray.bitarray(size)
+        self.starts = bitarray.bitarray(size)
+        self.ends = bitarray.bitarray(size)
+        for b in (self.active, self.starts, self.ends):
+            b.setall(False)
 
-        data_date = dtime.date()
+        lastInstant = self.end - datetime.timedelta(microseconds=1)
 
-        start = datetime.datetime.combine(data_date, datetime.datetime.min.time())
-        end = datetime.datetime.combine(data_date, datetime.datetime.max.time())
+        for rule in rules:
+            if rule.start.second != 0 or rule.start.microsecond != 0:
+                self.exactEvents = False
 
-        for rule in self.calendar.rules.all():
             rr = rule.as_rrule()
 
             r_end = datetime.datetime.combine(rule.end, datetime.datetime.max.time()) if rule.end is not None else None
@@ -85,33 +82,98 @@ class CalendarChecker(object):
             ruleDurationMinutes = rule.duration_as_minutes
             ruleFrequencyMinutes = rule.frequency_as_minutes
 
-            # Skip "bogus" definitions
-            if ruleDurationMinutes == 0 or ruleFrequencyMinutes == 0:
-                continue
-
-            # ruleDurationMinutes = ruleDurationMinutes
-            # Relative start, rrule can "spawn" the days, so we get the start at least the ruleDurationMinutes of rule to see if it "matches"
-            # This means, we need the previous matching day to be "executed" so we can get the "actives" correctly
+            # rrule can "spawn" the days, so we get the start at least the ruleDurationMinutes of rule to see if it "matches"
+            # This means, we need the previous matching occurrence to be "executed" so we can get the "actives" (and ends) correctly
             diff = ruleFrequencyMinutes if ruleFrequencyMinutes > ruleDurationMinutes else ruleDurationMinutes
-            _start = (start if start > rule.start else rule.start) - datetime.timedelta(minutes=diff)
+            _start = (self.start if self.start > rule.start else rule.start) - datetime.timedelta(minutes=diff)
 
-            _end = end if r_end is None or end < r_end else r_end
+            _end = lastInstant if r_end is None or lastInstant < r_end else r_end
 
             for val in rr.between(_start, _end, inc=True):
-                if val.date() != data_date:
-                    diff = int((start - val).total_seconds() / 60)
-                    pos = 0
-                    posdur = ruleDurationMinutes - diff
-                    if posdur <= 0:
-                        continue
-                else:
-                    pos = val.hour * 60 + val.minute
-                    posdur = pos + ruleDurationMinutes
-                if posdur > 60 * 24:
-                    posdur = 60 * 24
-                data[pos:posdur] = True
-
-        return data
+                pos = int((val - self.start).total_seconds() // 60)
+                posdur = pos + ruleDurationMinutes
+                if pos >= 0:
+                    self.starts[pos] = True
+                if 0 <= posdur < size and (r_end is None or val + datetime.timedelta(minutes=ruleDurationMinutes) <= r_end):
+                    self.ends[posdur] = True
+
+                # Skip "bogus" definitions for active minutes
+                if ruleDurationMinutes == 0 or ruleFrequencyMinutes == 0 or posdur <= 0:
+                    continue
+                self.active[max(pos, 0):min(posdur, size)] = True
+
+    def contains(self, dtime):
+        return self.start <= dtime < self.end
+
+    def check(self, dtime):
+        """
+        Returns if the calendar is active at dtime (that must be contained on this window)
+        """
+        return self.active[int((dtime - self.start).total_seconds() // 60)]
+
+    def nextEvent(self, checkFrom, startEvent=True):
+        """
+        Returns the first start (or end) of an occurrence strictly after checkFrom inside this window, or None if there is none
+        """
+        pos = max(int((checkFrom - self.start).total_seconds() // 60) + 1, 0)
+        bits = self.starts if startEvent else self.ends
+        try:
+            return self.start + datetime.timedelta(minutes=bits.index(True, pos))
+        except ValueError:
+            return None
+
+
+class CalendarChecker(object):
+    """
+    Checks calendars using compiled bitmaps of WINDOW_DAYS days.
+
+    Compiled windows are kept on process memory, keyed by calendar and calendar modification time
+    (any change to a calendar or its rules updates it), so they don't need any other invalidation.
+    """
+    calendar = None
+
+    WINDOW_DAYS = 7
+    MAX_COMPILED = 512
+
+    # For performance checking
+    updates = 0
+    cache_hit = 0
+    hits = 0
+
+    _compiled = collections.OrderedDict()
+    _lock = threading.Lock()
+
+    def __init__(self, calendar):
+        self.calendar = calendar
+
+    def compiled(self, dtime):
+        """
+        Returns the compiled window of this calendar that contains dtime
+        Windows are aligned (on days ordinals), so every checker uses the same windows
+        """
+        block = (dtime.date().toordinal() - 1) // CalendarChecker.WINDOW_DAYS
+        key = (self.calendar.uuid, self.calendar.modified, block)
+        with CalendarChecker._lock:
+            compiled = CalendarChecker._compiled.get(key)
+            if compiled is not None:
+                CalendarChecker._compiled.move_to_end(key)
+                CalendarChecker.cache_hit += 1
+                return compiled
+
+        logger.debug('Compiling %s for block %s', self.calendar, block)
+        CalendarChecker.updates += 1
+        compiled = CompiledCalendar(
+            self.calendar.rules.all(),
+            datetime.date.fromordinal(block * CalendarChecker.WINDOW_DAYS + 1),
+            CalendarChecker.WINDOW_DAYS
+        )
+
+        with CalendarChecker._lock:
+            CalendarChecker._compiled[key] = compiled
+            while len(CalendarChecker._compiled) > CalendarChecker.MAX_COMPILED:
+                CalendarChecker._compiled.popitem(last=False)
+
+        return compiled
 
     def _updateEvents(self, checkFrom, startEvent=True):
 
@@ -126,7 +188,7 @@ class CalendarChecker(object):
             else:
                 event = rule.as_rrule_end().after(checkFrom)  # At end
 
-            if next_event is None or next_event > event:
+            if event is not None and (next_event is None or next_event > event):
                 next_event = event
 
         return next_event
@@ -135,33 +197,16 @@ class CalendarChecker(object):
         """
         Checks if the given time is a valid event on calendar
         @param dtime: Datetime object to check
-        TODO: We can improve performance of this by getting from a cache first if we can
         """
         if dtime is None:
             dtime = getSqlDatetime()
 
-        # First, try to get data from cache if it is valid
-        cacheKey = six.text_type(hash(self.calendar.modified)) + six.text_type(
-            dtime.date().toordinal()) + self.calendar.uuid + 'checker'
-        cached = CalendarChecker.cache.get(cacheKey, None)
-
-        if cached is not None:
-            data = bitarray.bitarray()  # Empty bitarray
-            data.frombytes(cached)
-            CalendarChecker.cache_hit += 1
-        else:
-            data = self._updateData(dtime)
-
-            # Now data can be accessed as an array of booleans.
-            # Store data on persistent cache
-            CalendarChecker.cache.put(cacheKey, data.tobytes(), 3600 * 24)
-
-        return data[dtime.hour * 60 + dtime.minute]
+        return self.compiled(dtime).check(dtime)
 
     def nextEvent(self, checkFrom=None, startEvent=True, offset=None):
         """
         Returns next event for this interval
-        Returns a list of two elements. First is datetime of event begining, second is timedelta of duration
+        Looks for it on the compiled window of checkFrom and the following one, and if not found there, uses the rules
         """
         logger.debug('Obtaining nextEvent')
         if checkFrom is None:
@@ -170,21 +215,23 @@ class CalendarChecker(object):
         if offset is None:
             offset = datetime.timedelta(minutes=0)
 
-        cacheKey = six.text_type(hash(self.calendar.modified)) + self.calendar.uuid + six.text_type(
-            offset.seconds) + six.text_type(int(time.mktime(checkFrom.timetuple()))) + 'event' + (
-                       'x' if startEvent is True else '_')
-        next_event = CalendarChecker.cache.get(cacheKey, None)
+        # We substract on checkin, so we can take into account for next execution the "offset" on start & end (just the inverse of current, so we substract it)
+        checkFrom += offset
+
+        next_event = None
+        compiled = self.compiled(checkFrom)
+        if compiled.exactEvents:
+            next_event = compiled.nextEvent(checkFrom, startEvent) or self.compiled(compiled.end).nextEvent(checkFrom, startEvent)
+
         if next_event is None:
-            logger.debug('Regenerating cached nextEvent')
-            next_event = self._updateEvents(checkFrom + offset,
-                                            startEvent)  # We substract on checkin, so we can take into account for next execution the "offset" on start & end (just the inverse of current, so we substract it)
-            if next_event is not None:
-                next_event += offset
-            CalendarChecker.cache.put(cacheKey, next_event, 3600)
+            logger.debug('Next event not found on compiled windows')
+            next_event = self._updateEvents(checkFrom, startEvent)
         else:
-            logger.debug('nextEvent cache hit')
             CalendarChecker.hits += 1
 
+        if next_event is not None:
+            next_event += offset
+
         return next_event
 
     def debug(self):
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (c) 2019 Virtual Cable S.L.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright notice,
+#      this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#    * Neither the name of Virtual Cable S.L. nor the names of its contributors
+#      may be used to endorse or promote products derived from this software
+#      without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+@author: Adolfo Gómez, dkmaster at dkmon dot com
+
+Identity map of module instances (providers, services, os managers, publications, ...).
+
+Instantiating a module means unserializing its stored data (and, for services, instantiating its provider), and
+the same records are instantiated a lot of times while processing a request or running a job.
+Inside a scope (a request, a job run or a delayed task run), instances are kept by record (model and pk) and
+the data they were created from, so a record is only instantiated again if its data changes.
+
+A process wide cache (shared by all threads, so modules must be thread safe) can also be enabled setting
+InstanceCache.shared to True. Its entries are invalidated when records are saved or deleted.
+"""
+import contextlib
+import threading
+import logging
+
+from django.db.models.signals import post_save, post_delete
+
+logger = logging.getLogger(__name__)
+
+
+class InstanceCache(object):
+    shared = False
+
+    _local = threading.local()
+    _shared = {}
+    _lock = threading.Lock()
+
+    # Counters, for performance checking
+    hits = 0
+    misses = 0
+
+    @staticmethod
+    @contextlib.contextmanager
+    def scope():
+        """
+        Context manager that keeps instances until it ends.
+        Nested scopes are the outermost one.
+        """
+        if getattr(InstanceCache._local, 'instances', None) is not None:
+            yield
+            return
+        InstanceCache._local.instances = {}
+        try:
+            yield
+        finally:
+            InstanceCache._local.instances = None
+
+    @staticmethod
+    def get(record, key, factory):
+        """
+        Returns the instance of record for key (the values the instance is created from, data at least),
+        or creates it using factory if it is not cached
+        """
+        recordKey = (record._meta.label, record.pk)
+        instances = getattr(InstanceCache._local, 'instances', None)
+        if instances is not None:
+            cached = instances.get(recordKey)
+            if cached is not None and cached[0] == key:
+                InstanceCache.hits += 1
+                return cached[1]
+
+        cached = InstanceCache._shared.get(recordKey) if InstanceCache.shared else None
+        if cached is not None and cached[0] == key:
+            InstanceCache.hits += 1
+        else:
+            InstanceCache.misses += 1
+            cached = (key, factory())
+            if InstanceCache.shared:
+                with InstanceCache._lock:
+                    InstanceCache._shared[recordKey] = cached
+
+        if instances is not None:
+            instances[recordKey] = cached
+        return cached[1]
+
+    @staticmethod
+    def invalidate(record):
+        """
+        Removes the instance of record from the cache of current scope and the process wide one
+        """
+        recordKey = (record._meta.label, record.pk)
+        instances = getattr(InstanceCache._local, 'instances', None)
+        if instances is not None:
+            instances.pop(recordKey, None)
+        if InstanceCache._shared:
+            with InstanceCache._lock:
+                InstanceCache._shared.pop(recordKey, None)
+
+    @staticmethod
+    def clear():
+        with InstanceCache._lock:
+            InstanceCache._shared.clear()
+
+
+def _invalidateInstance(sender, instance, **kwargs):
+    if getattr(instance, 'cachedInstances', False):
+        InstanceCache.invalidate(instance)
+
+
+post_save.connect(_invalidateInstance, dispatch_uid='uds.instancecache.save')
+post_delete.connect(_invalidateInstance, dispatch_uid='uds.instancecache.delete')
@@ -32,6 +32,7 @@
 """
 from __future__ import unicode_literals
 import re
+import ipaddress
 import six
 import logging
 
@@ -47,10 +48,37 @@ reRange = re.compile(r'^([0-9]{1,3})\.([0-9]{1,3})\.([0-9]{1,3})\.([0-9]{1,3})-(
 reHost = re.compile(r'^([0-9]{1,3})\.([0-9]{1,3})\.([0-9]{1,3})\.([0-9]{1,3})$')
 
 
+def ipVersion(ipOrNetwork):
+    """
+    Returns the ip version (4 or 6) of an ip or network string
+    """
+    return 6 if ':' in ipOrNetwork else 4
+
+
+def ipToLongAndVersion(ip):
+    """
+    convert an IPv4 (dotted quad) or IPv6 string to a tuple (long integer, version)
+    IPv4 mapped IPv6 addresses (::ffff:A.B.C.D) are returned as IPv4 addresses
+    """
+    try:
+        if ':' in ip:
+            addr = ipaddress.IPv6Address(six.text_type(ip))
+            if addr.ipv4_mapped is not None:
+                return int(addr.ipv4_mapped), 4
+            return int(addr), 6
+        return ipToLong(ip), 4
+    except Exception as e:
+        logger.error('Ivalid value: {}'.format(e))
+        return 0, 4  # Invalid values will map to "0.0.0.0" --> 0
+
+
 def ipToLong(ip):
     """
     convert decimal dotted quad string to long integer
+    IPv6 addresses are also accepted (use ipToLongAndVersion to know which one was it)
     """
+    if ':' in ip:
+        return ipToLongAndVersion(ip)[0]
     try:
         hexn = int(''.join(["%02X" % int(i) for i in ip.split('.')]), 16)
         logger.debug('IP {} is {}'.format(ip, hexn))
@@ -60,10 +88,15 @@ def ipToLong(ip):
         return 0  # Invalid values will map to "0.0.0.0" --> 0
 
 
-def longToIp(n):
+def longToIp(n, version=4):
     """
-    convert long int to dotted quad string
+    convert long int to dotted quad string (or to IPv6 string if version is 6)
     """
+    if version == 6:
+        try:
+            return six.text_type(ipaddress.IPv6Address(n))
+        except Exception:
+            return '::'
     try:
         d = 1 << 24
         q = []
@@ -77,6 +110,24 @@ def longToIp(n):
         return '0.0.0.0'  # Invalid values will map to "0.0.0.0"
 
 
+def ipv6NetworkFromString(strNet):
+    """
+    Parses an IPv6 network in this forms:
+      - X:X::X/N (i.e. fe80::/10)
+      - X:X::X - Y:Y::Y (i.e. 2001:db8::1-2001:db8::ff)
+      - X:X::X
+    Returns a tuple (start, end, 6)
+    """
+    strNet = six.text_type(strNet)
+    if '-' in strNet:
+        start, end = (int(ipaddress.IPv6Address(v)) for v in strNet.split('-', 1))
+        if end < start:
+            raise ValueError(strNet)
+        return start, end, 6
+    network = ipaddress.IPv6Network(strNet, strict=False)
+    return int(network.network_address), int(network.broadcast_address), 6
+
+
 def networksFromString(strNets, allowMultipleNetworks=True):
     """
     Parses the network from strings in this forms:
@@ -87,8 +138,11 @@ def networksFromString(strNets, allowMultipleNetworks=True):
       - A.B.C.D netmask X.X.X.X (i.e. 192.168.0.0 netmask 255.255.255.0)
       - A.B.C.D - E.F.G.D (i.e. 192-168.0.0-192.168.0.255)
       - A.B.C.D
+      - IPv6 networks, in the forms accepted by ipv6NetworkFromString
     If allowMultipleNetworks is True, it allows ',' and ';' separators (and, ofc, more than 1 network)
-    Returns a list of networks tuples in the form [(start1, end1), (start2, end2) ...]
+    Returns a list of networks tuples in the form [(start1, end1, version1), (start2, end2, version2) ...]
+    (or a single tuple if allowMultipleNetworks is False)
+    "*" is any IPv4 address, or any IPv4 or IPv6 address if allowMultipleNetworks is True
     """
 
     inputString = strNets
@@ -116,6 +170,8 @@ def networksFromString(strNets, allowMultipleNetworks=True):
     if allowMultipleNetworks is True:
         res = []
         for strNet in re.split('[;,]', strNets):
+            if strNet.strip() == '*':
+                res.append((0, 2 ** 128 - 1, 6))
             if strNet != '':
                 res.append(networksFromString(strNet, False))
         return res
@@ -123,9 +179,13 @@ def networksFromString(strNets, allowMultipleNetworks=True):
     strNets = strNets.replace(' ', '')
 
     if strNets == '*':
-        return 0, 4294967295
+        return 0, 4294967295, 4
 
     try:
+        if ':' in strNets:
+            logger.debug('Format is IPv6')
+            return ipv6NetworkFromString(strNets)
+
         # Test patterns
         m = reCIDR.match(strNets)
         if m is not None:
@@ -137,7 +197,7 @@ def networksFromString(strNets, allowMultipleNetworks=True):
             val = toNum(*m.groups())
             bits = maskFromBits(bits)
             noBits = ~bits & 0xffffffff
-            return val & bits, val | noBits
+            return val & bits, val | noBits, 4
 
         m = reMask.match(strNets)
         if m is not None:
@@ -146,7 +206,7 @@ def networksFromString(strNets, allowMultipleNetworks=True):
             val = toNum(*(m.groups()[0:4]))
             bits = toNum(*(m.groups()[4:8]))
             noBits = ~bits & 0xffffffff
-            return val & bits, val | noBits
+            return val & bits, val | noBits, 4
 
         m = reRange.match(strNets)
         if m is not None:
@@ -156,14 +216,14 @@ def networksFromString(strNets, allowMultipleNetworks=True):
             val2 = toNum(*(m.groups()[4:8]))
             if val2 < val:
                 raise Exception()
-            return val, val2
+            return val, val2, 4
 
         m = reHost.match(strNets)
         if m is not None:
             logger.debug('Format is a single host')
             check(*m.groups())
             val = toNum(*m.groups())
-            return val, val
+            return val, val, 4
 
         for v in ((re1Asterisk, 3), (re2Asterisk, 2), (re3Asterisk, 1)):
             m = v[0].match(strNets)
@@ -172,7 +232,7 @@ def networksFromString(strNets, allowMultipleNetworks=True):
                 val = toNum(*(m.groups()[0:v[1] + 1]))
                 bits = maskFromBits(v[1] * 8)
                 noBits = ~bits & 0xffffffff
-                return val & bits, val | noBits
+                return val & bits, val | noBits, 4
 
         # No pattern recognized, invalid network
         raise Exception()
@@ -182,12 +242,16 @@ def networksFromString(strNets, allowMultipleNetworks=True):
 
 
 def ipInNetwork(ip, network):
+    """
+    Checks if ip (string, or (long, version) tuple) is inside any of the networks (string or list of networks tuples)
+    """
     if isinstance(ip, six.string_types):
-        ip = ipToLong(ip)
+        ip = ipToLongAndVersion(ip)
     if isinstance(network, six.string_types):
         network = networksFromString(network)
 
+    ip, version = ip
     for net in network:
-        if net[0] <= ip <= net[1]:
+        if net[2] == version and net[0] <= ip <= net[1]:
             return True
     return False
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (c) 2012 Virtual Cable S.L.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright notice,
+#      this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#    * Neither the name of Virtual Cable S.L. nor the names of its contributors
+#      may be used to endorse or promote products derived from this software
+#      without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+@author: Adolfo Gómez, dkmaster at dkmon dot com
+"""
+from __future__ import unicode_literals
+
+import bisect
+import threading
+import uuid
+import logging
+
+from django.db.models import signals
+
+from uds.models import Network, Transport
+from uds.core.util.Cache import Cache
+from uds.core.util import net
+
+logger = logging.getLogger(__name__)
+
+
+class NetworkIndex(object):
+    """
+    In-memory index of networks ranges and transports networks, so ip checks do not need to access database.
+
+    Ranges of every ip version are splitted on elementary segments (between consecutive range limits), each one
+    keeping the set of networks that contains it, so looking for the networks of an ip is a binary search.
+
+    The index is rebuilt when networks or transports-networks links change. The change is signaled (for all servers)
+    using a marker stored on cache, that is checked (from the local part of the cache) before using the index.
+    """
+    _index = None
+    _cache = Cache('NetworkIndex')
+    MARKER_VALIDITY = 3600 * 24
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._marker = None
+        self._segments = {}  # Version -> (list of segment starts, list of network ids sets)
+        self._transports = {}  # Transport id -> network ids set
+        self.builds = 0
+
+    @staticmethod
+    def index():
+        """
+        Returns the singleton of the index
+        """
+        if NetworkIndex._index is None:
+            NetworkIndex._index = NetworkIndex()
+        return NetworkIndex._index
+
+    @staticmethod
+    def invalidate(sender=None, **kwargs):
+        """
+        Marks the index as outdated (on all servers)
+        """
+        NetworkIndex._cache.put('marker', uuid.uuid4().hex, NetworkIndex.MARKER_VALIDITY)
+
+    @staticmethod
+    def segments(ranges):
+        """
+        Splits a list of (start, end, networkId) ranges on sorted elementary segments
+        Returns a tuple (segment starts, network ids sets), where set[i] contains the networks of ips in [start[i], start[i+1])
+        """
+        events = {}
+        for start, end, netId in ranges:
+            events.setdefault(start, ([], []))[0].append(netId)
+            events.setdefault(end + 1, ([], []))[1].append(netId)
+
+        starts, sets = [], []
+        active = set()
+        for point in sorted(events):
+            added, removed = events[point]
+            active.difference_update(removed)
+            active.update(added)
+            starts.append(point)
+            sets.append(frozenset(active))
+        return starts, sets
+
+    def _build(self):
+        ranges = {}
+        for netId, start, end, version in Network.objects.values_list('id', 'net_start', 'net_end', 'version'):
+            ranges.setdefault(version, []).append((int(start, 16), int(end, 16), netId))
+
+        transports = {}
+        for transportId, netId in Network.transports.through.objects.values_list('transport_id', 'network_id'):
+            transports.setdefault(transportId, set()).add(netId)
+
+        self._segments = {version: NetworkIndex.segments(r) for version, r in ranges.items()}
+        self._transports = {k: frozenset(v) for k, v in transports.items()}
+        self.builds += 1
+        logger.debug('Network index rebuilt: %s networks, %s transports', sum(len(r) for r in ranges.values()), len(transports))
+
+    def _check(self):
+        marker = NetworkIndex._cache.get('marker')
+        if marker is None:
+            marker = uuid.uuid4().hex
+            NetworkIndex._cache.put('marker', marker, NetworkIndex.MARKER_VALIDITY)
+        if marker != self._marker:
+            with self._lock:
+                if marker != self._marker:
+                    self._build()
+                    self._marker = marker
+
+    def networksFor(self, ip):
+        """
+        Returns the set of network ids that contains the ip (IPv4 dotted quad or IPv6)
+        """
+        self._check()
+        value, version = net.ipToLongAndVersion(ip)
+        starts, sets = self._segments.get(version, ((), ()))
+        pos = bisect.bisect_right(starts, value) - 1
+        return sets[pos] if pos >= 0 else frozenset()
+
+    def transportValidForIp(self, transport, ip):
+        """
+        Same logic as Transport.validForIp, using the index
+        """
+        self._check()
+        transportNets = self._transports.get(transport.id)
+        if not transportNets:
+            return True
+        inside = not transportNets.isdisjoint(self.networksFor(ip))
+        return inside if transport.nets_positive else not inside
+
+
+signals.post_save.connect(NetworkIndex.invalidate, sender=Network, dispatch_uid='netindex-save')
+signals.post_delete.connect(NetworkIndex.invalidate, sender=Network, dispatch_uid='netindex-delete')
+signals.post_delete.connect(NetworkIndex.invalidate, sender=Transport, dispatch_uid='netindex-transport-delete')
+signals.m2m_changed.connect(NetworkIndex.invalidate, sender=Network.transports.through, dispatch_uid='netindex-m2m')
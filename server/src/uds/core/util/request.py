@@ -33,6 +33,7 @@ from __future__ import unicode_literals
 
 from uds.core.util import OsDetector
 from uds.core.util.Config import GlobalConfig
+from uds.core.util.instances import InstanceCache
 from uds.core.auths.auth import ROOT_ID, USER_KEY, getRootUser
 from uds.models import User
 
@@ -91,7 +92,9 @@ class GlobalRequestMiddleware(object):
     def __call__(self, request):
         self._process_request(request)
 
-        response = self.get_response(request)
+        # Module instances are shared while processing the request
+        with InstanceCache.scope():
+            response = self.get_response(request)
 
         return self._process_response(request, response)
 
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (c) 2019 Virtual Cable S.L.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright notice,
+#      this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#    * Neither the name of Virtual Cable S.L. nor the names of its contributors
+#      may be used to endorse or promote products derived from this software
+#      without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+@author: Adolfo Gómez, dkmaster at dkmon dot com
+
+Compact binary serialization for modules and forms data.
+
+Serialized data is a header (MAGIC + format version) followed by a single encoded value.
+Every value is encoded as a one byte tag followed by its data, using varints for integers and sizes,
+so scalars and lists of strings (most of modules data) are processed without intermediate objects.
+Values of other types are pickled.
+
+Data not starting with MAGIC is "legacy" data, and must be processed by caller as before.
+"""
+import struct
+import pickle
+
+MAGIC = b'\x00UDS'
+VERSION = 1
+HEADER = MAGIC + bytes((VERSION,))
+
+(
+    TAG_NONE, TAG_TRUE, TAG_FALSE, TAG_INT, TAG_NEGINT, TAG_FLOAT,
+    TAG_STR, TAG_BYTES, TAG_LIST, TAG_TUPLE, TAG_DICT, TAG_PICKLE
+) = range(12)
+
+_double = struct.Struct('<d')
+
+
+def _varint(n, out):
+    while n > 0x7f:
+        out.append((n & 0x7f) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def _encodeInt(value, out):
+    if value < 0:
+        out.append(TAG_NEGINT)
+        value = -value
+    else:
+        out.append(TAG_INT)
+    _varint(value, out)
+
+
+def _encodeFloat(value, out):
+    out.append(TAG_FLOAT)
+    out += _double.pack(value)
+
+
+def _encodeRaw(tag, value, out):
+    out.append(tag)
+    _varint(len(value), out)
+    out += value
+
+
+def _encodeSequence(tag):
+    def encode(value, out):
+        out.append(tag)
+        _varint(len(value), out)
+        for v in value:
+            _encode(v, out)
+    return encode
+
+
+def _encodeDict(value, out):
+    out.append(TAG_DICT)
+    _varint(len(value), out)
+    for k, v in value.items():
+        _encode(k, out)
+        _encode(v, out)
+
+
+_encoders = {
+    type(None): lambda value, out: out.append(TAG_NONE),
+    bool: lambda value, out: out.append(TAG_TRUE if value else TAG_FALSE),
+    int: _encodeInt,
+    float: _encodeFloat,
+    str: lambda value, out: _encodeRaw(TAG_STR, value.encode('utf8'), out),
+    bytes: lambda value, out: _encodeRaw(TAG_BYTES, value, out),
+    list: _encodeSequence(TAG_LIST),
+    tuple: _encodeSequence(TAG_TUPLE),
+    dict: _encodeDict,
+}
+
+
+def _encode(value, out):
+    encoder = _encoders.get(type(value))
+    if encoder is not None:
+        encoder(value, out)
+    else:
+        _encodeRaw(TAG_PICKLE, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), out)
+
+
+def _readVarint(data, pos):
+    n = shift = 0
+    while True:
+        b = data[pos]
+        pos += 1
+        n |= (b & 0x7f) << shift
+        if b < 0x80:
+            return n, pos
+        shift += 7
+
+
+def _decode(data, pos):
+    """
+    Decodes the value at pos, returning (value, position after it)
+    data is a memoryview, so strings are decoded directly from the original buffer
+    """
+    tag = data[pos]
+    pos += 1
+    if tag == TAG_STR:
+        size, pos = _readVarint(data, pos)
+        return str(data[pos:pos + size], 'utf8'), pos + size
+    if tag == TAG_INT:
+        return _readVarint(data, pos)
+    if tag == TAG_LIST or tag == TAG_TUPLE:
+        size, pos = _readVarint(data, pos)
+        result = []
+        for _ in range(size):
+            value, pos = _decode(data, pos)
+            result.append(value)
+        return (result if tag == TAG_LIST else tuple(result)), pos
+    if tag == TAG_DICT:
+        size, pos = _readVarint(data, pos)
+        result = {}
+        for _ in range(size):
+            key, pos = _decode(data, pos)
+            result[key], pos = _decode(data, pos)
+        return result, pos
+    if tag == TAG_NONE:
+        return None, pos
+    if tag == TAG_TRUE:
+        return True, pos
+    if tag == TAG_FALSE:
+        return False, pos
+    if tag == TAG_NEGINT:
+        value, pos = _readVarint(data, pos)
+        return -value, pos
+    if tag == TAG_FLOAT:
+        return _double.unpack_from(data, pos)[0], pos + _double.size
+    if tag == TAG_BYTES or tag == TAG_PICKLE:
+        size, pos = _readVarint(data, pos)
+        value = data[pos:pos + size]
+        return (value.tobytes() if tag == TAG_BYTES else pickle.loads(value)), pos + size
+    raise ValueError('Invalid serialized data (tag {} at {})'.format(tag, pos - 1))
+
+
+def isSerialized(data):
+    """
+    Returns True if data has been serialized with this module (so, it is not legacy data)
+    """
+    return data[:len(MAGIC)] == MAGIC
+
+
+def dumps(value):
+    """
+    Serializes value, returning bytes
+    """
+    out = bytearray(HEADER)
+    _encode(value, out)
+    return bytes(out)
+
+
+def loads(data):
+    """
+    Unserializes data generated by dumps.
+    Raises ValueError if data is not a serialized value of a known version
+    """
+    data = memoryview(data)
+    if data[:len(MAGIC)] != MAGIC or len(data) <= len(HEADER):
+        raise ValueError('Not serialized data')
+    if data[len(MAGIC)] > VERSION:
+        raise ValueError('Unsupported serialization version {}'.format(data[len(MAGIC)]))
+    return _decode(data, len(HEADER))[0]
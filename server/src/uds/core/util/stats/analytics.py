@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2013 Virtual Cable S.L.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright notice,
+#      this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#    * Neither the name of Virtual Cable S.L. nor the names of its contributors
+#      may be used to endorse or promote products derived from this software
+#      without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+@author: Adolfo Gómez, dkmaster at dkmon dot com
+
+Columnar analytics over event stats.
+
+Events are read once (streaming rows from database) into numpy arrays, and reports compute
+sessions, histograms and heatmaps over them with vectorized operations instead of per row python code
+or per interval queries.
+"""
+from __future__ import unicode_literals
+
+import array
+import datetime
+
+import numpy as np
+
+from uds.core.managers import statsManager
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 10000  # Rows fetched from database at once
+
+# Fields that are stored as numbers. Anything else (fld1..fld4 or its aliases) is a string stored as categories
+NUMERIC_FIELDS = ('stamp', 'owner_id', 'event_type')
+
+
+class EventColumns(object):
+    """
+    Events as columns. Numeric fields are numpy int64 arrays. String fields are numpy int arrays
+    of codes, with the strings of every code on labels[field]
+    """
+
+    def __init__(self, columns, labels):
+        self.columns = columns
+        self.labels = labels
+
+    def __getitem__(self, field):
+        return self.columns[field]
+
+    def __len__(self):
+        return len(self.columns['stamp'])
+
+    def select(self, mask):
+        """
+        Returns the events selected by mask (boolean array)
+        """
+        return EventColumns({k: v[mask] for k, v in self.columns.items()}, self.labels)
+
+
+def loadEvents(ownerType, eventType, fields, **kwargs):
+    """
+    Loads the events (filtered same way as StatsManager.getEvents) as columns, streaming rows from database
+
+    Args:
+        ownerType: owner type (or list of them)
+        eventType: event type (or list of them)
+        fields: Fields to load (stamp is always loaded). Aliases as 'username', 'srcip'... are accepted
+
+    Returns:
+        An EventColumns instance, sorted by stamp
+    """
+    mgr = statsManager()
+    fields = ['stamp'] + [f for f in fields if f != 'stamp']
+    dbFields = [f if f in NUMERIC_FIELDS else mgr.getEventFldFor(f) or f for f in fields]
+
+    data = [array.array('q') for _ in fields]
+    categories = [None if f in NUMERIC_FIELDS else {} for f in fields]
+
+    rows = mgr.getEvents(ownerType, eventType, **kwargs).order_by('stamp').values_list(*dbFields)
+    for row in rows.iterator(chunk_size=CHUNK_SIZE):
+        for i, value in enumerate(row):
+            cat = categories[i]
+            if cat is not None:
+                value = cat.setdefault(value, len(cat))
+            data[i].append(value)
+
+    columns = {}
+    labels = {}
+    for i, f in enumerate(fields):
+        columns[f] = np.frombuffer(data[i], dtype=np.int64) if data[i] else np.zeros(0, dtype=np.int64)
+        if categories[i] is not None:
+            labels[f] = sorted(categories[i], key=categories[i].get)
+
+    logger.debug('Loaded %s events with fields %s', len(columns['stamp']), fields)
+    return EventColumns(columns, labels)
+
+
+def sessions(stamps, eventTypes, users, loginType, logoutType):
+    """
+    Pairs logins and logouts of users, as sequential processing would do: a logout closes the session
+    opened by the last login of the same user, if it's still open (that is, the previous event of the user is a login).
+    Events must be sorted by stamp.
+
+    Returns:
+        Tuple (users, login stamps, durations) of every session
+    """
+    if len(stamps) == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty
+
+    order = np.lexsort((np.arange(len(stamps)), users))  # By user, keeping stamp order on every user (stable)
+    u, s, t = users[order], stamps[order], eventTypes[order]
+    closes = (t[1:] == logoutType) & (t[:-1] == loginType) & (u[1:] == u[:-1])
+    starts = s[:-1][closes]
+    return u[1:][closes], starts, s[1:][closes] - starts
+
+
+def sessionsByUser(stamps, eventTypes, users, loginType, logoutType, numUsers):
+    """
+    Returns (number of sessions, total time) arrays, indexed by user code
+    """
+    u, _, durations = sessions(stamps, eventTypes, users, loginType, logoutType)
+    return np.bincount(u, minlength=numUsers), np.bincount(u, weights=durations, minlength=numUsers)
+
+
+def intervalBounds(intervals):
+    """
+    Converts a list of consecutive (start, end) intervals to a bounds array
+    """
+    return np.array([i[0] for i in intervals] + [intervals[-1][1]], dtype=np.int64)
+
+
+def histogram(stamps, bounds):
+    """
+    Returns the number of events on every interval [bounds[i], bounds[i+1]). Stamps must be sorted
+    """
+    return np.diff(np.searchsorted(stamps, bounds, side='left'))
+
+
+def distinctByInterval(stamps, codes, bounds):
+    """
+    Returns the number of distinct codes (i.e. users) on every interval [bounds[i], bounds[i+1]). Stamps must be sorted
+    """
+    numIntervals = len(bounds) - 1
+    bins = np.searchsorted(bounds, stamps, side='right') - 1
+    valid = (bins >= 0) & (bins < numIntervals)
+    if not valid.any():
+        return np.zeros(numIntervals, dtype=np.int64)
+    pairs = np.unique(bins[valid] * (int(codes.max()) + 1) + codes[valid])
+    return np.bincount(pairs // (int(codes.max()) + 1), minlength=numIntervals)
+
+
+def weekHourHeatmap(stamps):
+    """
+    Returns a 7x24 array with the number of events on every (local time) weekday (0 is monday) and hour
+    Local time is resolved once per quarter of hour (all timezones offsets are multiple of it)
+    """
+    heatmap = np.zeros((7, 24), dtype=np.int64)
+    if len(stamps) == 0:
+        return heatmap
+    quarters, inverse = np.unique(stamps // 900, return_inverse=True)
+    cells = np.array([
+        (lambda d: d.weekday() * 24 + d.hour)(datetime.datetime.fromtimestamp(int(q) * 900)) for q in quarters
+    ], dtype=np.int64)
+    heatmap += np.bincount(cells[inverse], minlength=7 * 24).reshape(7, 24)
+    return heatmap
@@ -37,8 +37,9 @@ from django.db.models import Q
 from uds.core.util.Config import GlobalConfig
 from uds.core.util.State import State
 from uds.core.managers.UserServiceManager import UserServiceManager
+from uds.core.managers.userservice.governor import ProviderGovernor
 from uds.core.services.Exceptions import MaxServicesReachedError
-from uds.models import DeployedService
+from uds.models import DeployedService, DeployedServicePublication
 from uds.core import services
 from uds.core.util import log
 from uds.core.jobs.Job import Job
@@ -53,6 +54,9 @@ class ServiceCacheUpdater(Job):
     We only process items that are "cacheables", to speed up process we will use the fact that initialServices = preparedServices = maxServices = 0
     if cache is not needed.
     This is included as a scheduled task that will run every X seconds, and scheduler will keep it so it will be only executed by one backend at a time
+
+    Counters of all service pools are obtained with a few grouped queries, and up to CACHE_OPERATIONS_PER_POOL cache
+    creations or removals are done per service pool on each run, within the preparing limits of each provider.
     """
     frecuency = 19
     frecuency_cfg = GlobalConfig.CACHE_CHECK_DELAY  # Request run cache manager every configured seconds (defaults to 20 seconds).
@@ -71,37 +75,60 @@ class ServiceCacheUpdater(Job):
         log.doLog(deployedService, log.WARN, 'Service Pool is restrained due to errors', log.INTERNAL)
         logger.info(' {0} is restrained, will check this later'.format(deployedService.name))
 
+    @staticmethod
+    def __count(counters, level):
+        return sum(v for (cacheLevel, _), v in counters.items() if cacheLevel == level)
+
+    def providerBudget(self, sp):
+        """
+        Returns the number of user services that the provider of this service pool can still start
+        (None if the provider ignores limits)
+        """
+        return ProviderGovernor.governor().available(sp, State.PREPARING)
+
+    def consumeBudget(self, sp):
+        """
+        Checks that the provider of this service pool has a free starting slot.
+        Slot is acquired by the provider governor when the new user service is created
+        """
+        return ProviderGovernor.governor().canStart(sp)
+
     def servicesPoolsNeedingCacheUpdate(self):
         # State filter for cached and inAssigned objects
         # First we get all deployed services that could need cache generation
-        DeployedService.objects.update()
         # We start filtering out the deployed services that do not need caching at all.
-        whichNeedsCaching = DeployedService.objects.filter(Q(initial_srvs__gte=0) | Q(cache_l1_srvs__gte=0)).filter(max_srvs__gt=0, state=State.ACTIVE,
-                                                                                                                    service__provider__maintenance_mode=False)[:]
+        whichNeedsCaching = list(DeployedService.objects.filter(Q(initial_srvs__gte=0) | Q(cache_l1_srvs__gte=0)).filter(max_srvs__gt=0, state=State.ACTIVE,
+                                                                                                                         service__provider__maintenance_mode=False).select_related('service', 'service__provider'))
+        ids = [sp.id for sp in whichNeedsCaching]
+
+        # Data needed for all service pools is obtained using grouped queries
+        counters = UserServiceManager.getCountersByPool(ids)
+        restrained = set(DeployedService.getRestraineds().values_list('id', flat=True))
+        withPublication, publishing = set(), set()
+        for spId, state in DeployedServicePublication.objects.filter(deployed_service_id__in=ids, state__in=(State.USABLE, State.PREPARING)).values_list('deployed_service_id', 'state'):
+            (withPublication if state == State.USABLE else publishing).add(spId)
 
         # We will get the one that proportionally needs more cache
         servicesPools = []
         for sp in whichNeedsCaching:
-            sp.userServices.update()  # Cleans cached queries
             # If this deployedService don't have a publication active and needs it, ignore it
-            spServiceInstance = sp.service.getInstance()
-
-            if sp.activePublication() is None and spServiceInstance.publicationType is not None:
+            if sp.id not in withPublication and sp.service.getType().publicationType is not None:
                 logger.debug('{} Needs publication but do not have one, cache test ignored'.format(sp))
                 continue
             # If it has any running publication, do not generate cache anymore
-            if sp.publications.filter(state=State.PREPARING).count() > 0:
+            if sp.id in publishing:
                 logger.debug('Stopped cache generation for deployed service with publication running: {0}'.format(sp))
                 continue
 
-            if sp.isRestrained():
+            if sp.id in restrained:
                 ServiceCacheUpdater.__notifyRestrain(sp)
                 continue
 
             # Get data related to actual state of cache
-            inCacheL1 = sp.cachedUserServices().filter(UserServiceManager.getCacheStateFilter(services.UserDeployment.L1_CACHE)).count()
-            inCacheL2 = sp.cachedUserServices().filter(UserServiceManager.getCacheStateFilter(services.UserDeployment.L2_CACHE)).count()
-            inAssigned = sp.assignedUserServices().filter(UserServiceManager.getStateFilter()).count()
+            spCounters = counters.get(sp.id, {})
+            inCacheL1 = ServiceCacheUpdater.__count(spCounters, services.UserDeployment.L1_CACHE)
+            inCacheL2 = ServiceCacheUpdater.__count(spCounters, services.UserDeployment.L2_CACHE)
+            inAssigned = ServiceCacheUpdater.__count(spCounters, 0)
             # if we bypasses max cache, we will reduce it in first place. This is so because this will free resources on service provider
             logger.debug("Examining {0} with {1} in cache L1 and {2} in cache L2, {3} inAssigned".format(
                          sp, inCacheL1, inCacheL2, inAssigned))
@@ -125,7 +152,8 @@ class ServiceCacheUpdater(Job):
                 continue
 
             # If this service don't allows more starting user services, continue
-            if UserServiceManager.manager().canInitiateServiceFromDeployedService(sp) is False:
+            budget = self.providerBudget(sp)
+            if budget is not None and budget <= 0:
                 logger.debug('This provider has the max allowed starting services running: {0}'.format(sp))
                 continue
 
@@ -155,6 +183,8 @@ class ServiceCacheUpdater(Job):
         If for some reason the number of deployed services (Counting all, ACTIVE
         and PREPARING, assigned, L1 and L2) is over max allowed service deployments,
         this method will not grow the L1 cache
+
+        Returns the new (cacheL1, cacheL2, assigned) counters, or None if cache could not be grown
         """
         logger.debug("Growing L1 cache creating a new service for {0}".format(sp))
         # First, we try to assign from L2 cache
@@ -172,14 +202,16 @@ class ServiceCacheUpdater(Job):
 
             if valid is not None:
                 valid.moveToLevel(services.UserDeployment.L1_CACHE)
-                return
+                return cacheL1 + 1, cacheL2 - 1, assigned
         try:
             UserServiceManager.manager().createCacheFor(sp.activePublication(), services.UserDeployment.L1_CACHE)
+            return cacheL1 + 1, cacheL2, assigned
         except MaxServicesReachedError as e:
             log.doLog(sp, log.ERROR, 'Max number of services reached for this service', log.INTERNAL)
             logger.error(str(e))
         except:
             logger.exception('Exception')
+        return None
 
     def growL2Cache(self, sp, cacheL1, cacheL2, assigned):
         """
@@ -188,13 +220,17 @@ class ServiceCacheUpdater(Job):
         If for some reason the number of deployed services (Counting all, ACTIVE
         and PREPARING, assigned, L1 and L2) is over max allowed service deployments,
         this method will not grow the L1 cache
+
+        Returns the new (cacheL1, cacheL2, assigned) counters, or None if cache could not be grown
         """
         logger.debug("Growing L2 cache creating a new service for {0}".format(sp))
         try:
             UserServiceManager.manager().createCacheFor(sp.activePublication(), services.UserDeployment.L2_CACHE)
+            return cacheL1, cacheL2 + 1, assigned
         except MaxServicesReachedError as e:
             logger.error(str(e))
             # TODO: When alerts are ready, notify this
+        return None
 
     def reduceL1Cache(self, sp, cacheL1, cacheL2, assigned):
         logger.debug("Reducing L1 cache erasing a service in cache for {0}".format(sp))
@@ -202,7 +238,7 @@ class ServiceCacheUpdater(Job):
         cacheItems = sp.cachedUserServices().filter(UserServiceManager.getCacheStateFilter(services.UserDeployment.L1_CACHE)).order_by('-creation_date')
         if len(cacheItems) == 0:
             logger.debug('There is more services than configured, but could not reduce cache cause its already empty')
-            return
+            return None
 
         if cacheL2 < sp.cache_l2_srvs:
             valid = None
@@ -217,10 +253,11 @@ class ServiceCacheUpdater(Job):
 
             if valid is not None:
                 valid.moveToLevel(services.UserDeployment.L2_CACHE)
-                return
+                return cacheL1 - 1, cacheL2 + 1, assigned
 
         cache = cacheItems[0]
         cache.removeOrCancel()
+        return cacheL1 - 1, cacheL2, assigned
 
     def reduceL2Cache(self, sp, cacheL1, cacheL2, assigned):
         logger.debug("Reducing L2 cache erasing a service in cache for {0}".format(sp))
@@ -229,31 +266,52 @@ class ServiceCacheUpdater(Job):
             # TODO: Look first for non finished cache items and cancel them
             cache = cacheItems[0]
             cache.removeOrCancel()
+            return cacheL1, cacheL2 - 1, assigned
+        return None
+
+    def nextOperation(self, sp, cacheL1, cacheL2, assigned):
+        """
+        Returns the method that must be invoked next to update cache of service pool, or None if nothing can be done
+        """
+        totalL1Assigned = cacheL1 + assigned
+
+        # We try first to reduce cache before tring to increase it.
+        # This means that if there is excesive number of user deployments
+        # for L1 or L2 cache, this will be reduced untill they have good numbers.
+        # This is so because service can have limited the number of services and,
+        # if we try to increase cache before having reduced whatever needed
+        # first, the service will get lock until someone removes something.
+        if totalL1Assigned > sp.max_srvs:
+            return self.reduceL1Cache
+        elif totalL1Assigned > sp.initial_srvs and cacheL1 > sp.cache_l1_srvs:
+            return self.reduceL1Cache
+        elif cacheL2 > sp.cache_l2_srvs:  # We have excesives L2 items
+            return self.reduceL2Cache
+        elif totalL1Assigned < sp.max_srvs and (totalL1Assigned < sp.initial_srvs or cacheL1 < sp.cache_l1_srvs):  # We need more services
+            return self.growL1Cache
+        elif cacheL2 < sp.cache_l2_srvs:  # We need more L2 items
+            return self.growL2Cache
+        return None
 
     def run(self):
         logger.debug('Starting cache checking')
         # We need to get
         servicesThatNeedsUpdate = self.servicesPoolsNeedingCacheUpdate()
+        operationsPerPool = max(GlobalConfig.CACHE_OPERATIONS_PER_POOL.getInt(), 1)
         for sp, cacheL1, cacheL2, assigned in servicesThatNeedsUpdate:
             # We have cache to update??
             logger.debug("Updating cache for {0}".format(sp))
-            totalL1Assigned = cacheL1 + assigned
-
-            # We try first to reduce cache before tring to increase it.
-            # This means that if there is excesive number of user deployments
-            # for L1 or L2 cache, this will be reduced untill they have good numbers.
-            # This is so because service can have limited the number of services and,
-            # if we try to increase cache before having reduced whatever needed
-            # first, the service will get lock until someone removes something.
-            if totalL1Assigned > sp.max_srvs:
-                self.reduceL1Cache(sp, cacheL1, cacheL2, assigned)
-            elif totalL1Assigned > sp.initial_srvs and cacheL1 > sp.cache_l1_srvs:
-                self.reduceL1Cache(sp, cacheL1, cacheL2, assigned)
-            elif cacheL2 > sp.cache_l2_srvs:  # We have excesives L2 items
-                self.reduceL2Cache(sp, cacheL1, cacheL2, assigned)
-            elif totalL1Assigned < sp.max_srvs and (totalL1Assigned < sp.initial_srvs or cacheL1 < sp.cache_l1_srvs):  # We need more services
-                self.growL1Cache(sp, cacheL1, cacheL2, assigned)
-            elif cacheL2 < sp.cache_l2_srvs:  # We need more L2 items
-                self.growL2Cache(sp, cacheL1, cacheL2, assigned)
-            else:
-                logger.info("We have more services than max requested for {0}, but can't erase any of then cause all of them are already assigned".format(sp))
+            # Several operations can be done for a service pool on each run, as long as the provider has free slots for new services
+            for operation in range(operationsPerPool):
+                nextOperation = self.nextOperation(sp, cacheL1, cacheL2, assigned)
+                if nextOperation is None:
+                    if operation == 0:
+                        logger.info("We have more services than max requested for {0}, but can't erase any of then cause all of them are already assigned".format(sp))
+                    break
+                if nextOperation in (self.growL1Cache, self.growL2Cache) and self.consumeBudget(sp) is False:
+                    logger.debug('This provider has the max allowed starting services running: {0}'.format(sp))
+                    break
+                counters = nextOperation(sp, cacheL1, cacheL2, assigned)
+                if counters is None:
+                    break
+                cacheL1, cacheL2, assigned = counters
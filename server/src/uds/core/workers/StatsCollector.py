@@ -31,7 +31,7 @@
 """
 from __future__ import unicode_literals
 
-from uds.models import DeployedService
+from uds.models import DeployedService, StatsCounters, StatsCountersAccum, getSqlDatetime
 from uds.core.util.State import State
 from uds.core.util.stats import counters
 from uds.core.managers import statsManager
@@ -69,6 +69,53 @@ class DeployedServiceStatsCollector(Job):
         logger.debug('Done Deployed service stats collector')
 
 
+class StatsAccumulator(Job):
+    """
+    This Job keeps hourly and daily rollups of counters up to date.
+    The last accumulated interval (that may be incomplete) is always recomputed, and at most
+    MAX_HOURS hours are accumulated on every run, so a big backlog is processed on several runs.
+    """
+    frecuency = 607  # Once every ten minutes (more or less), 607 is prime
+    friendly_name = 'Statistics accumulator'
+
+    MAX_HOURS = 24 * 7
+
+    def run(self):
+        HOUR, DAY = StatsCountersAccum.HOUR, StatsCountersAccum.DAY
+        now = getSqlDatetime(True)
+
+        stamp = StatsCountersAccum.lastStamp(HOUR)
+        if stamp is None:
+            stamp = StatsCounters.objects.order_by('stamp').values_list('stamp', flat=True).first()
+            if stamp is None:
+                return  # No counters at all
+        stamp -= stamp % HOUR
+        stop = min(now, stamp + StatsAccumulator.MAX_HOURS * HOUR)
+
+        while stamp <= stop:
+            if StatsCountersAccum.accumulate(HOUR, stamp) == 0:
+                # Skip hours without counters
+                nextStamp = StatsCounters.objects.filter(stamp__gte=stamp + HOUR).order_by('stamp').values_list('stamp', flat=True).first()
+                if nextStamp is None:
+                    break
+                stamp = nextStamp - nextStamp % HOUR
+            else:
+                stamp += HOUR
+
+        lastHour = StatsCountersAccum.lastStamp(HOUR)
+        day = StatsCountersAccum.lastStamp(DAY)
+        if day is None:
+            day = StatsCountersAccum.firstStamp(HOUR)
+        if day is None or lastHour is None:
+            return
+        day -= day % DAY
+        while day <= lastHour:
+            StatsCountersAccum.accumulate(DAY, day)
+            day += DAY
+
+        logger.debug('Done statistics accumulation up to %s', lastHour)
+
+
 class StatsCleaner(Job):
     """
     This Job is responsible of housekeeping of stats tables.
@@ -69,7 +69,8 @@ class UserServiceRemover(Job):
     frecuency_cfg = GlobalConfig.REMOVAL_CHECK  # Request run cache "info" cleaner every configued seconds. If config value is changed, it will be used at next reload
     friendly_name = 'User Service Cleaner'
 
-    removeAtOnce = GlobalConfig.USER_SERVICE_CLEAN_NUMBER.getInt()  # Same, it will work at reload
+    # Max number of removables examined per run. Removals are limited by the free removing slots of each provider
+    examineAtOnce = 500
 
     def __init__(self, environment):
         super(UserServiceRemover, self).__init__(environment)
@@ -77,12 +78,19 @@ class UserServiceRemover(Job):
     def run(self):
         with transaction.atomic():
             removeFrom = getSqlDatetime() - timedelta(seconds=10)  # We keep at least 10 seconds the machine before removing it, so we avoid connections errors
-            removables = UserService.objects.filter(state=State.REMOVABLE, state_date__lt=removeFrom,
-                                                    deployed_service__service__provider__maintenance_mode=False)[0:UserServiceRemover.removeAtOnce]
+            removables = list(UserService.objects.filter(state=State.REMOVABLE, state_date__lt=removeFrom,
+                                                         deployed_service__service__provider__maintenance_mode=False).select_related('deployed_service', 'deployed_service__service')[0:UserServiceRemover.examineAtOnce])
+        # Providers with no free removing slots, so we do not check them again on this run
+        saturated = set()
         for us in removables:
+            providerId = us.deployed_service.service.provider_id
+            if providerId in saturated:
+                continue
             logger.debug('Checking removal of {}'.format(us))
             try:
                 if managers.userServiceManager().canRemoveServiceFromDeployedService(us.deployed_service) is True:
                     managers.userServiceManager().remove(us)
+                else:
+                    saturated.add(providerId)
             except Exception:
                 logger.exception('Exception removing user service')
@@ -59,7 +59,7 @@ def guacamole(request, tunnelId):
     tunnelId, scrambler = tunnelId.split('.')
 
     try:
-        val = TicketStore.get(tunnelId, invalidate=False)
+        val = TicketStore.get(tunnelId, invalidate=False, owner=TicketStore.OWNER_TUNNEL)
         val['password'] = cryptoManager().symDecrpyt(val['password'], scrambler)
 
         response = dict2resp(val)
@@ -55,7 +55,7 @@ def pam(request):
             userId = ids[0]
             logger.debug("Auth request for user [{0}] and pass [{1}]".format(request.GET['id'], request.GET['pass']))
             try:
-                password = TicketStore.get(userId)
+                password = TicketStore.get(userId, owner=TicketStore.OWNER_PAM)
                 if password == request.GET['pass']:
                     response = '1'
             except Exception:
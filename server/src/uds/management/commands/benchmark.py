@@ -0,0 +1,379 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (c) 2012-2019 Virtual Cable S.L.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright notice,
+#      this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#    * Neither the name of Virtual Cable S.L. nor the names of its contributors
+#      may be used to endorse or promote products derived from this software
+#      without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+@author: Adolfo Gómez, dkmaster at dkmon dot com
+"""
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from uds.core.util.Config import GlobalConfig
+
+logger = logging.getLogger(__name__)
+
+
+def timeIt(fnc, iterations):
+    """
+    Executes fnc "iterations" times, returning (elapsed seconds, executed queries)
+    """
+    with CaptureQueriesContext(connection) as queries:
+        start = time.perf_counter()
+        for _ in range(iterations):
+            fnc()
+        elapsed = time.perf_counter() - start
+    return elapsed, len(queries)
+
+
+def report(out, name, iterations, elapsed, queries):
+    out.write('{:<40} {:>8} runs {:>10.3f} ms/run {:>8.2f} queries/run\n'.format(
+        name, iterations, elapsed * 1000 / iterations, queries / iterations)
+    )
+
+
+def benchClockSync(out, options):
+    """
+    Database datetime with and without clock synchronization.
+    If a user and a service are provided, also measures queries of a getService (not tested) call
+    """
+    from uds.models.Util import ClockSync, getSqlDatetime
+
+    iterations = options['iterations']
+
+    for enabled in (False, True):
+        ClockSync.enabled = enabled
+        ClockSync.reset()
+        report(out, 'getSqlDatetime ({})'.format('synced' if enabled else 'strict'), iterations, *timeIt(getSqlDatetime, iterations))
+
+    if options['user'] and options['service']:
+        from uds.core.managers import userServiceManager
+        from uds.core.util.OsDetector import DEFAULT_OS
+        from uds.core.util.tools import DictAsObj
+        from uds.models import User
+
+        user = User.objects.get(uuid=options['user'])
+        os = DictAsObj({'OS': DEFAULT_OS, 'Version': '0.0', 'Browser': 'unknown'})
+        getService = lambda: userServiceManager().getService(user, os, options['ip'], options['service'], options['transport'], doTest=False)
+        getService()  # Warm up, so assignation is already done
+
+        results = {}
+        for enabled in (False, True):
+            ClockSync.enabled = enabled
+            ClockSync.reset()
+            results[enabled] = timeIt(getService, iterations)
+            report(out, 'getService ({})'.format('synced' if enabled else 'strict'), iterations, *results[enabled])
+        out.write('Queries saved per getService: {:.2f}\n'.format((results[False][1] - results[True][1]) / iterations))
+
+    ClockSync.enabled = True
+
+
+def benchCalendar(out, options):
+    """
+    Calendar checks using compiled bitmaps, over a temporary calendar with "--rules" random rules (removed at end).
+    Compilation of a window (cold), check and nextEvent (warm), and nextEvent resolved from rules (rrule) are measured
+    """
+    import datetime
+    import random
+    from django.db import transaction
+    from uds.models import Calendar, CalendarRule, getSqlDatetime
+    from uds.core.util.calendar import CalendarChecker
+
+    iterations = options['iterations']
+    now = getSqlDatetime()
+    random.seed(0)
+
+    with transaction.atomic():
+        cal = Calendar.objects.create(name='benchmark calendar', comments='')
+        for i in range(options['rules']):
+            CalendarRule.objects.create(
+                calendar=cal, name='rule {}'.format(i), comments='',
+                start=(now - datetime.timedelta(days=random.randint(0, 365))).replace(hour=random.randint(0, 23), minute=random.randint(0, 59), second=0, microsecond=0),
+                end=None if random.random() < 0.5 else (now + datetime.timedelta(days=random.randint(1, 365))).date(),
+                frequency=random.choice(('DAILY', 'WEEKLY', 'MONTHLY', 'WEEKDAYS')),
+                interval=random.randint(1, 3),
+                duration=random.randint(1, 240), duration_unit='MINUTES'
+            )
+        cal = Calendar.objects.prefetch_related('rules').get(pk=cal.pk)
+        checker = CalendarChecker(cal)
+        dates = [now + datetime.timedelta(minutes=random.randint(0, 60 * 24 * CalendarChecker.WINDOW_DAYS)) for _ in range(iterations)]
+
+        def compileWindow():
+            CalendarChecker._compiled.clear()
+            checker.compiled(now)
+
+        compileRuns = max(iterations // 10, 1)
+        report(out, 'compile {} days window'.format(CalendarChecker.WINDOW_DAYS), compileRuns, *timeIt(compileWindow, compileRuns))
+
+        it = iter(dates)
+        report(out, 'check (compiled)', iterations, *timeIt(lambda: checker.check(next(it)), iterations))
+        it = iter(dates)
+        report(out, 'nextEvent (compiled)', iterations, *timeIt(lambda: checker.nextEvent(next(it)), iterations))
+        it = iter(dates)
+        report(out, 'nextEvent (rules)', iterations, *timeIt(lambda: checker._updateEvents(next(it)), iterations))
+
+        transaction.set_rollback(True)
+
+
+def benchAnalytics(out, options):
+    """
+    Event analytics (sessions pairing, interval histograms and week/hour heatmap) over "--events" synthetic events,
+    using numpy columns versus per event python processing (as reports did before).
+    Only computation is measured (loading events from database is not included)
+    """
+    import datetime
+    import numpy as np
+    from uds.core.util.stats import analytics
+
+    numEvents = options['events']
+    numUsers, days, points = 5000, 90, 32
+    start = int(time.time()) - days * 24 * 3600
+
+    rnd = np.random.RandomState(0)
+    stamps = np.sort(rnd.randint(start, start + days * 24 * 3600, numEvents)).astype(np.int64)
+    eventTypes = rnd.randint(0, 2, numEvents).astype(np.int64)
+    users = rnd.randint(0, numUsers, numEvents).astype(np.int64)
+    bounds = np.linspace(start, start + days * 24 * 3600, points + 1).astype(np.int64)
+    rows = list(zip(stamps.tolist(), eventTypes.tolist(), users.tolist()))
+
+    def pySessions():
+        logins, result = {}, {}
+        for stamp, eventType, user in rows:
+            if eventType == 0:
+                logins[user] = stamp
+            elif user in logins:
+                r = result.setdefault(user, [0, 0])
+                r[0] += 1
+                r[1] += stamp - logins.pop(user)
+
+    def pyHistogram():
+        for i in range(points):
+            selected = [user for stamp, _, user in rows if bounds[i] <= stamp < bounds[i + 1]]
+            len(selected), len(set(selected))
+
+    def pyHeatmap():
+        heatmap = [[0] * 24 for _ in range(7)]
+        for stamp, _, _ in rows:
+            d = datetime.datetime.fromtimestamp(stamp)
+            heatmap[d.weekday()][d.hour] += 1
+
+    for name, pyFnc, npFnc in (
+            ('sessions', pySessions, lambda: analytics.sessionsByUser(stamps, eventTypes, users, 0, 1, numUsers)),
+            ('histogram', pyHistogram, lambda: (analytics.histogram(stamps, bounds), analytics.distinctByInterval(stamps, users, bounds))),
+            ('heatmap', pyHeatmap, lambda: analytics.weekHourHeatmap(stamps))):
+        report(out, '{} (python)'.format(name), 1, *timeIt(pyFnc, 1))
+        report(out, '{} (numpy)'.format(name), 1, *timeIt(npFnc, 1))
+
+
+def benchUniqueIds(out, options):
+    """
+    Unique ids (names and macs) generation of 100 parallel deployments, each one getting "--iterations" names and macs
+    and freeing half of them (as removed services do). Checks also that no id is given twice
+    """
+    import threading
+    from uds.core.util.UniqueIDGenerator import Reservations
+    from uds.core.util.UniqueNameGenerator import UniqueNameGenerator
+    from uds.core.util.UniqueMacGenerator import UniqueMacGenerator
+    from uds.models import UniqueId
+
+    iterations, deployments = options['iterations'], 100
+    baseName, macRange = 'bench-', '52:54:00:F0:00:00-52:54:00:FF:FF:FF'
+    names, macs, errors = [], [], []
+
+    def deploy(n):
+        nameGen, macGen = UniqueNameGenerator('bench{}'.format(n)), UniqueMacGenerator('bench{}'.format(n))
+        try:
+            for i in range(iterations):
+                name, mac = nameGen.get(baseName, 6), macGen.get(macRange)
+                if i % 2:
+                    nameGen.free(baseName, name)
+                    macGen.free(mac)
+                else:
+                    names.append(name)
+                    macs.append(mac)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            connection.close()
+
+    def run():
+        threads = [threading.Thread(target=deploy, args=(n,)) for n in range(deployments)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+    blocks = Reservations.reservations().blocks
+    report(out, 'unique ids ({} deployments)'.format(deployments), deployments * iterations, *timeIt(run, 1))
+    out.write('Reserved blocks: {}, errors: {}, duplicated names: {}, duplicated macs: {}\n'.format(
+        Reservations.reservations().blocks - blocks, len(errors), len(names) - len(set(names)), len(macs) - len(set(macs)))
+    )
+
+    Reservations.reservations().returnAll()
+    UniqueId.objects.filter(owner__startswith='bench').delete()
+    UniqueId.objects.filter(basename=baseName).delete()
+
+
+def benchSerialization(out, options):
+    """
+    Modules serialization: getInstance() and updateData() of the "--userservice" user service, with its data as it is
+    stored (legacy format if saved by a previous version) and after storing it again (binary format).
+    Unserialization of its service form with the legacy (pickle + zip) format versus the binary one is also measured.
+    Note: user service data is stored again (same values, current format)
+    """
+    import pickle
+    from uds.core.util import encoders, serializer
+    from uds.models import UserService
+
+    if not options['userservice']:
+        out.write('This benchmark needs an user service (--userservice)\n')
+        return
+
+    iterations = options['iterations']
+    userService = UserService.objects.get(uuid=options['userservice'])
+
+    for name in ('stored', 'binary'):
+        report(out, 'getInstance ({})'.format(name), iterations, *timeIt(userService.getInstance, iterations))
+        instance = userService.getInstance()
+        report(out, 'updateData ({})'.format(name), iterations, *timeIt(lambda: userService.updateData(instance), iterations))
+
+    service = userService.deployed_service.service.getInstance()
+    form = service.serializeForm()
+    legacy = encoders.encode(b'\002'.join(
+        k.encode('utf8') + b'\003' + (b'\001' + pickle.dumps(v, protocol=0) if isinstance(v, list) else v.encode('utf8'))
+        for k, v in serializer.loads(form).items()
+    ), 'zip')
+    report(out, 'unserializeForm (legacy, {} bytes)'.format(len(legacy)), iterations, *timeIt(lambda: service.unserializeForm(legacy), iterations))
+    report(out, 'unserializeForm (binary, {} bytes)'.format(len(form)), iterations, *timeIt(lambda: service.unserializeForm(form), iterations))
+    report(out, 'serializeForm (binary)', iterations, *timeIt(service.serializeForm, iterations))
+
+
+def benchTickets(out, options):
+    """
+    Tickets: create + get (with invalidation) cycles of a "client" ticket on each TicketStore backend
+    (database, shared by this server processes and memory of this process)
+    """
+    import tempfile
+    import shutil
+    import os
+    from uds.models.TicketStore import TicketStore, DBTicketBackend, SharedTicketBackend, MemoryTicketBackend
+
+    iterations = options['iterations']
+    data = {'service': 'F' + 'a' * 36, 'transport': 'a' * 36, 'user': 'a' * 36}
+    tmpDir = tempfile.mkdtemp()
+    path = os.path.join(tmpDir, 'tickets.sqlite3')
+
+    def cycle():
+        ticket = TicketStore.create(data, owner=TicketStore.OWNER_CLIENT)
+        TicketStore.get(ticket, owner=TicketStore.OWNER_CLIENT)
+
+    saved = TicketStore.backends.get(TicketStore.OWNER_CLIENT)
+    try:
+        for name, backend in (('db', DBTicketBackend()), ('shared', SharedTicketBackend(path)), ('memory', MemoryTicketBackend())):
+            TicketStore.backends[TicketStore.OWNER_CLIENT] = backend
+            report(out, 'create + get ({})'.format(name), iterations, *timeIt(cycle, iterations))
+            backend.cleanup()
+    finally:
+        if saved is None:
+            del TicketStore.backends[TicketStore.OWNER_CLIENT]
+        else:
+            TicketStore.backends[TicketStore.OWNER_CLIENT] = saved
+        shutil.rmtree(tmpDir, ignore_errors=True)
+
+
+def benchRestAuth(out, options):
+    """
+    REST authentication: creation of an authenticated REST handler for the "--user" user (session and user retrieval),
+    without and with the sessions cache. Note: a REST session is created for the user (and removed at end)
+    """
+    from django.contrib.sessions.backends.db import SessionStore
+    from uds.core.util.tools import DictAsObj
+    from uds.models import User
+    from uds.REST.handlers import Handler, SessionCache, AUTH_TOKEN_HEADER
+
+    if not options['user']:
+        out.write('This benchmark needs an user (--user)\n')
+        return
+
+    iterations = options['iterations']
+    user = User.objects.get(uuid=options['user'])
+    session = SessionStore()
+    Handler.storeSessionAuthdata(session, user.manager.id, user.name, '', 'en', {}, user.is_admin, user.staff_member, 'benchmark')
+    session.save()
+    request = DictAsObj(META={AUTH_TOKEN_HEADER: session.session_key})
+
+    try:
+        for enabled in (False, True):
+            SessionCache.enabled = enabled
+            SessionCache.clear()
+            SessionCache.hits = SessionCache.misses = 0
+            report(out, 'Handler ({})'.format('cached' if enabled else 'not cached'), iterations, *timeIt(lambda: Handler(request, [], 'get', {}), iterations))
+        out.write('Sessions cache hit ratio: {:.2%}\n'.format(SessionCache.hitRatio()))
+    finally:
+        SessionCache.clear()
+        session.delete()
+
+
+BENCHMARKS = {
+    'clocksync': benchClockSync,
+    'calendar': benchCalendar,
+    'analytics': benchAnalytics,
+    'uniqueids': benchUniqueIds,
+    'serialization': benchSerialization,
+    'tickets': benchTickets,
+    'restauth': benchRestAuth,
+}
+
+
+class Command(BaseCommand):
+    args = "<benchmark>"
+    help = "Executes UDS micro benchmarks against current database. Available benchmarks: {}".format(', '.join(sorted(BENCHMARKS)))
+
+    def add_arguments(self, parser):
+        parser.add_argument('benchmark', choices=sorted(BENCHMARKS))
+        parser.add_argument('--iterations', type=int, default=100)
+        parser.add_argument('--user', default=None, help='User uuid (for benchmarks that needs an user)')
+        parser.add_argument('--service', default=None, help='Service id, as used on getService (F<pool uuid>, A<userservice uuid> or M<meta uuid>)')
+        parser.add_argument('--transport', default=None, help='Transport uuid')
+        parser.add_argument('--userservice', default=None, help='User service uuid')
+        parser.add_argument('--ip', default='127.0.0.1', help='Source ip')
+        parser.add_argument('--rules', type=int, default=300, help='Number of rules of generated calendars')
+        parser.add_argument('--events', type=int, default=2000000, help='Number of generated events')
+
+    def handle(self, *args, **options):
+        GlobalConfig.initialize()
+        benchmark = BENCHMARKS[options['benchmark']]
+        self.stdout.write('{}\n'.format(benchmark.__doc__.strip()))
+        try:
+            benchmark(self.stdout, options)
+        except Exception as e:
+            self.stdout.write('The benchmark could not be executed: {}\n'.format(e))
+            logger.exception('Executing benchmark %s', options['benchmark'])
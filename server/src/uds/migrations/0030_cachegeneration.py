@@ -0,0 +1,24 @@
+# Generated by Django 2.1.1 on 2019-02-11 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uds', '0029_auto_20181003_1049'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CacheGeneration',
+            fields=[
+                ('owner', models.CharField(max_length=128, primary_key=True, serialize=False)),
+                ('generation', models.BigIntegerField(default=0)),
+                ('stamp', models.DateTimeField(db_index=True)),
+            ],
+            options={
+                'db_table': 'uds_utility_cache_gen',
+            },
+        ),
+    ]
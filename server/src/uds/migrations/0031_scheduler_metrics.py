@@ -0,0 +1,33 @@
+# Generated by Django 2.1.1 on 2019-02-13 10:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uds', '0030_cachegeneration'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scheduler',
+            name='executions',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='scheduler',
+            name='last_duration',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='scheduler',
+            name='total_duration',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='scheduler',
+            name='overruns',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 2.1.1 on 2019-02-15 09:12
+
+from django.db import migrations, models
+
+
+def hexlifyLimits(apps, schema_editor):
+    """
+    Converts stored network limits (decimal numbers after column type change) to zero padded hex strings
+    """
+    from uds.core.util import net
+    Network = apps.get_model('uds', 'Network')
+    for n in Network.objects.all():
+        try:
+            start, end, version = net.networksFromString(n.net_string, False)
+        except Exception:
+            start, end, version = int(n.net_start), int(n.net_end), 4
+        n.net_start = '{:032x}'.format(start)
+        n.net_end = '{:032x}'.format(end)
+        n.version = version
+        n.save(update_fields=['net_start', 'net_end', 'version'])
+
+
+def unhexlifyLimits(apps, schema_editor):
+    """
+    Restores decimal limits, dropping the networks that can't be represented (IPv6)
+    """
+    Network = apps.get_model('uds', 'Network')
+    Network.objects.exclude(version=4).delete()
+    for n in Network.objects.all():
+        n.net_start = str(int(n.net_start, 16))
+        n.net_end = str(int(n.net_end, 16))
+        n.save(update_fields=['net_start', 'net_end'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uds', '0031_scheduler_metrics'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='network',
+            name='version',
+            field=models.IntegerField(default=4),
+        ),
+        migrations.AlterField(
+            model_name='network',
+            name='net_start',
+            field=models.CharField(db_index=True, max_length=32),
+        ),
+        migrations.AlterField(
+            model_name='network',
+            name='net_end',
+            field=models.CharField(db_index=True, max_length=32),
+        ),
+        migrations.RunPython(hexlifyLimits, unhexlifyLimits),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 2.1.1 on 2019-02-18 11:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uds', '0032_network_ipv6'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatsCountersAccum',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('owner_id', models.IntegerField(default=0)),
+                ('owner_type', models.SmallIntegerField(default=0)),
+                ('counter_type', models.SmallIntegerField(default=0)),
+                ('interval_type', models.IntegerField(default=3600)),
+                ('stamp', models.IntegerField(db_index=True, default=0)),
+                ('v_count', models.IntegerField(default=0)),
+                ('v_sum', models.BigIntegerField(default=0)),
+                ('v_max', models.IntegerField(default=0)),
+                ('v_min', models.IntegerField(default=0)),
+                ('v_last', models.IntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'uds_stats_c_accum',
+                'index_together': {('interval_type', 'owner_type', 'counter_type', 'stamp')},
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 2.1.1 on 2019-02-20 10:05
+
+import datetime
+
+from django.db import migrations, models
+
+
+def fillExpires(apps, schema_editor):
+    """
+    Sets expiration of existing tickets from its stamp and validity
+    """
+    TicketStore = apps.get_model('uds', 'TicketStore')
+    for t in TicketStore.objects.all():
+        t.expires = t.stamp + datetime.timedelta(seconds=t.validity)
+        t.save(update_fields=['expires'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uds', '0033_statscountersaccum'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ticketstore',
+            name='expires',
+            field=models.DateTimeField(db_index=True, default=datetime.datetime(1972, 7, 1, 0, 0)),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fillExpires, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (c) 2012-2019 Virtual Cable S.L.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright notice,
+#      this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#    * Neither the name of Virtual Cable S.L. nor the names of its contributors
+#      may be used to endorse or promote products derived from this software
+#      without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+.. moduleauthor:: Adolfo Gómez, dkmaster at dkmon dot com
+"""
+import logging
+
+from django.db import models
+from django.db import transaction
+from django.db import IntegrityError
+from django.db.models import F
+
+from uds.models.Util import getSqlDatetime
+
+
+logger = logging.getLogger(__name__)
+
+
+class CacheGeneration(models.Model):
+    """
+    Generation counter for cache owners. This model is managed via uds.core.util.Cache.Cache class
+
+    Every write (put, remove, clean) to an owner cache increments its generation, so other
+    server nodes can invalidate their in-process copies of that owner's entries.
+    """
+    owner = models.CharField(max_length=128, primary_key=True)
+    generation = models.BigIntegerField(default=0)
+    stamp = models.DateTimeField(db_index=True)  # Last time this generation was incremented
+
+    class Meta:
+        """
+        Meta class to declare the name of the table at database
+        """
+        db_table = 'uds_utility_cache_gen'
+        app_label = 'uds'
+
+    @staticmethod
+    def bump(owner):
+        """
+        Increments the generation of an owner, creating it if it does not exists
+        """
+        now = getSqlDatetime()
+        if CacheGeneration.objects.filter(owner=owner).update(generation=F('generation') + 1, stamp=now) == 0:
+            try:
+                with transaction.atomic():
+                    CacheGeneration.objects.create(owner=owner, generation=1, stamp=now)
+            except IntegrityError:  # Created concurrently by another server
+                CacheGeneration.objects.filter(owner=owner).update(generation=F('generation') + 1, stamp=now)
+
+    @staticmethod
+    def changedSince(since):
+        """
+        Returns (owner, generation, stamp) of generations changed since "since" (inclusive)
+        """
+        return CacheGeneration.objects.filter(stamp__gte=since).values_list('owner', 'generation', 'stamp')
+
+    def __str__(self):
+        return 'Cache generation {} = {} ({})'.format(self.owner, self.generation, self.stamp)
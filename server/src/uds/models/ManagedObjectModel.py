@@ -34,6 +34,7 @@ import logging
 
 from django.db import models
 from uds.core.Environment import Environment
+from uds.core.util.instances import InstanceCache
 from uds.models.UUIDModel import UUIDModel
 
 
@@ -52,6 +53,9 @@ class ManagedObjectModel(UUIDModel):
 
     _cachedInstance = None
 
+    # Instances of this records are kept on InstanceCache (see uds.core.util.instances)
+    cachedInstances = True
+
     class Meta(UUIDModel.Meta):
         """
         Defines this is an abstract clas
@@ -75,6 +79,23 @@ class ManagedObjectModel(UUIDModel):
 
         self._cachedInstance = None  # Ensures returns correct value on getInstance
 
+    def getInstanceKey(self):
+        """
+        Returns the values the instance of this record is created from (so cached instances are valid while they do not change)
+        """
+        return self.data
+
+    def createInstance(self, values=None):
+        """
+        Creates a new instance of the object this record contains (not using any cache)
+        Can be overriden
+        """
+        klass = self.getType()
+        env = self.getEnvironment()
+        obj = klass(env, values)
+        self.deserialize(obj, values)
+        return obj
+
     def getInstance(self, values=None):
         """
         Instantiates the object this record contains.
@@ -88,16 +109,16 @@ class ManagedObjectModel(UUIDModel):
         Returns:
             The instance Instance of the class this provider represents
         Notes:
-            Can be overriden
+            Instances created from stored data are shared with other copies of this record (see InstanceCache)
         """
         if self._cachedInstance is not None and values is None:
             # logger.debug('Got cached instance instead of deserializing a new one for {}'.format(self.name))
             return self._cachedInstance
 
-        klass = self.getType()
-        env = self.getEnvironment()
-        obj = klass(env, values)
-        self.deserialize(obj, values)
+        if values is None:
+            obj = InstanceCache.get(self, self.getInstanceKey(), self.createInstance)
+        else:
+            obj = self.createInstance(values)
 
         self._cachedInstance = obj
 
@@ -51,8 +51,10 @@ class Network(UUIDModel, TaggingMixin):  # type: ignore
     """
     # pylint: disable=model-missing-unicode
     name = models.CharField(max_length=64, unique=True)
-    net_start = models.BigIntegerField(db_index=True)
-    net_end = models.BigIntegerField(db_index=True)
+    # Network limits are stored as zero padded hex strings, so IPv6 (128 bits) ranges fit on them
+    net_start = models.CharField(max_length=32, db_index=True)
+    net_end = models.CharField(max_length=32, db_index=True)
+    version = models.IntegerField(default=4)
     net_string = models.CharField(max_length=128, default='')
     transports = models.ManyToManyField(Transport, related_name='networks', db_table='uds_net_trans')
 
@@ -63,13 +65,29 @@ class Network(UUIDModel, TaggingMixin):  # type: ignore
         ordering = ('name',)
         app_label = 'uds'
 
+    @staticmethod
+    def hexlify(value):
+        """
+        Returns the stored (zero padded hex) representation of a numeric ip
+        """
+        return '{:032x}'.format(value)
+
+    @staticmethod
+    def limitsFromString(netRange):
+        """
+        Returns the fields values (net_start, net_end, version) for a network range string
+        """
+        nr = net.networksFromString(netRange, False)
+        return Network.hexlify(nr[0]), Network.hexlify(nr[1]), nr[2]
+
     @staticmethod
     def networksFor(ip):
         """
-        Returns the networks that are valid for specified ip in dotted quad (xxx.xxx.xxx.xxx)
+        Returns the networks that are valid for specified ip (IPv4 dotted quad or IPv6)
+        Networks containing the ip are resolved using the in-memory network index
         """
-        ip = net.ipToLong(ip)
-        return Network.objects.filter(net_start__lte=ip, net_end__gte=ip)
+        from uds.core.util.netindex import NetworkIndex
+        return Network.objects.filter(id__in=NetworkIndex.index().networksFor(ip))
 
     @staticmethod
     def create(name, netRange):
@@ -81,28 +99,28 @@ class Network(UUIDModel, TaggingMixin):  # type: ignore
 
             netEnd: Network end
         """
-        nr = net.networksFromString(netRange, False)
-        return Network.objects.create(name=name, net_start=nr[0], net_end=nr[1], net_string=netRange)
+        start, end, version = Network.limitsFromString(netRange)
+        return Network.objects.create(name=name, net_start=start, net_end=end, version=version, net_string=netRange)
 
     @property
     def netStart(self):
         """
-        Property to access the quad dotted format of the stored network start
+        Property to access the quad dotted (or IPv6) format of the stored network start
 
         Returns:
             string representing the dotted quad of this network start
         """
-        return net.longToIp(self.net_start)
+        return net.longToIp(int(self.net_start, 16), self.version)
 
     @property
     def netEnd(self):
         """
-        Property to access the quad dotted format of the stored network end
+        Property to access the quad dotted (or IPv6) format of the stored network end
 
         Returns:
             string representing the dotted quad of this network end
         """
-        return net.longToIp(self.net_end)
+        return net.longToIp(int(self.net_end, 16), self.version)
 
     def update(self, name, netRange):
         """
@@ -116,14 +134,12 @@ class Network(UUIDModel, TaggingMixin):  # type: ignore
             netEnd: new Network end (quad dotted)
         """
         self.name = name
-        nr = net.networksFromString(netRange, False)
-        self.net_start = nr[0]
-        self.net_end = nr[1]
+        self.net_start, self.net_end, self.version = Network.limitsFromString(netRange)
         self.net_string = netRange
         self.save()
 
     def __str__(self):
-        return u'Network {} ({}) from {} to {}'.format(self.name, self.net_string, net.longToIp(self.net_start), net.longToIp(self.net_end))
+        return u'Network {} ({}) from {} to {}'.format(self.name, self.net_string, self.netStart, self.netEnd)
 
     @staticmethod
     def beforeDelete(sender, **kwargs):
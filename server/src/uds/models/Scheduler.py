@@ -71,6 +71,11 @@ class Scheduler(models.Model):
     next_execution = models.DateTimeField(default=NEVER, db_index=True)
     owner_server = models.CharField(max_length=64, db_index=True, default='')
     state = models.CharField(max_length=1, default=State.FOR_EXECUTE, db_index=True)
+    # Execution metrics, updated by the server that executed the job when it is released
+    executions = models.PositiveIntegerField(default=0)
+    last_duration = models.FloatField(default=0)  # Wall time of last execution, in seconds
+    total_duration = models.FloatField(default=0)  # Accumulated wall time of all executions, in seconds
+    overruns = models.PositiveIntegerField(default=0)  # Executions that took longer than frecuency
 
     class Meta:
         """
@@ -106,7 +111,7 @@ class Scheduler(models.Model):
         toDelete.getEnvironment().clearRelatedData()
 
     def __str__(self):
-        return 'Scheduled task {}, every {}, last execution at {}, state = {}'.format(self.name, self.frecuency, self.last_execution, self.state)
+        return 'Scheduled task {}, every {}, last execution at {} ({:.2f} secs), state = {}'.format(self.name, self.frecuency, self.last_execution, self.last_duration, self.state)
 
 
 # Connects a pre deletion signal to Scheduler
@@ -86,33 +86,21 @@ class Service(ManagedObjectModel, TaggingMixin):  # type: ignore
             }
         )
 
-    def getInstance(self, values=None):
+    def getInstanceKey(self):
         """
-        Instantiates the object this record contains.
-
-        Every single record of Provider model, represents an object.
-
-        Args:
-           values (list): Values to pass to constructor. If no values are especified,
-                          the object is instantiated empty and them de-serialized from stored data.
-
-        Returns:
-            The instance Instance of the class this provider represents
-
-        Raises:
+        Service instances are created from provider instance, so its data is also part of the key
         """
-        if self._cachedInstance is not None and values is None:
-            # logger.debug('Got cached instance instead of deserializing a new one for {}'.format(self.name))
-            return self._cachedInstance
+        return (self.data, self.provider.getInstanceKey())
 
+    def createInstance(self, values=None):
+        """
+        Instantiates the object this record contains, using the instance of its provider.
+        """
         prov = self.provider.getInstance()
         sType = prov.getServiceByType(self.data_type)
         env = self.getEnvironment()
         obj = sType(env, prov, values)
         self.deserialize(obj, values)
-
-        self._cachedInstance = obj
-
         return obj
 
     def getType(self):
@@ -157,7 +157,7 @@ class DeployedService(UUIDModel, TaggingMixin):  #  type: ignore
         from django.db.models import Count
 
         if GlobalConfig.RESTRAINT_TIME.getInt() <= 0:
-            return []  # Do not perform any restraint check if we set the globalconfig to 0 (or less)
+            return DeployedService.objects.none()  # Do not perform any restraint check if we set the globalconfig to 0 (or less)
 
         date = getSqlDatetime() - timedelta(seconds=GlobalConfig.RESTRAINT_TIME.getInt())
         min_ = GlobalConfig.RESTRAINT_COUNT.getInt()
@@ -39,6 +39,7 @@ from django.db.models import signals
 from uds.core.util.State import State
 from uds.core.Environment import Environment
 from uds.core.util import log
+from uds.core.util.instances import InstanceCache
 
 from uds.models.ServicesPool import DeployedService
 from uds.models.Util import getSqlDatetime
@@ -91,6 +92,9 @@ class DeployedServicePublication(UUIDModel):
         ordering = ('publish_date',)
         app_label = 'uds'
 
+    # Instances of this records are kept on InstanceCache (see uds.core.util.instances)
+    cachedInstances = True
+
     def getEnvironment(self):
         """
         Returns an environment valid for the record this object represents
@@ -112,6 +116,14 @@ class DeployedServicePublication(UUIDModel):
 
         Raises:
         """
+        ds = self.deployed_service
+        key = (self.data, self.revision, ds.name, ds.service.getInstanceKey(), ds.osmanager.getInstanceKey() if ds.osmanager is not None else None)
+        return InstanceCache.get(self, key, self.createInstance)
+
+    def createInstance(self):
+        """
+        Creates a new instance of the publication this record contains (not using any cache)
+        """
         serviceInstance = self.deployed_service.service.getInstance()
         osManagerInstance = self.deployed_service.osmanager
         if osManagerInstance is not None:
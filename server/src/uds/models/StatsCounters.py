@@ -92,11 +92,11 @@ class StatsCounters(models.Model):
         since = int(since) if since else NEVER_UNIX
         to = int(to) if to else getSqlDatetime(True)
 
-        interval = 600  # By default, group items in ten minutes interval (600 seconds)
+        interval = kwargs.get('interval', None) or 600  # By default, group items in ten minutes interval (600 seconds)
 
         elements = kwargs.get('limit', None)
 
-        if elements:
+        if elements and not kwargs.get('interval', None):
             # Protect against division by "elements-1" a few lines below
             elements = int(elements) if int(elements) > 1 else 2
 
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (c) 2012-2019 Virtual Cable S.L.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright notice,
+#      this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#    * Neither the name of Virtual Cable S.L. nor the names of its contributors
+#      may be used to endorse or promote products derived from this software
+#      without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+.. moduleauthor:: Adolfo Gómez, dkmaster at dkmon dot com
+"""
+import logging
+
+from django.db import models, transaction
+
+from uds.models.StatsCounters import StatsCounters
+
+
+logger = logging.getLogger(__name__)
+
+
+class StatsCountersAccum(models.Model):
+    """
+    Hourly and daily rollups (count, sum, max, min and last value) of counter statistics,
+    so counters for long periods can be obtained without reading every counter
+    """
+    HOUR = 3600
+    DAY = 3600 * 24
+
+    owner_id = models.IntegerField(default=0)
+    owner_type = models.SmallIntegerField(default=0)
+    counter_type = models.SmallIntegerField(default=0)
+    interval_type = models.IntegerField(default=HOUR)  # Interval length, in seconds
+    stamp = models.IntegerField(db_index=True, default=0)  # Start of interval
+    v_count = models.IntegerField(default=0)
+    v_sum = models.BigIntegerField(default=0)
+    v_max = models.IntegerField(default=0)
+    v_min = models.IntegerField(default=0)
+    v_last = models.IntegerField(default=0)
+
+    class Meta:
+        """
+        Meta class to declare db table
+        """
+        db_table = 'uds_stats_c_accum'
+        app_label = 'uds'
+        index_together = (('interval_type', 'owner_type', 'counter_type', 'stamp'),)
+
+    @staticmethod
+    def firstStamp(interval_type):
+        """
+        Returns the start of the first accumulated interval of this type, or None if nothing accumulated yet
+        """
+        first = StatsCountersAccum.objects.filter(interval_type=interval_type).order_by('stamp').values_list('stamp', flat=True)[:1]
+        return first[0] if first else None
+
+    @staticmethod
+    def lastStamp(interval_type):
+        """
+        Returns the start of the last accumulated interval of this type, or None if nothing accumulated yet
+        Intervals before this one are complete (this one may not)
+        """
+        last = StatsCountersAccum.objects.filter(interval_type=interval_type).order_by('-stamp').values_list('stamp', flat=True)[:1]
+        return last[0] if last else None
+
+    @staticmethod
+    def accumulate(interval_type, stamp):
+        """
+        (Re)computes the rollups of the interval of type interval_type that starts at stamp.
+        Hourly rollups are computed from counters, daily ones from hourly rollups.
+        """
+        end = stamp + interval_type
+        accums = {}
+        if interval_type == StatsCountersAccum.HOUR:
+            values = (
+                (owner_type, owner_id, counter_type, 1, value, value, value, value)
+                for owner_type, owner_id, counter_type, value in StatsCounters.objects.filter(stamp__gte=stamp, stamp__lt=end).order_by('stamp', 'id').values_list(
+                    'owner_type', 'owner_id', 'counter_type', 'value'
+                ).iterator()
+            )
+        else:
+            values = StatsCountersAccum.objects.filter(interval_type=StatsCountersAccum.HOUR, stamp__gte=stamp, stamp__lt=end).order_by('stamp').values_list(
+                'owner_type', 'owner_id', 'counter_type', 'v_count', 'v_sum', 'v_max', 'v_min', 'v_last'
+            )
+
+        for owner_type, owner_id, counter_type, v_count, v_sum, v_max, v_min, v_last in values:
+            key = (owner_type, owner_id, counter_type)
+            acc = accums.get(key)
+            if acc is None:
+                accums[key] = StatsCountersAccum(
+                    owner_type=owner_type, owner_id=owner_id, counter_type=counter_type, interval_type=interval_type, stamp=stamp,
+                    v_count=v_count, v_sum=v_sum, v_max=v_max, v_min=v_min, v_last=v_last
+                )
+            else:
+                acc.v_count += v_count
+                acc.v_sum += v_sum
+                acc.v_max = max(acc.v_max, v_max)
+                acc.v_min = min(acc.v_min, v_min)
+                acc.v_last = v_last
+
+        with transaction.atomic():
+            StatsCountersAccum.objects.filter(interval_type=interval_type, stamp=stamp).delete()
+            StatsCountersAccum.objects.bulk_create(accums.values())
+
+        return len(accums)
+
+    @staticmethod
+    def get_grouped(owner_type, counter_type, interval_type, owner_id=None, since=0, to=0, interval=None, use_max=False):
+        """
+        Returns the average (or max) of rollups of interval_type, grouped by interval (that must be a multiple of interval_type)
+        Results are StatsCounters (not stored) objects, as the ones returned by StatsCounters.get_grouped
+        """
+        interval = interval or interval_type
+
+        q = StatsCountersAccum.objects.filter(interval_type=interval_type, counter_type=counter_type, stamp__gte=since, stamp__lte=to)
+        q = q.filter(owner_type__in=owner_type) if isinstance(owner_type, (list, tuple)) else q.filter(owner_type=owner_type)
+        if owner_id is not None:
+            q = q.filter(owner_id__in=owner_id) if isinstance(owner_id, (list, tuple)) else q.filter(owner_id=owner_id)
+
+        groups = {}
+        for stamp, v_count, v_sum, v_max in q.values_list('stamp', 'v_count', 'v_sum', 'v_max'):
+            # Counters are grouped by CEIL(stamp/interval), that is, labeled by the end of its interval.
+            # Rollups are stamped with the start of its interval, so they are labeled by the end of the interval containing it
+            group = stamp // interval + 1
+            g = groups.setdefault(group, [0, 0, None])
+            g[0] += v_count
+            g[1] += v_sum
+            g[2] = v_max if g[2] is None else max(g[2], v_max)
+
+        return [
+            StatsCounters(id=-1, owner_id=-1, owner_type=-1, counter_type=-1, stamp=group * interval, value=g[2] if use_max else -(-g[1] // max(g[0], 1)))
+            for group, g in sorted(groups.items())
+        ]
+
+    def __str__(self):
+        return u"Accumulated counter of {}({}): {} ({}s) - {} - {}/{}/{}/{}/{}".format(
+            self.owner_type, self.owner_id, self.stamp, self.interval_type, self.counter_type, self.v_count, self.v_sum, self.v_max, self.v_min, self.v_last
+        )
@@ -30,6 +30,11 @@
 '''
 import datetime
 import pickle
+import sqlite3
+import tempfile
+import threading
+import time
+import os
 import logging
 
 from django.db import models
@@ -45,14 +50,28 @@ logger = logging.getLogger(__name__)
 class TicketStore(UUIDModel):
     """
     Tickets storing on DB
+
+    Tickets are stored by a backend (see TicketBackend), choosen by ticket owner.
+    By default, all tickets are stored on database (this model), but tickets of owners listed on
+    GlobalConfig.LOCAL_TICKETS are stored only on this server (SharedTicketBackend), and any owner can be
+    assigned any backend registering it on TicketStore.backends.
     """
     DEFAULT_VALIDITY = 60
     MAX_VALIDITY = 60 * 60 * 12
     # Cleanup will purge all elements that have been created MAX_VALIDITY ago
+    CLEANUP_BATCH = 1000  # Expired tickets are removed in batches of this size
+
+    # Owners of "hot" tickets (short lived, used once)
+    OWNER_CLIENT = 'client'  # Ticket used by client to get a service
+    OWNER_TUNNEL = 'tunnel'  # Ticket used by guacamole tunnel to get connection params
+    OWNER_PAM = 'pam'  # Tunnel credentials
+
+    backends = {}  # owner -> backend, for owners not using default ones
 
     owner = models.CharField(null=True, blank=True, default=None, max_length=8)
     stamp = models.DateTimeField()  # Date creation or validation of this entry
     validity = models.IntegerField(default=60)  # Duration allowed for this ticket to be valid, in seconds
+    expires = models.DateTimeField(db_index=True)  # stamp + validity, so expiration can be checked on database
 
     data = models.BinaryField()  # Associated ticket data
     validator = models.BinaryField(null=True, blank=True, default=None)  # Associated validator for this ticket
@@ -76,95 +95,322 @@ class TicketStore(UUIDModel):
         # ''.join(random.SystemRandom().choice(string.ascii_lowercase + string.digits) for _ in range(40))
         return cryptoManager().randomString(40)
 
+    @staticmethod
+    def backendFor(owner):
+        """
+        Returns the backend that stores tickets of owner
+        """
+        backend = TicketStore.backends.get(owner)
+        if backend is not None:
+            return backend
+        from uds.core.util.Config import GlobalConfig
+        if owner is not None and owner in GlobalConfig.LOCAL_TICKETS.get().replace(' ', '').split(','):
+            return SharedTicketBackend.backend()
+        return DBTicketBackend.backend()
+
     @staticmethod
     def create(data, validator=None, validity=DEFAULT_VALIDITY, owner=None, secure=False):
         """
         validity is in seconds
         """
-        if validator is not None:
-            validator = pickle.dumps(validator)
-        data = pickle.dumps(data)
         if secure:
             pass
 
-        return TicketStore.objects.create(stamp=getSqlDatetime(), data=data, validator=validator, validity=validity, owner=owner).uuid
+        uuid = TicketStore.generateUuid()
+        TicketStore.backendFor(owner).create(uuid, data, validator, validity, owner)
+        return uuid
 
     @staticmethod
-    def store(uuid, data, validator=None, validity=DEFAULT_VALIDITY, owner=owner, secure=False):
+    def store(uuid, data, validator=None, validity=DEFAULT_VALIDITY, owner=None, secure=False):
         """
         Stores an ticketstore. If one with this uuid already exists, replaces it. Else, creates a new one
         validity is in seconds
         """
-        if validator is not None:
-            validator = pickle.dumps(validator)
-
-        data = pickle.dumps(data)
         if secure:
             pass
 
-        try:
-            t = TicketStore.objects.get(uuid=uuid)
-            t.data = pickle.dumps(data)
-            t.stamp = getSqlDatetime()
-            t.validity = validity
-            t.save()
-        except TicketStore.DoesNotExist:
-            t = TicketStore.objects.create(uuid=uuid, stamp=getSqlDatetime(), data=pickle.dumps(data), validator=validator, validity=validity)
+        TicketStore.backendFor(owner).store(uuid, data, validator, validity, owner)
 
     @staticmethod
     def get(uuid, invalidate=True, owner=None, secure=False):
-        try:
-            t = TicketStore.objects.get(uuid=uuid, owner=owner)
-            validity = datetime.timedelta(seconds=t.validity)
-            now = getSqlDatetime()
+        """
+        Returns ticket data, raising InvalidTicket if it does not exists, is expired or its validator fails.
+        If invalidate is True, ticket can't be used anymore (and only one of concurrent gets will succeed)
+        """
+        # if secure: TODO
+        return TicketStore.backendFor(owner).get(uuid, invalidate, owner)
 
-            logger.debug('Ticket validity: %s %s', t.stamp + validity, now)
-            if t.stamp + validity < now:
-                raise TicketStore.InvalidTicket('Not valid anymore')
+    @staticmethod
+    def revalidate(uuid, validity=None, owner=None):
+        TicketStore.backendFor(owner).revalidate(uuid, validity, owner)
 
-            # if secure: TODO
-            data = pickle.loads(t.data)
+    @staticmethod
+    def cleanup():
+        """
+        Removes expired tickets of all backends used
+        """
+        from uds.core.util.Config import GlobalConfig
+        backends = [DBTicketBackend.backend()] + list(TicketStore.backends.values())
+        # Cleanup is run by task manager, that does not use the shared backend itself
+        if GlobalConfig.LOCAL_TICKETS.get().strip() != '':
+            backends.append(SharedTicketBackend.backend())
+        for backend in set(backends + list(SharedTicketBackend._backends.values())):
+            backend.cleanup()
 
-            # If has validator, execute it
-            if t.validator is not None:
-                validator = pickle.loads(t.validator)
+    def __str__(self):
+        if self.validator is not None:
+            validator = pickle.loads(self.validator)
+        else:
+            validator = None
 
-                if validator(data) is False:
-                    raise TicketStore.InvalidTicket('Validation failed')
+        return 'Ticket id: {}, Secure: {}, Stamp: {}, Validity: {}, Validator: {}, Data: {}'.format(self.uuid, self.owner, self.stamp, self.validity, validator, pickle.loads(self.data))
 
-            if invalidate is True:
-                t.stamp = now - validity - datetime.timedelta(seconds=1)
-                t.save()
 
-            return data
+class TicketBackend(object):
+    """
+    Interface of tickets storages.
+    get must be atomic: if a ticket is invalidated, no other get will return it.
+    """
+    _backend = None
+
+    @classmethod
+    def backend(cls):
+        if cls._backend is None:
+            cls._backend = cls()
+        return cls._backend
+
+    def create(self, uuid, data, validator, validity, owner):
+        """
+        Stores a new ticket
+        """
+        self.store(uuid, data, validator, validity, owner)
+
+    def store(self, uuid, data, validator, validity, owner):
+        """
+        Stores a ticket, replacing it if already exists
+        """
+        raise NotImplementedError()
+
+    def get(self, uuid, invalidate, owner):
+        """
+        Returns ticket data, raising TicketStore.InvalidTicket if not valid
+        """
+        raise NotImplementedError()
+
+    def revalidate(self, uuid, validity, owner):
+        """
+        Makes ticket valid again, for validity seconds (or its original validity, if None)
+        """
+        raise NotImplementedError()
+
+    def cleanup(self):
+        """
+        Removes expired tickets
+        """
+        raise NotImplementedError()
+
+
+class DBTicketBackend(TicketBackend):
+    """
+    Tickets stored on database (TicketStore model), valid for all servers of an installation
+    """
+    _backend = None
+
+    def create(self, uuid, data, validator, validity, owner):
+        now = getSqlDatetime()
+        TicketStore.objects.create(
+            uuid=uuid, stamp=now, expires=now + datetime.timedelta(seconds=validity), validity=validity, owner=owner,
+            data=pickle.dumps(data), validator=pickle.dumps(validator) if validator is not None else None
+        )
+
+    def store(self, uuid, data, validator, validity, owner):
+        now = getSqlDatetime()
+        values = {
+            'stamp': now, 'expires': now + datetime.timedelta(seconds=validity), 'validity': validity, 'owner': owner,
+            'data': pickle.dumps(data), 'validator': pickle.dumps(validator) if validator is not None else None
+        }
+        if TicketStore.objects.filter(uuid=uuid).update(**values) == 0:
+            TicketStore.objects.create(uuid=uuid, **values)
+
+    def get(self, uuid, invalidate, owner):
+        now = getSqlDatetime()
+        try:
+            t = TicketStore.objects.get(uuid=uuid, owner=owner, expires__gte=now)
         except TicketStore.DoesNotExist:
-            raise TicketStore.InvalidTicket('Does not exists')
+            raise TicketStore.InvalidTicket('Does not exists or not valid anymore')
 
-    @staticmethod
-    def revalidate(uuid, validity=None, owner=None):
+        data = pickle.loads(t.data)
+
+        # If has validator, execute it
+        if t.validator is not None:
+            validator = pickle.loads(t.validator)
+
+            if validator(data) is False:
+                raise TicketStore.InvalidTicket('Validation failed')
+
+        # Only one of concurrent requests for same ticket can invalidate it
+        if invalidate is True and TicketStore.objects.filter(pk=t.pk, expires__gte=now).update(expires=now - datetime.timedelta(seconds=1)) == 0:
+            raise TicketStore.InvalidTicket('Not valid anymore')
+
+        return data
+
+    def revalidate(self, uuid, validity, owner):
         try:
             t = TicketStore.objects.get(uuid=uuid, owner=owner)
             t.stamp = getSqlDatetime()
             if validity is not None:
                 t.validity = validity
-            t.save()
+            t.expires = t.stamp + datetime.timedelta(seconds=t.validity)
+            t.save(update_fields=['stamp', 'validity', 'expires'])
         except TicketStore.DoesNotExist:
             raise Exception('Does not exists')
 
-    @staticmethod
-    def cleanup():
-        from datetime import timedelta
+    def cleanup(self):
+        """
+        Removes expired tickets, in batches of CLEANUP_BATCH, and tickets created more than MAX_VALIDITY seconds ago
+        """
         now = getSqlDatetime()
-        for v in TicketStore.objects.all():
-            if now > v.stamp + timedelta(seconds=v.validity):
-                v.delete()
+        expired = TicketStore.objects.filter(expires__lt=now)
+        while True:
+            ids = list(expired.values_list('pk', flat=True)[:TicketStore.CLEANUP_BATCH])
+            if ids:
+                TicketStore.objects.filter(pk__in=ids).delete()
+            if len(ids) < TicketStore.CLEANUP_BATCH:
+                break
         cleanSince = now - datetime.timedelta(seconds=TicketStore.MAX_VALIDITY)
         TicketStore.objects.filter(stamp__lt=cleanSince).delete()
 
-    def __str__(self):
-        if self.validator is not None:
-            validator = pickle.loads(self.validator)
+
+class MemoryTicketBackend(TicketBackend):
+    """
+    Tickets stored on memory of this process.
+    Only usable if all requests related to a ticket are processed by the same process (i.e. a single process server)
+    """
+    _backend = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tickets = {}  # uuid -> (owner, expires, validity, data, validator)
+
+    def store(self, uuid, data, validator, validity, owner):
+        with self._lock:
+            self._tickets[uuid] = (owner, time.time() + validity, validity, data, validator)
+
+    def get(self, uuid, invalidate, owner):
+        with self._lock:
+            ticket = self._tickets.get(uuid)
+            if ticket is None or ticket[0] != owner or ticket[1] < time.time():
+                raise TicketStore.InvalidTicket('Does not exists or not valid anymore')
+            if ticket[4] is not None and ticket[4](ticket[3]) is False:
+                raise TicketStore.InvalidTicket('Validation failed')
+            if invalidate is True:
+                del self._tickets[uuid]
+            return ticket[3]
+
+    def revalidate(self, uuid, validity, owner):
+        with self._lock:
+            ticket = self._tickets.get(uuid)
+            if ticket is None or ticket[0] != owner:
+                raise Exception('Does not exists')
+            validity = ticket[2] if validity is None else validity
+            self._tickets[uuid] = (owner, time.time() + validity, validity) + ticket[3:]
+
+    def cleanup(self):
+        now = time.time()
+        with self._lock:
+            for uuid in [k for k, v in self._tickets.items() if v[1] < now]:
+                del self._tickets[uuid]
+
+
+class SharedTicketBackend(TicketBackend):
+    """
+    Tickets stored on a sqlite database on a memory backed filesystem (/dev/shm if available),
+    shared by all processes of this server (but not with other servers, so only for single server installations)
+
+    Tickets contain credentials, and are unpickled when read, so the database is kept on a directory private to the
+    user running UDS, and it is not opened if it (or its directory) is owned by other user or accesible by others.
+    """
+    PATH = os.path.join('/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir(), 'uds-tickets-{}'.format(os.getuid()), 'tickets.sqlite3')
+
+    _backends = {}
+
+    def __init__(self, path=None):
+        self._path = path or SharedTicketBackend.PATH
+        self._local = threading.local()  # sqlite connections can't be shared between threads
+
+    @classmethod
+    def backend(cls, path=None):
+        path = path or SharedTicketBackend.PATH
+        if path not in cls._backends:
+            cls._backends[path] = cls(path)
+        return cls._backends[path]
+
+    @staticmethod
+    def __checkPrivate(path, fd=None):
+        st = os.fstat(fd) if fd is not None else os.lstat(path)
+        if st.st_uid != os.getuid() or st.st_mode & 0o077 != 0:
+            raise Exception('Refusing to use shared tickets storage {}: not private to this user'.format(path))
+
+    def __prepare(self):
+        """
+        Creates (if needed) the private directory and database file, checking that they are only accesible by us
+        """
+        directory = os.path.dirname(self._path)
+        try:
+            os.makedirs(directory, 0o700)
+        except OSError:
+            pass  # Already exists (checked below)
+        if not os.path.isdir(directory) or os.path.islink(directory):
+            raise Exception('Refusing to use shared tickets storage {}: not a directory'.format(directory))
+        SharedTicketBackend.__checkPrivate(directory)
+
+        fd = os.open(self._path, os.O_RDWR | os.O_CREAT | os.O_NOFOLLOW, 0o600)
+        try:
+            SharedTicketBackend.__checkPrivate(self._path, fd)
+        finally:
+            os.close(fd)
+
+    def __connection(self):
+        if getattr(self._local, 'pid', None) != os.getpid():
+            self.__prepare()
+            conn = sqlite3.connect(self._path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF')
+            conn.execute('CREATE TABLE IF NOT EXISTS tickets (uuid TEXT PRIMARY KEY, owner TEXT, expires REAL, validity INTEGER, data BLOB, validator BLOB)')
+            conn.execute('CREATE INDEX IF NOT EXISTS tickets_expires ON tickets (expires)')
+            self._local.connection, self._local.pid = conn, os.getpid()
+        return self._local.connection
+
+    def store(self, uuid, data, validator, validity, owner):
+        self.__connection().execute(
+            'INSERT OR REPLACE INTO tickets VALUES (?, ?, ?, ?, ?, ?)',
+            (uuid, owner, time.time() + validity, validity, pickle.dumps(data), pickle.dumps(validator) if validator is not None else None)
+        )
+
+    def get(self, uuid, invalidate, owner):
+        conn = self.__connection()
+        conn.execute('BEGIN IMMEDIATE')  # Locks database for writing, so get and invalidation are atomic
+        try:
+            row = conn.execute('SELECT data, validator FROM tickets WHERE uuid = ? AND owner IS ? AND expires >= ?', (uuid, owner, time.time())).fetchone()
+            if row is None:
+                raise TicketStore.InvalidTicket('Does not exists or not valid anymore')
+            data = pickle.loads(row[0])
+            if row[1] is not None and pickle.loads(row[1])(data) is False:
+                raise TicketStore.InvalidTicket('Validation failed')
+            if invalidate is True:
+                conn.execute('DELETE FROM tickets WHERE uuid = ?', (uuid,))
+        finally:
+            conn.execute('COMMIT')
+        return data
+
+    def revalidate(self, uuid, validity, owner):
+        conn = self.__connection()
+        if validity is None:
+            cursor = conn.execute('UPDATE tickets SET expires = ? + validity WHERE uuid = ? AND owner IS ?', (time.time(), uuid, owner))
         else:
-            validator = None
+            cursor = conn.execute('UPDATE tickets SET expires = ?, validity = ? WHERE uuid = ? AND owner IS ?', (time.time() + validity, validity, uuid, owner))
+        if cursor.rowcount == 0:
+            raise Exception('Does not exists')
 
-        return 'Ticket id: {}, Secure: {}, Stamp: {}, Validity: {}, Validator: {}, Data: {}'.format(self.uuid, self.owner, self.stamp, self.validity, validator, pickle.loads(self.data))
+    def cleanup(self):
+        self.__connection().execute('DELETE FROM tickets WHERE expires < ?', (time.time(),))
@@ -35,7 +35,6 @@ import logging
 from django.db import models
 from django.db.models import signals
 
-from uds.core.util import net
 
 from uds.models.ManagedObjectModel import ManagedObjectModel
 from uds.models.Tag import TaggingMixin
@@ -100,15 +99,10 @@ class Transport(ManagedObjectModel, TaggingMixin):  # type: ignore
 
         Raises:
 
-        :note: Ip addresses has been only tested with IPv4 addresses
+        :note: Both IPv4 and IPv6 addresses are supported. Check is done using the in-memory network index
         """
-        if self.networks.count() == 0:
-            return True
-        ip = net.ipToLong(ip)
-        if self.nets_positive:
-            return self.networks.filter(net_start__lte=ip, net_end__gte=ip).count() > 0
-        else:
-            return self.networks.filter(net_start__lte=ip, net_end__gte=ip).count() == 0
+        from uds.core.util.netindex import NetworkIndex
+        return NetworkIndex.index().transportValidForIp(self, ip)
 
     def validForOs(self, os):
         logger.debug('Checkin if os "%s" is in "%s"', os, self.allowed_oss)
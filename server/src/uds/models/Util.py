@@ -31,9 +31,11 @@
 .. moduleauthor:: Adolfo Gómez, dkmaster at dkmon dot com
 """
 import logging
+import threading
+import time
 from time import mktime
 
-from datetime import datetime
+from datetime import datetime, timedelta
 from django.db import models
 from django.db import connection
 
@@ -55,21 +57,92 @@ class UnsavedForeignKey(models.ForeignKey):
     allow_unsaved_instance_assignment = True
 
 
-def getSqlDatetime(unix=False):
+class ClockSync(object):
+    """
+    Keeps the offset between database server clock and this process monotonic clock,
+    so database aligned time can be obtained without a database round trip.
+
+    Database clock is sampled at intervals that start at MIN_SYNC_INTERVAL seconds and double, up to
+    MAX_SYNC_INTERVAL, while the samples agrees with predicted time. If a sample drifts more than MAX_DRIFT seconds from prediction
+    (database clock changed, for example), interval is reset to the minimum.
+    """
+    MIN_SYNC_INTERVAL = 15
+    MAX_SYNC_INTERVAL = 600
+    MAX_DRIFT = 2  # Seconds. NOW() has a resolution of one second, so drift under this is not relevant
+
+    enabled = True  # If False, database is asked on every request (same as strict)
+
+    _lock = threading.Lock()
+    # (database datetime at sampling, monotonic clock at sampling, monotonic clock of next sampling)
+    # Replaced as a whole, so it can be read without locking
+    _sync = None
+    _interval = MIN_SYNC_INTERVAL
+
+    # Counters
+    samples = 0
+    drifts = 0
+
+    @staticmethod
+    def _sample():
+        cursor = connection.cursor()
+        sentence = 'SELECT NOW()' if connection.vendor == 'mysql' else 'SELECT CURRENT_TIMESTAMP'
+        before = time.monotonic()
+        cursor.execute(sentence)
+        date = cursor.fetchone()[0]
+        return date, (before + time.monotonic()) / 2  # Assume server took the value at the middle of the round trip
+
+    @staticmethod
+    def now(strict=False):
+        """
+        Returns current database datetime.
+        If strict, the database is asked for it (and the sample is used to sync clocks)
+        """
+        current = time.monotonic()
+        sync = ClockSync._sync
+        if strict is False and ClockSync.enabled and sync is not None and current < sync[2]:
+            return sync[0] + timedelta(seconds=current - sync[1])
+
+        date, sampledAt = ClockSync._sample()
+        with ClockSync._lock:
+            ClockSync.samples += 1
+            sync = ClockSync._sync
+            if sync is not None:
+                predicted = sync[0] + timedelta(seconds=sampledAt - sync[1])
+                if abs((date - predicted).total_seconds()) > ClockSync.MAX_DRIFT:
+                    ClockSync.drifts += 1
+                    logger.info('Database clock drift detected: %s vs predicted %s', date, predicted)
+                    ClockSync._interval = ClockSync.MIN_SYNC_INTERVAL
+                else:
+                    ClockSync._interval = min(ClockSync._interval * 2, ClockSync.MAX_SYNC_INTERVAL)
+            ClockSync._sync = (date, sampledAt, sampledAt + ClockSync._interval)
+        return date
+
+    @staticmethod
+    def reset():
+        """
+        Forces a new sample on next request
+        """
+        with ClockSync._lock:
+            ClockSync._sync = None
+            ClockSync._interval = ClockSync.MIN_SYNC_INTERVAL
+
+
+def getSqlDatetime(unix=False, strict=False):
     """
     Returns the current date/time of the database server.
 
     We use this time as method of keeping all operations betwen different servers in sync.
 
+    Database time is not requested on every call, but computed from a periodically synchronized offset
+    (see ClockSync). Use strict=True when exact database time is needed (for example, when comparing
+    with values written by other servers inside a locked transaction).
+
     We support get database datetime for:
       * mysql
       * sqlite
     """
     if connection.vendor in ('mysql', 'microsoft'):
-        cursor = connection.cursor()
-        sentence = 'SELECT NOW()' if connection.vendor == 'mysql' else 'SELECT CURRENT_TIMESTAMP'
-        cursor.execute(sentence)
-        date = cursor.fetchone()[0]
+        date = ClockSync.now(strict)
     else:
         date = datetime.now()  # If not know how to get database datetime, returns local datetime (this is fine for sqlite, which is local)
 
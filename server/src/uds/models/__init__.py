@@ -71,11 +71,13 @@ from .Log import Log
 
 # Stats
 from .StatsCounters import StatsCounters
+from .StatsCountersAccum import StatsCountersAccum
 from .StatsEvents import StatsEvents
 
 # General utility models, such as a database cache (for caching remote content of slow connections to external services providers for example)
 # We could use django cache (and maybe we do it in a near future), but we need to clean up things when objecs owning them are deleted
 from .Cache import Cache
+from .CacheGeneration import CacheGeneration
 from .Config import Config
 from .Storage import Storage
 from .UniqueId import UniqueId
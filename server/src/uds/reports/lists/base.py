@@ -39,7 +39,4 @@ __updated__ = '2017-05-10'
 
 
 class ListReport(reports.Report):
-    def generate(self):
-        raise NotImplementedError('ListReport generate invoked and not implemented')
-
     group = _('Lists')  # So we can make submenus with reports
@@ -36,8 +36,6 @@ from django.utils.translation import ugettext, ugettext_lazy as _
 from uds.core.ui.UserInterface import gui
 from uds.models import Authenticator
 
-import six
-import csv
 
 from .base import ListReport
 
@@ -104,17 +102,12 @@ class ListReportsUsersCSV(ListReportUsers):
             auth = Authenticator.objects.get(uuid=self.authenticator.value)
             self.filename = auth.name + '.csv'
 
-    def generate(self):
-        output = six.StringIO()
-        writer = csv.writer(output)
+    def generateRows(self):
         auth = Authenticator.objects.get(uuid=self.authenticator.value)
-        users = auth.users.order_by('name')
-
-        writer.writerow([ugettext('User ID'), ugettext('Real Name'), ugettext('Last access')])
-
-        for v in users:
-            writer.writerow([v.name, v.real_name, v.last_access])
+        users = auth.users.order_by('name').values_list('name', 'real_name', 'last_access')
 
-        # writer.writerow(['ñoño', 'ádios', 'hola'])
+        yield [ugettext('User ID'), ugettext('Real Name'), ugettext('Last access')]
 
-        return output.getvalue()
+        # Users are read in chunks, so they are not all at once on memory
+        for v in users.iterator(chunk_size=1000):
+            yield list(v)
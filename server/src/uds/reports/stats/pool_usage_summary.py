@@ -36,9 +36,8 @@ from django.utils.translation import ugettext, ugettext_lazy as _
 
 from uds.core.ui.UserInterface import gui
 from uds.core.util.stats import events
+from uds.core.util.stats import analytics
 
-import io
-import csv
 
 from .base import StatsReport
 
@@ -97,39 +96,18 @@ class UsageSummaryByPool(StatsReport):
         end = self.endDate.stamp()
         logger.debug(self.pool.value)
 
-        items = events.statsManager().getEvents(events.OT_DEPLOYED, (events.ET_LOGIN, events.ET_LOGOUT), owner_id=pool.id, since=start, to=end).order_by('stamp')
-
-        logins = {}
-        users = {}
-        for i in items:
-            # if '\\' in i.fld1:
-            #    continue
-            username = i.fld4
-            if i.event_type == events.ET_LOGIN:
-                logins[username] = i.stamp
-            else:
-                if username in logins:
-                    stamp = logins[username]
-                    del logins[username]
-                    total = i.stamp - stamp
-                    if username not in users:
-                        users[username] = { 'sessions': 0, 'time': 0 }
-                    users[username]['sessions'] += 1
-                    users[username]['time'] += total
-                    # data.append({
-                    #    'name': i.fld4,
-                    #    'date': datetime.datetime.fromtimestamp(stamp),
-                    #    'time': total
-                    # })
+        cols = analytics.loadEvents(events.OT_DEPLOYED, (events.ET_LOGIN, events.ET_LOGOUT), ('event_type', 'fld4'), owner_id=pool.id, since=start, to=end)
+        usernames = cols.labels['fld4']
+        sessions, times = analytics.sessionsByUser(cols['stamp'], cols['event_type'], cols['fld4'], events.ET_LOGIN, events.ET_LOGOUT, len(usernames))
 
         # Extract different number of users
         data = []
-        for k, v in users.items():
+        for user in sessions.nonzero()[0]:
             data.append({
-                'user': k,
-                'sessions': v['sessions'],
-                'hours': '{:.2f}'.format(float(v['time']) / 3600),
-                'average': '{:.2f}'.format(float(v['time']) / 3600 / v['sessions'])
+                'user': usernames[user],
+                'sessions': int(sessions[user]),
+                'hours': '{:.2f}'.format(float(times[user]) / 3600),
+                'average': '{:.2f}'.format(float(times[user]) / 3600 / sessions[user])
             })
 
         return data, pool.name
@@ -164,15 +142,10 @@ class UsageSummaryByPoolCSV(UsageSummaryByPool):
     startDate = UsageSummaryByPool.startDate
     endDate = UsageSummaryByPool.endDate
 
-    def generate(self):
-        output = io.StringIO()
-        writer = csv.writer(output)
-
+    def generateRows(self):
         reportData, poolName = self.getData()
 
-        writer.writerow([ugettext('User'), ugettext('Sessions'), ugettext('Hours'), ugettext('Average')])
+        yield [ugettext('User'), ugettext('Sessions'), ugettext('Hours'), ugettext('Average')]
 
         for v in reportData:
-            writer.writerow([v['user'], v['sessions'], v['hours'], v['average']])
-
-        return output.getvalue()
+            yield [v['user'], v['sessions'], v['hours'], v['average']]
@@ -31,16 +31,15 @@
 .. moduleauthor:: Adolfo Gómez, dkmaster at dkmon dot com
 """
 import io
-import csv
 import datetime
 import logging
 
 from django.utils.translation import ugettext, ugettext_lazy as _
-from django.db.models import Count
 import django.template.defaultfilters as filters
 
 from uds.core.ui.UserInterface import gui
 from uds.core.util.stats import events
+from uds.core.util.stats import analytics
 
 from uds.core.reports import graphs
 
@@ -150,27 +149,29 @@ class PoolPerformanceReport(StatsReport):
         # Store dataUsers for all pools
         poolsData = []
 
-        fld = events.statsManager().getEventFldFor('username')
+        # Accesses of all pools are read at once, and counted by interval for every pool
+        bounds = analytics.intervalBounds(samplingIntervals)
+        cols = analytics.loadEvents(events.OT_DEPLOYED, events.ET_ACCESS, ('owner_id', 'username'), owner_id=[p[0] for p in pools], since=bounds[0], to=bounds[-1])
 
         reportData = []
-        for p in pools:
+        for n, p in enumerate(pools):
+            self.progress(100 * n / len(pools))
+            poolEvents = cols.select(cols['owner_id'] == p[0])
+            accesses = analytics.histogram(poolEvents['stamp'], bounds)
+            users = analytics.distinctByInterval(poolEvents['stamp'], poolEvents['username'], bounds)
+
             dataUsers = []
             dataAccesses = []
-            for interval in samplingIntervals:
+            for i, interval in enumerate(samplingIntervals):
                 key = (interval[0] + interval[1]) / 2
-                q = events.statsManager().getEvents(events.OT_DEPLOYED, events.ET_ACCESS, since=interval[0], to=interval[1], owner_id=p[0]).values(fld).annotate(cnt=Count(fld))
-                accesses = 0
-                for v in q:
-                    accesses += v['cnt']
-
-                dataUsers.append((key, len(q)))  # @UndefinedVariable
-                dataAccesses.append((key, accesses))
+                dataUsers.append((key, int(users[i])))  # @UndefinedVariable
+                dataAccesses.append((key, int(accesses[i])))
                 reportData.append(
                     {
                         'name': p[1],
                         'date': tools.timestampAsStr(interval[0], xLabelFormat) + ' - ' + tools.timestampAsStr(interval[1], xLabelFormat),
-                        'users': len(q),
-                        'accesses': accesses
+                        'users': int(users[i]),
+                        'accesses': int(accesses[i])
                     }
                 )
             poolsData.append({
@@ -256,15 +257,10 @@ class PoolPerformanceReportCSV(PoolPerformanceReport):
     endDate = PoolPerformanceReport.endDate
     samplingPoints = PoolPerformanceReport.samplingPoints
 
-    def generate(self):
-        output = io.StringIO()
-        writer = csv.writer(output)
-
+    def generateRows(self):
         reportData = self.getRangeData()[2]
 
-        writer.writerow([ugettext('Pool'), ugettext('Date range'), ugettext('Users'), ugettext('Accesses')])
+        yield [ugettext('Pool'), ugettext('Date range'), ugettext('Users'), ugettext('Accesses')]
 
         for v in reportData:
-            writer.writerow([v['name'], v['date'], v['users'], v['accesses']])
-
-        return output.getvalue()
+            yield [v['name'], v['date'], v['users'], v['accesses']]
@@ -35,7 +35,6 @@ from django.utils.translation import ugettext, ugettext_lazy as _
 from uds.core.ui.UserInterface import gui
 from uds.core.util.stats import counters
 
-import csv
 import io
 import datetime
 import logging
@@ -160,15 +159,11 @@ class CountersPoolAssignedCSV(CountersPoolAssigned):
     startDate = CountersPoolAssigned.startDate
     pools = CountersPoolAssigned.pools
 
-    def generate(self):
-        output = io.StringIO()
-        writer = csv.writer(output)
-        writer.writerow([ugettext('Pool'), ugettext('Hour'), ugettext('Services')])
+    def generateRows(self):
+        yield [ugettext('Pool'), ugettext('Hour'), ugettext('Services')]
 
         items = self.getData()
 
         for i in items:
             for j in range(24):
-                writer.writerow([i['name'], '{:02d}'.format(j), i['hours'][j]])
-
-        return output.getvalue()
+                yield [i['name'], '{:02d}'.format(j), i['hours'][j]]
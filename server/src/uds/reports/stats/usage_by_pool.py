@@ -37,8 +37,6 @@ from django.utils.translation import ugettext, ugettext_lazy as _
 from uds.core.ui.UserInterface import gui
 from uds.core.util.stats import events
 
-import six
-import csv
 
 from .base import StatsReport
 
@@ -92,35 +90,34 @@ class UsageByPool(StatsReport):
         ]
         self.pool.setValues(vals)
 
-    def getData(self):
-        # Generate the sampling intervals and get dataUsers from db
+    def iterData(self, pool):
+        """
+        Generator of the sessions of the pool, reading events from database in chunks
+        """
         start = self.startDate.stamp()
         end = self.endDate.stamp()
-        logger.debug(self.pool.value)
-        pool = ServicePool.objects.get(uuid=self.pool.value)
 
         items = events.statsManager().getEvents(events.OT_DEPLOYED, (events.ET_LOGIN, events.ET_LOGOUT), owner_id=pool.id, since=start, to=end).order_by('stamp')
 
         logins = {}
-        data = []
-        for i in items:
-            # if '\\' in i.fld1:
-            #    continue
-
-            if i.event_type == events.ET_LOGIN:
-                logins[i.fld4] = i.stamp
+        for eventType, name, eventStamp in items.values_list('event_type', 'fld4', 'stamp').iterator(chunk_size=10000):
+            if eventType == events.ET_LOGIN:
+                logins[name] = eventStamp
             else:
-                if i.fld4 in logins:
-                    stamp = logins[i.fld4]
-                    del logins[i.fld4]
-                    total = i.stamp - stamp
-                    data.append({
-                        'name': i.fld4,
+                if name in logins:
+                    stamp = logins.pop(name)
+                    yield {
+                        'name': name,
                         'date': datetime.datetime.fromtimestamp(stamp),
-                        'time': total
-                    })
+                        'time': eventStamp - stamp
+                    }
+
+    def getData(self):
+        # Generate the sampling intervals and get dataUsers from db
+        logger.debug(self.pool.value)
+        pool = ServicePool.objects.get(uuid=self.pool.value)
 
-        logger.debug('data: {}'.format(data))
+        data = list(self.iterData(pool))
 
         return data, pool.name
 
@@ -149,15 +146,10 @@ class UsageByPoolCSV(UsageByPool):
     startDate = UsageByPool.startDate
     endDate = UsageByPool.endDate
 
-    def generate(self):
-        output = six.StringIO()
-        writer = csv.writer(output)
-
-        reportData, poolName = self.getData()
-
-        writer.writerow([ugettext('Date'), ugettext('User'), ugettext('Seconds')])
+    def generateRows(self):
+        pool = ServicePool.objects.get(uuid=self.pool.value)
 
-        for v in reportData:
-            writer.writerow([v['date'], v['name'], v['time']])
+        yield [ugettext('Date'), ugettext('User'), ugettext('Seconds')]
 
-        return output.getvalue()
+        for v in self.iterData(pool):
+            yield [v['date'], v['name'], v['time']]
@@ -30,7 +30,6 @@
 """
 .. moduleauthor:: Adolfo Gómez, dkmaster at dkmon dot com
 """
-import csv
 import io
 import datetime
 import logging
@@ -40,6 +39,7 @@ import django.template.defaultfilters as filters
 
 from uds.core.ui.UserInterface import gui
 from uds.core.util.stats import events
+from uds.core.util.stats import analytics
 from uds.core.reports import graphs
 
 from .base import StatsReport
@@ -121,16 +121,18 @@ class StatsReportLogin(StatsReport):
             samplingIntervals.append((prevVal, val))
             prevVal = val
 
+        bounds = analytics.intervalBounds(samplingIntervals)
+        logins = analytics.histogram(analytics.loadEvents(events.OT_AUTHENTICATOR, events.ET_LOGIN, (), since=bounds[0], to=bounds[-1])['stamp'], bounds)
+
         data = []
         reportData = []
-        for interval in samplingIntervals:
+        for interval, val in zip(samplingIntervals, logins):
             key = (interval[0] + interval[1]) / 2
-            val = events.statsManager().getEvents(events.OT_AUTHENTICATOR, events.ET_LOGIN, since=interval[0], to=interval[1]).count()
-            data.append((key, val))  # @UndefinedVariable
+            data.append((key, int(val)))  # @UndefinedVariable
             reportData.append(
                 {
                     'date': tools.timestampAsStr(interval[0], xLabelFormat) + ' - ' + tools.timestampAsStr(interval[1], xLabelFormat),
-                    'users': val
+                    'users': int(val)
                 }
             )
 
@@ -140,15 +142,11 @@ class StatsReportLogin(StatsReport):
         start = self.startDate.stamp()
         end = self.endDate.stamp()
 
-        dataWeek = [0] * 7
-        dataHour = [0] * 24
-        dataWeekHour = [[0] * 24 for _ in range(7)]
-        for val in events.statsManager().getEvents(events.OT_AUTHENTICATOR, events.ET_LOGIN, since=start, to=end):
-            s = datetime.datetime.fromtimestamp(val.stamp)
-            dataWeek[s.weekday()] += 1
-            dataHour[s.hour] += 1
-            dataWeekHour[s.weekday()][s.hour] += 1
-            logger.debug('Data: {} {}'.format(s.weekday(), s.hour))
+        heatmap = analytics.weekHourHeatmap(analytics.loadEvents(events.OT_AUTHENTICATOR, events.ET_LOGIN, (), since=start, to=end)['stamp'])
+
+        dataWeek = [int(v) for v in heatmap.sum(axis=1)]
+        dataHour = [int(v) for v in heatmap.sum(axis=0)]
+        dataWeekHour = [[int(v) for v in row] for row in heatmap]
 
         return dataWeek, dataHour, dataWeekHour
 
@@ -267,15 +265,10 @@ class StatsReportLoginCSV(StatsReportLogin):
     endDate = StatsReportLogin.endDate
     samplingPoints = StatsReportLogin.samplingPoints
 
-    def generate(self):
-        output = io.StringIO()
-        writer = csv.writer(output)
-
+    def generateRows(self):
         reportData = self.getRangeData()[2]
 
-        writer.writerow([ugettext('Date range'), ugettext('Users')])
+        yield [ugettext('Date range'), ugettext('Users')]
 
         for v in reportData:
-            writer.writerow([v['date'], v['users']])
-
-        return output.getvalue()
+            yield [v['date'], v['users']]
@@ -33,6 +33,7 @@
 from uds.core.services import UserDeployment
 from uds.core.util.State import State
 from uds.core.util import log
+from uds.core.util import serializer
 from .OVirtJobs import OVirtDeferredRemoval
 
 import pickle
@@ -76,19 +77,19 @@ class OVirtLinkedDeployment(UserDeployment):
         """
         Does nothing right here, we will use environment storage in this sample
         """
-        return b'\1'.join([b'v1',
-             self._name.encode('utf8'),
-             self._ip.encode('utf8'),
-             self._mac.encode('utf8'),
-             self._vmid.encode('utf8'),
-             self._reason.encode('utf8'),
-             pickle.dumps(self._queue, protocol=0)
-        ])
+        return serializer.dumps(['v2', self._name, self._ip, self._mac, self._vmid, self._reason, self._queue])
 
     def unmarshal(self, str_):
         """
         Does nothing here also, all data are keeped at environment storage
         """
+        if serializer.isSerialized(str_):
+            vals = serializer.loads(str_)
+            if vals[0] == 'v2':
+                self._name, self._ip, self._mac, self._vmid, self._reason, self._queue = vals[1:7]
+            return
+
+        # Legacy format
         vals = str_.split(b'\1')
         if vals[0] == b'v1':
             self._name = vals[1].decode('utf8')
@@ -97,7 +98,8 @@ class OVirtLinkedDeployment(UserDeployment):
             self._vmid = vals[4].decode('utf8')
             self._reason = vals[5].decode('utf8')
             queue = pickle.loads(vals[6])
-            self._queue = pickle.loads(queue)
+            # Some versions pickled queue twice
+            self._queue = pickle.loads(queue) if isinstance(queue, bytes) else queue
 
     def getName(self):
         """
@@ -347,6 +347,12 @@ class OVirtLinkedService(Service):
         """
         return self.parent().getMachineState(machineId)
 
+    def getMachinesStates(self, machinesIds):
+        """
+        Invokes getMachinesStates from parent provider
+        """
+        return self.parent().getMachinesStates(machinesIds)
+
     def startMachine(self, machineId):
         """
         Tries to start a machine. No check is done, it is simply requested to oVirt.
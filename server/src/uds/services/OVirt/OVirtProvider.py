@@ -35,7 +35,7 @@ Created on Jun 22, 2012
 from __future__ import unicode_literals
 
 from django.utils.translation import ugettext_noop as _
-from uds.core.services import ServiceProvider
+from uds.core.services import ServiceProvider, StatePoller
 from uds.core.ui import gui
 from uds.core.util import validators
 
@@ -120,10 +120,8 @@ class Provider(ServiceProvider):
     # Own variables
     _api = None
 
-    # oVirt engine, right now, only permits a connection to one server and only one per instance
-    # If we want to connect to more than one server, we need keep locked access to api, change api server, etc..
-    # We have implemented an "exclusive access" client that will only connect to one server at a time (using locks)
-    # and this way all will be fine
+    # Client connections to oVirt engine are pooled (by engine and credentials), so requests of every provider
+    # can be done concurrently (see client.oVirtClient4.ConnectionPool)
     def __getApi(self):
         """
         Returns the connection API object for oVirt (using ovirtsdk)
@@ -133,6 +131,12 @@ class Provider(ServiceProvider):
             self._api = APIClass(self.host.value, self.username.value, self.password.value, self.timeout.value, self.cache)
         return self._api
 
+    def __poller(self):
+        """
+        Returns the poller used to get the states of the machines of this provider
+        """
+        return StatePoller.poller(self.env.key)
+
     # There is more fields type, but not here the best place to cover it
     def initialize(self, values=None):
         """
@@ -301,7 +305,7 @@ class Provider(ServiceProvider):
     def getMachineState(self, machineId):
         """
         Returns the state of the machine
-        This method do not uses cache at all (it always tries to get machine state from oVirt server)
+        States are got in bulk for all machines being checked, so they can be up to StatePoller.SNAPSHOT_TIME seconds old
 
         Args:
             machineId: Id of the machine to get state
@@ -314,7 +318,20 @@ class Provider(ServiceProvider):
              suspended, image_illegal, image_locked or powering_down
              Also can return'unknown' if Machine is not known
         """
-        return self.__getApi().getMachineState(machineId)
+        return self.__poller().getState(machineId, self.getMachinesStates)
+
+    def getMachinesStates(self, machinesIds):
+        """
+        Returns the state of several machines, with as few requests to oVirt server as possible
+        This method do not uses cache at all
+
+        Args:
+            machinesIds: Ids of the machines to get state
+
+        Returns:
+            A dictionary, machine id -> state (same values as getMachineState)
+        """
+        return self.__getApi().getMachinesStates(machinesIds)
 
     def removeTemplate(self, templateId):
         """
@@ -353,6 +370,7 @@ class Provider(ServiceProvider):
 
         Returns:
         """
+        self.__poller().invalidate(machineId)
         return self.__getApi().startMachine(machineId)
 
     def stopMachine(self, machineId):
@@ -364,6 +382,7 @@ class Provider(ServiceProvider):
 
         Returns:
         """
+        self.__poller().invalidate(machineId)
         return self.__getApi().stopMachine(machineId)
 
     def suspendMachine(self, machineId):
@@ -375,6 +394,7 @@ class Provider(ServiceProvider):
 
         Returns:
         """
+        self.__poller().invalidate(machineId)
         return self.__getApi().suspendMachine(machineId)
 
     def removeMachine(self, machineId):
@@ -386,6 +406,7 @@ class Provider(ServiceProvider):
 
         Returns:
         """
+        self.__poller().invalidate(machineId, forget=True)
         return self.__getApi().removeMachine(machineId)
 
     def updateMachineMac(self, machineId, macAddres):
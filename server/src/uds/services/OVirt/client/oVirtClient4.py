@@ -13,33 +13,126 @@ try:
 except:
     pass
 
+import contextlib
 import threading
 import logging
+import time
+import os
 import six
 
 __updated__ = '2019-02-06'
 
 logger = logging.getLogger(__name__)
 
-lock = threading.Lock()
+# Errors that means that a connection is not usable anymore
+BROKEN_CONNECTION_ERRORS = tuple(getattr(ovirt, e) for e in ('ConnectionError', 'AuthError', 'TimeoutError') if hasattr(ovirt, e))
 
-cached_api = None
-cached_api_key = None
+
+class ConnectionPool(object):
+    """
+    Pool of authenticated connections to an oVirt engine (one pool per engine and credentials).
+
+    An ovirtsdk4 connection can't be used concurrently, but several connections can be used at same time,
+    so every request borrows an idle connection (or creates a new one, up to MAX_CONNECTIONS) and returns it when done.
+    Connections idle for more than CHECK_IDLE seconds are tested before being reused.
+    """
+    MAX_CONNECTIONS = 8
+    CHECK_IDLE = 60
+
+    _pools = {}
+    _poolsLock = threading.Lock()
+
+    def __init__(self, host, username, password, timeout):
+        self._url = 'https://' + host + '/ovirt-engine/api'
+        self._host = host
+        self._username = username
+        self._password = password
+        self._timeout = timeout
+        self._lock = threading.Lock()
+        self._semaphore = threading.BoundedSemaphore(ConnectionPool.MAX_CONNECTIONS)
+        self._idle = []  # (connection, last used)
+        self._pid = os.getpid()
+
+    @staticmethod
+    def pool(host, username, password, timeout):
+        key = (host, username, password, timeout)
+        with ConnectionPool._poolsLock:
+            pool = ConnectionPool._pools.get(key)
+            if pool is None or pool._pid != os.getpid():  # Connections of a parent process can't be used
+                pool = ConnectionPool._pools[key] = ConnectionPool(host, username, password, timeout)
+            return pool
+
+    def _connect(self):
+        try:
+            return ovirt.Connection(url=self._url, username=self._username, password=self._password, timeout=self._timeout, insecure=True)  # , debug=True, log=logger )
+        except Exception:
+            logger.exception('Exception connection ovirt at {0}'.format(self._host))
+            raise Exception("Can't connet to server at {0}".format(self._host))
+
+    @staticmethod
+    def _close(connection):
+        try:
+            connection.close()
+        except Exception:
+            # Nothing happens, may it was already disconnected
+            pass
+
+    def _get(self):
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                connection, lastUsed = self._idle.pop()
+            if time.time() - lastUsed < ConnectionPool.CHECK_IDLE or connection.test():
+                return connection
+            self._close(connection)
+        return self._connect()
+
+    @contextlib.contextmanager
+    def connection(self):
+        """
+        Borrows a connection from the pool, returning it to pool when done (unless it is broken)
+        """
+        self._semaphore.acquire()
+        connection = None
+        try:
+            connection = self._get()
+            yield connection
+        except BROKEN_CONNECTION_ERRORS:
+            if connection is not None:
+                self._close(connection)
+                connection = None
+            raise
+        finally:
+            if connection is not None:
+                with self._lock:
+                    self._idle.append((connection, time.time()))
+            self._semaphore.release()
+
+    def close(self):
+        """
+        Closes all idle connections
+        """
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection, _ in idle:
+            self._close(connection)
 
 
 class Client(object):
     """
     Module to manage oVirt connections using ovirtsdk.
 
-    Due to the fact that we can't create two proxy connections at same time, we serialize all access to ovirt platform.
-    Only one request and one live connection can exists at a time.
+    Connections are taken from a pool shared by all clients of same engine and credentials (see ConnectionPool),
+    so requests to oVirt platform can be done concurrently.
 
-    This can waste a lot of time, so use of cache here is more than important to achieve aceptable performance.
+    Anyway, use of cache here is more than important to achieve aceptable performance.
 
     """
 
     CACHE_TIME_LOW = 60 * 5  # Cache time for requests are 5 minutes by default
     CACHE_TIME_HIGH = 60 * 30  # Cache time for requests that are less probable to change (as cluster perteinance of a machine)
+    MAX_SEARCH_IDS = 50  # Max number of machines ids on a single search request
 
     def __getKey(self, prefix=''):
         """
@@ -50,35 +143,11 @@ class Client(object):
         """
         return "{}{}{}{}{}".format(prefix, self._host, self._username, self._password, self._timeout)
 
-    def __getApi(self):
+    def __api(self):
         """
-        Gets the api connection.
-
-        Again, due to the fact that ovirtsdk don't allow (at this moment, but it's on the "TODO" list) concurrent access to
-        more than one server, we keep only one opened connection.
-
-        Must be accesed "locked", so we can safely alter cached_api and cached_api_key
+        Gets an api connection from the pool, as a context manager (connection is returned to pool on exit)
         """
-        global cached_api, cached_api_key
-        aKey = self.__getKey('o-host')
-        # if cached_api_key == aKey:
-        #    return cached_api
-
-        if cached_api is not None:
-            try:
-                cached_api.close()
-            except:
-                # Nothing happens, may it was already disconnected
-                pass
-        try:
-            cached_api_key = aKey
-            cached_api = ovirt.Connection(url='https://' + self._host + '/ovirt-engine/api', username=self._username, password=self._password, timeout=self._timeout, insecure=True)  # , debug=True, log=logger )
-
-            return cached_api
-        except:
-            logger.exception('Exception connection ovirt at {0}'.format(self._host))
-            cached_api_key = None
-            raise Exception("Can't connet to server at {0}".format(self._host))
+        return ConnectionPool.pool(self._host, self._username, self._password, self._timeout).connection()
 
     def __init__(self, host, username, password, timeout, cache):
         self._host = host
@@ -90,13 +159,11 @@ class Client(object):
 
     def test(self):
         try:
-            lock.acquire(True)
-            return self.__getApi().test()
+            with self.__api() as api:
+                return api.test()
         except Exception as e:
             logger.error('Testing Server failed: {0}'.format(e))
             return False
-        finally:
-            lock.release()
 
     def isFullyFunctionalVersion(self):
         """
@@ -125,11 +192,7 @@ class Client(object):
         if val is not None and force is False:
             return val
 
-        try:
-            lock.acquire(True)
-
-            api = self.__getApi()
-
+        with self.__api() as api:
             vms = api.system_service().vms_service().list()
 
             logger.debug('oVirt VMS: {}'.format(vms))
@@ -147,9 +210,6 @@ class Client(object):
 
             return res
 
-        finally:
-            lock.release()
-
     def getClusters(self, force=False):
         """
         Obtains the list of clusters inside ovirt
@@ -172,11 +232,7 @@ class Client(object):
         if val is not None and force is False:
             return val
 
-        try:
-            lock.acquire(True)
-
-            api = self.__getApi()
-
+        with self.__api() as api:
             clusters = api.system_service().clusters_service().list()
 
             res = []
@@ -200,9 +256,6 @@ class Client(object):
 
             return res
 
-        finally:
-            lock.release()
-
     def getClusterInfo(self, clusterId, force=False):
         """
         Obtains the cluster info
@@ -225,11 +278,7 @@ class Client(object):
         if val is not None and force is False:
             return val
 
-        try:
-            lock.acquire(True)
-
-            api = self.__getApi()
-
+        with self.__api() as api:
             c = api.system_service().clusters_service().service(six.binary_type(clusterId)).get()
 
             dc = c.data_center
@@ -240,8 +289,6 @@ class Client(object):
             res = {'name': c.name, 'id': c.id, 'datacenter_id': dc}
             self._cache.put(clKey, res, Client.CACHE_TIME_HIGH)
             return res
-        finally:
-            lock.release()
 
     def getDatacenterInfo(self, datacenterId, force=False):
         """
@@ -275,11 +322,7 @@ class Client(object):
         if val is not None and force is False:
             return val
 
-        try:
-            lock.acquire(True)
-
-            api = self.__getApi()
-
+        with self.__api() as api:
             datacenter_service = api.system_service().data_centers_service().service(six.binary_type(datacenterId))
             d = datacenter_service.get()
 
@@ -300,8 +343,6 @@ class Client(object):
 
             self._cache.put(dcKey, res, Client.CACHE_TIME_HIGH)
             return res
-        finally:
-            lock.release()
 
     def getStorageInfo(self, storageId, force=False):
         """
@@ -329,11 +370,7 @@ class Client(object):
         if val is not None and force is False:
             return val
 
-        try:
-            lock.acquire(True)
-
-            api = self.__getApi()
-
+        with self.__api() as api:
             dd = api.system_service().storage_domains_service().service(six.binary_type(storageId)).get()
 
             res = {
@@ -346,8 +383,6 @@ class Client(object):
 
             self._cache.put(sdKey, res, Client.CACHE_TIME_LOW)
             return res
-        finally:
-            lock.release()
 
     def makeTemplate(self, name, comments, machineId, clusterId, storageId, displayType):
         """
@@ -366,11 +401,7 @@ class Client(object):
         """
         logger.debug("n: {0}, c: {1}, vm: {2}, cl: {3}, st: {4}, dt: {5}".format(name, comments, machineId, clusterId, storageId, displayType))
 
-        try:
-            lock.acquire(True)
-
-            api = self.__getApi()
-
+        with self.__api() as api:
             # cluster = ov.clusters_service().service('00000002-0002-0002-0002-0000000002e4') # .get()
             # vm = ov.vms_service().service('e7ff4e00-b175-4e80-9c1f-e50a5e76d347') # .get()
 
@@ -408,8 +439,6 @@ class Client(object):
             # display=display)
 
             return api.system_service().templates_service().add(template).id
-        finally:
-            lock.release()
 
     def getTemplateState(self, templateId):
         """
@@ -423,11 +452,7 @@ class Client(object):
 
         (don't know if ovirt returns something more right now, will test what happens when template can't be published)
         """
-        try:
-            lock.acquire(True)
-
-            api = self.__getApi()
-
+        with self.__api() as api:
             try:
                 template = api.system_service().templates_service().service(six.binary_type(templateId)).get()
 
@@ -438,9 +463,6 @@ class Client(object):
             except Exception:  # Not found
                 return 'removed'
 
-        finally:
-            lock.release()
-
     def deployFromTemplate(self, name, comments, templateId, clusterId, displayType, usbType, memoryMB, guaranteedMB):
         """
         Deploys a virtual machine on selected cluster from selected template
@@ -459,11 +481,7 @@ class Client(object):
         """
         logger.debug('Deploying machine with name "{0}" from template {1} at cluster {2} with display {3} and usb {4}, memory {5} and guaranteed {6}'.format(
             name, templateId, clusterId, displayType, usbType, memoryMB, guaranteedMB))
-        try:
-            lock.acquire(True)
-
-            api = self.__getApi()
-
+        with self.__api() as api:
             logger.debug('Deploying machine {0}'.format(name))
 
             cluster = ovirt.types.Cluster(id=six.binary_type(clusterId))
@@ -481,24 +499,15 @@ class Client(object):
 
             return api.system_service().vms_service().add(par).id
 
-        finally:
-            lock.release()
-
     def removeTemplate(self, templateId):
         """
         Removes a template from ovirt server
 
         Returns nothing, and raises an Exception if it fails
         """
-        try:
-            lock.acquire(True)
-
-            api = self.__getApi()
-
+        with self.__api() as api:
             api.system_service().templates_service().service(six.binary_type(templateId)).remove()
             # This returns nothing, if it fails it raises an exception
-        finally:
-            lock.release()
 
     def getMachineState(self, machineId):
         """
@@ -516,11 +525,7 @@ class Client(object):
              suspended, image_illegal, image_locked or powering_down
              Also can return'unknown' if Machine is not known
         """
-        try:
-            lock.acquire(True)
-
-            api = self.__getApi()
-
+        with self.__api() as api:
             try:
                 vm = api.system_service().vms_service().service(six.binary_type(machineId)).get()
 
@@ -531,8 +536,30 @@ class Client(object):
             except Exception:  # machine not found
                 return 'unknown'
 
-        finally:
-            lock.release()
+    def getMachinesStates(self, machinesIds):
+        """
+        Returns current state of several machines, using a single search request to oVirt server for every MAX_SEARCH_IDS machines.
+        This method do not uses cache at all
+
+        Args:
+            machinesIds: Ids of the machines to get status
+
+        Returns:
+            A dictionary, with machines ids as keys and same values that getMachineState as values
+            ('unknown' if Machine is not known)
+        """
+        machinesIds = list(machinesIds)
+        res = dict.fromkeys(machinesIds, 'unknown')
+
+        with self.__api() as api:
+            vmsService = api.system_service().vms_service()
+            for pos in range(0, len(machinesIds), Client.MAX_SEARCH_IDS):
+                search = ' or '.join('id={}'.format(machineId) for machineId in machinesIds[pos:pos + Client.MAX_SEARCH_IDS])
+                for vm in vmsService.list(search=search):
+                    if vm.id in res and vm.status is not None:
+                        res[vm.id] = vm.status.value
+
+        return res
 
     def startMachine(self, machineId):
         """
@@ -545,11 +572,7 @@ class Client(object):
 
         Returns:
         """
-        try:
-            lock.acquire(True)
-
-            api = self.__getApi()
-
+        with self.__api() as api:
             vmService = api.system_service().vms_service().service(six.binary_type(machineId))
 
             if vmService.get() is None:
@@ -557,9 +580,6 @@ class Client(object):
 
             vmService.start()
 
-        finally:
-            lock.release()
-
     def stopMachine(self, machineId):
         """
         Tries to start a machine. No check is done, it is simply requested to oVirt
@@ -569,11 +589,7 @@ class Client(object):
 
         Returns:
         """
-        try:
-            lock.acquire(True)
-
-            api = self.__getApi()
-
+        with self.__api() as api:
             vmService = api.system_service().vms_service().service(six.binary_type(machineId))
 
             if vmService.get() is None:
@@ -581,9 +597,6 @@ class Client(object):
 
             vmService.stop()
 
-        finally:
-            lock.release()
-
     def suspendMachine(self, machineId):
         """
         Tries to start a machine. No check is done, it is simply requested to oVirt
@@ -593,11 +606,7 @@ class Client(object):
 
         Returns:
         """
-        try:
-            lock.acquire(True)
-
-            api = self.__getApi()
-
+        with self.__api() as api:
             vmService = api.system_service().vms_service().service(six.binary_type(machineId))
 
             if vmService.get() is None:
@@ -605,9 +614,6 @@ class Client(object):
 
             vmService.suspend()
 
-        finally:
-            lock.release()
-
     def removeMachine(self, machineId):
         """
         Tries to delete a machine. No check is done, it is simply requested to oVirt
@@ -617,11 +623,7 @@ class Client(object):
 
         Returns:
         """
-        try:
-            lock.acquire(True)
-
-            api = self.__getApi()
-
+        with self.__api() as api:
             vmService = api.system_service().vms_service().service(six.binary_type(machineId))
 
             if vmService.get() is None:
@@ -629,96 +631,77 @@ class Client(object):
 
             vmService.remove()
 
-        finally:
-            lock.release()
-
     def updateMachineMac(self, machineId, macAddres):
         """
         Changes the mac address of first nic of the machine to the one specified
         """
         try:
-            lock.acquire(True)
-
-            api = self.__getApi()
+            with self.__api() as api:
+                vmService = api.system_service().vms_service().service(six.binary_type(machineId))
 
-            vmService = api.system_service().vms_service().service(six.binary_type(machineId))
+                if vmService.get() is None:
+                    raise Exception('Machine not found')
 
-            if vmService.get() is None:
-                raise Exception('Machine not found')
-
-            nic = vmService.nics_service().list()[0]  # If has no nic, will raise an exception (IndexError)
-            nic.mac.address = macAddres
-            nicService = vmService.nics_service().service(nic.id)
-            nicService.update(nic)
+                nic = vmService.nics_service().list()[0]  # If has no nic, will raise an exception (IndexError)
+                nic.mac.address = macAddres
+                nicService = vmService.nics_service().service(nic.id)
+                nicService.update(nic)
         except IndexError:
             raise Exception('Machine do not have network interfaces!!')
 
-        finally:
-            lock.release()
-
     def fixUsb(self, machineId):
         # Fix for usb support
         if self._needsUsbFix:
-            try:
-                lock.acquire(True)
-
-                api = self.__getApi()
+            with self.__api() as api:
                 usb = ovirt.types.Usb(enabled=True, type=ovirt.types.UsbType.NATIVE)
                 vms = api.system_service().vms_service().service(six.binary_type(machineId))
                 vmu = ovirt.types.Vm(usb=usb)
                 vms.update(vmu)
-            finally:
-                lock.release()
 
     def getConsoleConnection(self, machineId):
         """
         Gets the connetion info for the specified machine
         """
         try:
-            lock.acquire(True)
-            api = self.__getApi()
-
-            vmService = api.system_service().vms_service().service(six.binary_type(machineId))
-            vm = vmService.get()
-
-            if vm is None:
-                raise Exception('Machine not found')
-
-            display = vm.display
-            ticket = vmService.ticket()
-
-            # Get host subject
-            cert_subject = ''
-            if display.certificate is not None:
-                cert_subject = display.certificate.subject
-            else:
-                for i in api.system_service().hosts_service().list():
-                    for k in api.system_service().hosts_service().service(i.id).nics_service().list():
-                        if k.ip.address == display.address:
-                            cert_subject = i.certificate.subject
+            with self.__api() as api:
+                vmService = api.system_service().vms_service().service(six.binary_type(machineId))
+                vm = vmService.get()
+
+                if vm is None:
+                    raise Exception('Machine not found')
+
+                display = vm.display
+                ticket = vmService.ticket()
+
+                # Get host subject
+                cert_subject = ''
+                if display.certificate is not None:
+                    cert_subject = display.certificate.subject
+                else:
+                    for i in api.system_service().hosts_service().list():
+                        for k in api.system_service().hosts_service().service(i.id).nics_service().list():
+                            if k.ip.address == display.address:
+                                cert_subject = i.certificate.subject
+                                break
+                        # If found
+                        if cert_subject != '':
                             break
-                    # If found
-                    if cert_subject != '':
-                        break
-
-            return {
-                'type': display.type.value,
-                'address': display.address,
-                'port': display.port,
-                'secure_port': display.secure_port,
-                'monitors': display.monitors,
-                'cert_subject': cert_subject,
-                'ticket': {
-                    'value': ticket.value,
-                    'expiry': ticket.expiry
+
+                return {
+                    'type': display.type.value,
+                    'address': display.address,
+                    'port': display.port,
+                    'secure_port': display.secure_port,
+                    'monitors': display.monitors,
+                    'cert_subject': cert_subject,
+                    'ticket': {
+                        'value': ticket.value,
+                        'expiry': ticket.expiry
+                    }
                 }
-            }
 
         except Exception:
             return None
 
-        finally:
-            lock.release()
-
     def desktopLogin(self, machineId, username, password, domain):
         pass
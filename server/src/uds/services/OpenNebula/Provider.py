@@ -35,7 +35,7 @@ Created on Jun 22, 2012
 from __future__ import unicode_literals
 
 from django.utils.translation import ugettext_noop as _
-from uds.core.services import ServiceProvider
+from uds.core.services import ServiceProvider, StatePoller
 from uds.core.ui import gui
 from uds.core.util import validators
 from defusedxml import minidom
@@ -136,6 +136,12 @@ class Provider(ServiceProvider):
     def resetApi(self):
         self._api = None
 
+    def __poller(self):
+        '''
+        Returns the poller used to get the states of the machines of this provider
+        '''
+        return StatePoller.poller(self.env.key)
+
     def sanitizeVmName(self, name):
         return on.sanitizeName(name)
 
@@ -177,7 +183,7 @@ class Provider(ServiceProvider):
     def getMachineState(self, machineId):
         '''
         Returns the state of the machine
-        This method do not uses cache at all (it always tries to get machine state from OpenNebula server)
+        States are got in bulk for all machines being checked, so they can be up to StatePoller.SNAPSHOT_TIME seconds old
 
         Args:
             machineId: Id of the machine to get state
@@ -185,7 +191,13 @@ class Provider(ServiceProvider):
         Returns:
             one of the on.VmState Values
         '''
-        return on.vm.getMachineState(self.api, machineId)
+        return self.__poller().getState(machineId, self.getMachinesStates, lambda machineId: on.vm.getMachineState(self.api, machineId))
+
+    def getMachinesStates(self, machinesIds):
+        '''
+        Returns the state of several machines, as a dictionary id -> on.VmState value (machines not found are not included)
+        '''
+        return on.vm.getMachinesStates(self.api, machinesIds)
 
     def getMachineSubstate(self, machineId):
         '''
@@ -204,6 +216,7 @@ class Provider(ServiceProvider):
 
         Returns:
         '''
+        self.__poller().invalidate(machineId)
         on.vm.startMachine(self.api, machineId)
         return True
 
@@ -216,6 +229,7 @@ class Provider(ServiceProvider):
 
         Returns:
         '''
+        self.__poller().invalidate(machineId)
         on.vm.stopMachine(self.api, machineId)
         return True
 
@@ -228,6 +242,7 @@ class Provider(ServiceProvider):
 
         Returns:
         '''
+        self.__poller().invalidate(machineId)
         on.vm.suspendMachine(self.api, machineId)
         return True
 
@@ -235,6 +250,7 @@ class Provider(ServiceProvider):
         '''
         Resets a machine (hard-reboot)
         '''
+        self.__poller().invalidate(machineId)
         on.vm.resetMachine(self.api, machineId)
 
     def removeMachine(self, machineId):
@@ -246,6 +262,7 @@ class Provider(ServiceProvider):
 
         Returns:
         '''
+        self.__poller().invalidate(machineId, forget=True)
         on.vm.removeMachine(self.api, machineId)
         return True
 
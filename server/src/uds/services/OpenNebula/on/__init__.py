@@ -262,6 +262,15 @@ class OpenNebulaClient(object):
         for ds in asList(result['VM_POOL']['VM']):
             yield(ds['ID'], ds['NAME'])
 
+    @ensureConnected
+    def getVMsStates(self):
+        """
+        Returns the states of all VMs of the pool (same VMs as enumVMs), as a dictionary id -> state
+        """
+        result = checkResult(self.connection.one.vmpool.info(self.sessionString, -1, -1, -1, -1))
+        pool = result['VM_POOL'] or {}
+        return {v['ID']: int(v['STATE']) for v in asList(pool.get('VM', []))}
+
     @ensureConnected
     def VMInfo(self, vmId):
         """
@@ -66,6 +66,25 @@ def getMachineState(api, machineId):
     return VmState.UNKNOWN
 
 
+def getMachinesStates(api, machinesIds):
+    '''
+    Returns the states of several machines with a single request to OpenNebula server
+
+    Args:
+        machinesIds: Ids of the machines to get state
+
+    Returns:
+        A dictionary, machine id -> one of the on.VmState Values (machines not found are not included)
+    '''
+    try:
+        states = api.getVMsStates()
+        return {machineId: states[str(machineId)] for machineId in machinesIds if str(machineId) in states}
+    except Exception as e:
+        logger.error('Error obtaining machines states on OpenNebula: {}'.format(e))
+
+    return {}
+
+
 def getMachineSubstate(api, machineId):
     '''
     Returns the lcm_state
@@ -32,7 +32,7 @@
 """
 from django.utils.translation import ugettext_noop as _, ugettext
 from uds.core.transports import protocols
-from uds.core.services import Service, types as serviceTypes
+from uds.core.services import Service, StatePoller, types as serviceTypes
 from .LivePublication import LivePublication
 from .LiveDeployment import LiveDeployment
 from . import helpers
@@ -188,6 +188,12 @@ class LiveService(Service):
 
         return self._api
 
+    def __poller(self):
+        """
+        Returns the poller used to get the states of the machines of this service
+        """
+        return StatePoller.poller(self.env.key)
+
     def sanitizeVmName(self, name):
         return self.parent().sanitizeVmName(name)
 
@@ -235,6 +241,7 @@ class LiveService(Service):
     def getMachineState(self, machineId):
         """
         Invokes getServer from openstack client
+        (states are got in bulk for all machines being checked, so they can be up to StatePoller.SNAPSHOT_TIME seconds old)
 
         Args:
             machineId: If of the machine to get state
@@ -259,7 +266,15 @@ class LiveService(Service):
                 SUSPENDED. The server is suspended, either by request or necessity. This status appears for only the XenServer/XCP, KVM, and ESXi hypervisors. Administrative users can suspend an instance if it is infrequently used or to perform system maintenance. When you suspend an instance, its VM state is stored on disk, all memory is written to disk, and the virtual machine is stopped. Suspending an instance is similar to placing a device in hibernation; memory and vCPUs become available to create other instances.
                 VERIFY_RESIZE. System is awaiting confirmation that the server is operational after a move or resize.
         """
-        return self.api.getServer(machineId)['status']
+        return self.__poller().getState(machineId, self.getMachinesStates, lambda machineId: self.api.getServer(machineId)['status'])
+
+    def getMachinesStates(self, machinesIds):
+        """
+        Returns the state of several machines (see getMachineState) with a single request, as a dictionary id -> state
+        (machines not found are not included)
+        """
+        machinesIds = set(machinesIds)
+        return {server['id']: server['status'] for server in self.api.listServers(detail=True) if server['id'] in machinesIds}
 
     def startMachine(self, machineId):
         """
@@ -272,6 +287,7 @@ class LiveService(Service):
 
         Returns:
         """
+        self.__poller().invalidate(machineId)
         self.api.startServer(machineId)
 
     def stopMachine(self, machineId):
@@ -283,6 +299,7 @@ class LiveService(Service):
 
         Returns:
         """
+        self.__poller().invalidate(machineId)
         self.api.stopServer(machineId)
 
     def resetMachine(self, machineId):
@@ -294,6 +311,7 @@ class LiveService(Service):
 
         Returns:
         """
+        self.__poller().invalidate(machineId)
         self.api.resetServer(machineId)
 
     def suspendMachine(self, machineId):
@@ -305,6 +323,7 @@ class LiveService(Service):
 
         Returns:
         """
+        self.__poller().invalidate(machineId)
         self.api.suspendServer(machineId)
 
     def resumeMachine(self, machineId):
@@ -316,6 +335,7 @@ class LiveService(Service):
 
         Returns:
         """
+        self.__poller().invalidate(machineId)
         self.api.resumeServer(machineId)
 
     def removeMachine(self, machineId):
@@ -327,6 +347,7 @@ class LiveService(Service):
 
         Returns:
         """
+        self.__poller().invalidate(machineId, forget=True)
         self.api.deleteServer(machineId)
 
     def getNetInfo(self, machineId):
@@ -35,7 +35,7 @@ from __future__ import unicode_literals
 
 from django.utils.translation import ugettext_noop as _
 from uds.core.util.State import State
-from uds.core.services import ServiceProvider
+from uds.core.services import ServiceProvider, StatePoller
 from uds.core.ui import gui
 # from uds.core.util import validators
 
@@ -120,6 +120,12 @@ class Provider(ServiceProvider):
             self._api = XenServer(self.host.value, '443', self.username.value, self.password.value, True, self.verifySSL.isTrue())
         return self._api
 
+    def __poller(self):
+        """
+        Returns the poller used to get the states of the machines of this provider
+        """
+        return StatePoller.poller(self.env.key)
+
     # There is more fields type, but not here the best place to cover it
     def initialize(self, values=None):
         """
@@ -290,8 +296,15 @@ class Provider(ServiceProvider):
     def getVMPowerState(self, machineId):
         """
         Returns current machine power state
+        States are got in bulk for all machines being checked, so they can be up to StatePoller.SNAPSHOT_TIME seconds old
+        """
+        return self.__poller().getState(machineId, self.getVMsPowerStates, self.__getApi().getVMPowerState)
+
+    def getVMsPowerStates(self, machinesIds):
+        """
+        Returns current power state of several machines, as a dictionary id -> power state
         """
-        return self.__getApi().getVMPowerState(machineId)
+        return self.__getApi().getVMsPowerStates(machinesIds)
 
     def startVM(self, machineId, asnc=True):
         """
@@ -304,6 +317,7 @@ class Provider(ServiceProvider):
 
         Returns:
         """
+        self.__poller().invalidate(machineId)
         return self.__getApi().startVM(machineId, asnc)
 
     def stopVM(self, machineId, asnc=True):
@@ -315,6 +329,7 @@ class Provider(ServiceProvider):
 
         Returns:
         """
+        self.__poller().invalidate(machineId)
         return self.__getApi().stopVM(machineId, asnc)
 
     def resetVM(self, machineId, asnc=True):
@@ -326,6 +341,7 @@ class Provider(ServiceProvider):
 
         Returns:
         """
+        self.__poller().invalidate(machineId)
         return self.__getApi().resetVM(machineId, asnc)
 
     def canSuspendVM(self, machineId):
@@ -349,6 +365,7 @@ class Provider(ServiceProvider):
 
         Returns:
         """
+        self.__poller().invalidate(machineId)
         return self.__getApi().suspendVM(machineId, asnc)
 
     def resumeVM(self, machineId, asnc=True):
@@ -360,6 +377,7 @@ class Provider(ServiceProvider):
 
         Returns:
         """
+        self.__poller().invalidate(machineId)
         return self.__getApi().resumeVM(machineId, asnc)
 
     def removeVM(self, machineId):
@@ -371,6 +389,7 @@ class Provider(ServiceProvider):
 
         Returns:
         """
+        self.__poller().invalidate(machineId, forget=True)
         return self.__getApi().removeVM(machineId)
 
     def configureVM(self, machineId, netId, mac, memory):
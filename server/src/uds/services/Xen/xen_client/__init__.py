@@ -308,6 +308,17 @@ class XenServer(object):
         except XenAPI.Failure as e:
             raise XenFailure(e.details)
 
+    def getVMsPowerStates(self, vmIds):
+        """
+        Returns the power states of several machines with a single request, as a dictionary id -> power state
+        (machines not found are not included)
+        """
+        try:
+            vmIds = set(vmIds)
+            return {vmId: record['power_state'] for vmId, record in self.VM.get_all_records().items() if vmId in vmIds}
+        except XenAPI.Failure as e:
+            raise XenFailure(e.details)
+
     def getVMInfo(self, vmId):
         try:
             return self.VM.get_record(vmId)
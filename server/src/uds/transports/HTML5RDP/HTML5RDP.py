@@ -237,7 +237,7 @@ class HTML5RDPTransport(Transport):
 
         logger.debug('RDP Params: {0}'.format(params))
 
-        ticket = TicketStore.create(params, validity=self.ticketValidity.num())
+        ticket = TicketStore.create(params, validity=self.ticketValidity.num(), owner=TicketStore.OWNER_TUNNEL)
 
         return HttpResponseRedirect("{}/transport/?{}.{}&{}".format(self.guacamoleServer.value, ticket, scrambler, request.build_absolute_uri(reverse('utility.closer'))))
 
@@ -173,7 +173,7 @@ class TSNXTransport(BaseNXTransport):
             username, password = '', ''
 
         tunpass = ''.join(random.SystemRandom().choice(string.ascii_letters + string.digits) for _i in range(12))
-        tunuser = TicketStore.create(tunpass)
+        tunuser = TicketStore.create(tunpass, owner=TicketStore.OWNER_PAM)
 
         sshServer = self._tunnelServer
         if ':' not in sshServer:
@@ -119,7 +119,7 @@ class TRDPTransport(BaseRDPTransport):
         depth = self.colorDepth.value
 
         tunpass = ''.join(random.SystemRandom().choice(string.ascii_letters + string.digits) for _i in range(12))
-        tunuser = TicketStore.create(tunpass)
+        tunuser = TicketStore.create(tunpass, owner=TicketStore.OWNER_PAM)
 
         sshHost, sshPort = self.tunnelServer.value.split(':')
 
@@ -87,7 +87,7 @@ class TSPICETransport(BaseSpiceTransport):
 
         # Ticket
         tunpass = ''.join(random.SystemRandom().choice(string.letters + string.digits) for _i in range(12))
-        tunuser = TicketStore.create(tunpass)
+        tunuser = TicketStore.create(tunpass, owner=TicketStore.OWNER_PAM)
 
         sshHost, sshPort = self.tunnelServer.value.split(':')
 
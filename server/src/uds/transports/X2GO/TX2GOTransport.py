@@ -111,7 +111,7 @@ class TX2GOTransport(BaseX2GOTransport):
         )
 
         tunpass = ''.join(random.SystemRandom().choice(string.ascii_letters + string.digits) for _i in range(12))
-        tunuser = TicketStore.create(tunpass)
+        tunuser = TicketStore.create(tunpass, owner=TicketStore.OWNER_PAM)
 
         sshHost, sshPort = self.tunnelServer.value.split(':')
 
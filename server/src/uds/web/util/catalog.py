@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2012 Virtual Cable S.L.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright notice,
+#      this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#    * Neither the name of Virtual Cable S.L. nor the names of its contributors
+#      may be used to endorse or promote products derived from this software
+#      without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+'''
+@author: Adolfo Gómez, dkmaster at dkmon dot com
+'''
+
+from django.db.models import signals
+from django.urls.base import reverse
+
+from uds.models import DeployedService, Transport, Network, ServicesPoolGroup, MetaPool, UserService, Calendar, CalendarRule, Provider, Service, Image, DeployedServicePublication, getSqlDatetime
+from uds.models.CalendarAccess import CalendarAccess, CalendarAccessMeta
+from uds.models.MetaPool import MetaPoolMember
+from uds.core.util.calendar import CalendarChecker
+from uds.core.util.Cache import Cache
+from uds.core.util.State import State
+from uds.core.util import states
+from uds.core.util import html
+
+import hashlib
+import pickle
+import logging
+
+logger = logging.getLogger(__name__)
+
+__updated__ = '2019-05-12'
+
+# Validity of the group dependent part of the catalog. Changes to related models cleans it before
+CATALOG_VALIDITY = 60
+
+cache = Cache('ServicesCatalog')
+
+
+def transportValidForNets(transport, netIds):
+    """
+    Same as Transport.validForIp, but using the (already known) networks of the ip and prefetched transport networks
+    """
+    transportNets = [n.id for n in transport.networks.all()]
+    if not transportNets:
+        return True
+    inside = any(n in netIds for n in transportNets)
+    return inside if transport.nets_positive else not inside
+
+
+def transportUsable(transport, os, netIds):
+    typeTrans = transport.getType()
+    if typeTrans is None:  # This may happen if we "remove" a transport type but we have a transport of that kind on DB
+        return False
+    return transportValidForNets(transport, netIds) and typeTrans.supportsOs(os) and transport.validForOs(os)
+
+
+def calendarAccess(item):
+    """
+    Returns the data needed to check access of a service pool or meta pool without accesing database
+    Calendars are kept as (id, uuid, modified), that is all that CalendarChecker needs to use its compiled calendars
+    """
+    return item.fallbackAccess, [
+        ((ca.calendar.id, ca.calendar.uuid, ca.calendar.modified), ca.access) for ca in sorted(item.calendarAccess.all(), key=lambda x: x.priority)
+    ]
+
+
+def isAccessAllowed(access, chkDateTime):
+    """
+    Same as ServicePool.isAccessAllowed, but using the data returned by calendarAccess
+    """
+    fallback, calendars = access
+    for (calendarId, uuid, modified), acc in calendars:
+        if CalendarChecker(Calendar(id=calendarId, uuid=uuid, modified=modified)).check(chkDateTime) is True:
+            return acc == states.action.ALLOW  # Stops on first rule match found
+    return fallback == states.action.ALLOW
+
+
+def buildCatalog(groups, os, netIds):
+    """
+    Builds the group dependent part of the services list (the same for every user with the same groups, os and networks),
+    using just a few prefetching queries.
+    Items contains some private keys (starting with "_") used later to apply user dependent data
+    """
+    ids = [p.id for p in DeployedService.getDeployedServicesForGroups(groups)]
+    pools = DeployedService.objects.filter(id__in=ids).select_related(
+        'image', 'servicesPoolGroup', 'servicesPoolGroup__image', 'service__provider'
+    ).prefetch_related(
+        'transports__networks', 'memberOfMeta', 'calendarAccess__calendar', 'publications'
+    )
+    metas = MetaPool.getForGroups(groups).select_related(
+        'image', 'servicesPoolGroup', 'servicesPoolGroup__image'
+    ).prefetch_related(
+        'pools__transports__networks', 'pools__service__provider', 'calendarAccess__calendar'
+    )
+    defaultGroup = ServicesPoolGroup.default().as_dict
+
+    services = []
+    # Add meta pools data first
+    for meta in metas:
+        memberPools = list(meta.pools.all())
+        # Check that we have access to at least one transport on some of its children
+        hasUsablePools = any(transportUsable(t, os, netIds) for pool in memberPools for t in pool.transports.all())
+        # If no usable pools, this is not visible
+        if not hasUsablePools:
+            continue
+
+        services.append({
+            'id': 'M' + meta.uuid,
+            'name': meta.name,
+            'visual_name': meta.visual_name,
+            'description': meta.comments,
+            'group': meta.servicesPoolGroup.as_dict if meta.servicesPoolGroup else defaultGroup,
+            'transports': [{
+                'id': 'meta',
+                'name': 'meta',
+                'link': html.udsMetaLink(None, 'M' + meta.uuid),
+                'priority': 0
+            }],
+            'imageId': meta.image and meta.image.uuid or 'x',
+            'show_transports': False,
+            'allow_users_remove': False,
+            'allow_users_reset': False,
+            'maintenance': all(p.isInMaintenance() for p in memberPools),
+            '_pools': [p.id for p in memberPools],
+            '_access': calendarAccess(meta),
+        })
+
+    # Now generic user service
+    for svr in pools:
+        # Skip pools that are part of meta pools
+        if svr.memberOfMeta.all():
+            continue
+
+        trans = []
+        for t in sorted(svr.transports.all(), key=lambda x: x.priority):
+            if transportUsable(t, os, netIds):
+                if t.getType().ownLink is True:
+                    link = reverse('TransportOwnLink', args=('F' + svr.uuid, t.uuid))
+                else:
+                    link = html.udsAccessLink(None, 'F' + svr.uuid, t.uuid)
+                trans.append({
+                    'id': t.uuid,
+                    'name': t.name,
+                    'link': link,
+                    'priority': t.priority
+                })
+
+        # If empty transports, do not include it on list
+        if not trans:
+            continue
+
+        activePub = [p for p in svr.publications.all() if p.state == State.USABLE]
+        activePub = activePub[0] if activePub else None
+
+        services.append({
+            'id': 'F' + svr.uuid,
+            'name': svr.name,
+            'visual_name': svr.visual_name,
+            'description': svr.comments,
+            'group': svr.servicesPoolGroup.as_dict if svr.servicesPoolGroup else defaultGroup,
+            'transports': trans,
+            'imageId': svr.image.uuid if svr.image is not None else 'x',
+            'show_transports': svr.show_transports,
+            'allow_users_remove': svr.allow_users_remove,
+            'allow_users_reset': svr.allow_users_reset,
+            'maintenance': svr.isInMaintenance(),
+            '_pools': [svr.id],
+            '_access': calendarAccess(svr),
+            # If active publication is not the previous to current revision, a new one is in place and assigned services can be replaced
+            '_pub': activePub.id if activePub is not None and activePub.revision != svr.current_pub_revision - 1 else None,
+        })
+
+    # Sort services
+    return sorted(services, key=lambda s: s['name'].upper())
+
+
+def getCatalog(groups, os, netIds):
+    """
+    Returns the group dependent part of the services list, from cache if possible
+    """
+    key = hashlib.sha1('{}:{}:{}'.format(sorted(g.id for g in groups), os, sorted(netIds)).encode('utf8')).hexdigest()
+    catalog = cache.get(key)
+    if catalog is None:
+        catalog = buildCatalog(groups, os, netIds)
+        cache.put(key, catalog, CATALOG_VALIDITY)
+    return catalog
+
+
+def userAssignations(user):
+    """
+    Returns, with a single query, {servicePoolId: (in_use, publicationId)} for services assigned to user
+    """
+    res = {}
+    for poolId, inUse, pubId in UserService.objects.filter(user=user, cache_level=0, state__in=State.VALID_STATES).values_list('deployed_service_id', 'in_use', 'publication_id'):
+        if poolId not in res:
+            res[poolId] = (inUse, pubId)
+    return res
+
+
+def userCatalog(user, os, netIds):
+    """
+    Returns the list of services for an user, applying user dependent data (in use, to be replaced & access by calendars)
+    over the cached catalog.
+    Items of list contains the raw "to_be_replaced" datetime (or None)
+    """
+    groups = list(user.getGroups())
+    assignations = userAssignations(user)
+    now = getSqlDatetime()
+
+    services = []
+    for item in getCatalog(groups, os, netIds):
+        pools = item['_pools']
+        service = {k: v for k, v in item.items() if k[0] != '_'}
+        service['in_use'] = any(assignations.get(p, (False, None))[0] for p in pools)
+        service['not_accesible'] = not isAccessAllowed(item['_access'], now)
+        service['to_be_replaced'] = None
+        activePub = item.get('_pub')
+        if activePub is not None and pools[0] in assignations and assignations[pools[0]][1] != activePub:
+            replaceDate = DeployedService(id=pools[0]).recoverValue('toBeReplacedIn')
+            service['to_be_replaced'] = pickle.loads(replaceDate) if replaceDate is not None else None
+        services.append(service)
+
+    return services
+
+
+def invalidate(sender, **kwargs):
+    """
+    Cleans the cached catalog (on all servers) when any model involved changes
+    """
+    cache.clean()
+
+
+# Providers and services are included because of maintenance mode, and publications because of pools to be replaced
+for model in (DeployedService, DeployedServicePublication, MetaPool, MetaPoolMember, Transport, Network, ServicesPoolGroup, Provider, Service, Image, Calendar, CalendarRule, CalendarAccess, CalendarAccessMeta):
+    signals.post_save.connect(invalidate, sender=model, dispatch_uid='catalog-save-{}'.format(model.__name__))
+    signals.post_delete.connect(invalidate, sender=model, dispatch_uid='catalog-delete-{}'.format(model.__name__))
+
+for through in (DeployedService.transports.through, DeployedService.assignedGroups.through, MetaPool.assignedGroups.through, Network.transports.through):
+    signals.m2m_changed.connect(invalidate, sender=through, dispatch_uid='catalog-m2m-{}'.format(through.__name__))
@@ -31,163 +31,46 @@
 
 from django.utils.translation import ugettext
 from django.utils import formats
-from django.urls.base import reverse
 
-from uds.models import DeployedService, Transport, Network, ServicesPoolGroup, MetaPool
+from uds.models import Transport, Network
+from uds.core.util.netindex import NetworkIndex
 from uds.core.util.Config import GlobalConfig
-from uds.core.util import html
-
-from uds.core.managers.UserServiceManager import UserServiceManager
+from uds.web.util import catalog
 
 import logging
 
 logger = logging.getLogger(__name__)
 
-__updated__ = '2019-02-08'
+__updated__ = '2019-05-12'
 
 
 def getServicesData(request):
     # Session data
     os = request.os
 
-    # We look for services for this authenticator groups. User is logged in in just 1 authenticator, so his groups must coincide with those assigned to ds
-    groups = list(request.user.getGroups())
-    availServices = DeployedService.getDeployedServicesForGroups(groups)
-    availMetas = MetaPool.getForGroups(groups)
-
     # Information for administrators
     nets = ''
     validTrans = ''
 
     logger.debug('OS: {0}'.format(os['OS']))
 
-    if request.user.isStaff():
-        nets = ','.join([n.name for n in Network.networksFor(request.ip)])
-        tt = []
-        for t in Transport.objects.all():
-            if t.validForIp(request.ip):
-                tt.append(t.name)
-        validTrans = ','.join(tt)
-
-    logger.debug('Checking meta pools: %s', availMetas)
-    services = []
-    # Add meta pools data first
-    for meta in availMetas:
-        # Check that we have access to at least one transport on some of its children
-        hasUsablePools = False
-        in_use = False
-        for pool in meta.pools.all():
-            # if pool.isInMaintenance():
-            #    continue
-            for t in pool.transports.all():
-                typeTrans = t.getType()
-                if t.getType() and t.validForIp(request.ip) and typeTrans.supportsOs(os['OS']) and t.validForOs(os['OS']):
-                    hasUsablePools = True
-                    break
-
-            if not in_use:
-                assignedUserService = UserServiceManager.manager().getExistingAssignationForUser(pool, request.user)
-                if assignedUserService:
-                    in_use = assignedUserService.in_use
-
-            # Stop when 1 usable pool is found
-            if hasUsablePools:
-                break
-
-        # If no usable pools, this is not visible
-        if hasUsablePools:
-            group = meta.servicesPoolGroup.as_dict if meta.servicesPoolGroup else ServicesPoolGroup.default().as_dict
-
-            services.append({
-                'id': 'M' + meta.uuid,
-                'name': meta.name,
-                'visual_name': meta.visual_name,
-                'description': meta.comments,
-                'group': group,
-                'transports': [{
-                    'id': 'meta',
-                    'name': 'meta',
-                    'link': html.udsMetaLink(request, 'M' + meta.uuid),
-                    'priority': 0
-                }],
-                'imageId': meta.image and meta.image.uuid or 'x',
-                'show_transports': False,
-                'allow_users_remove': False,
-                'allow_users_reset': False,
-                'maintenance': meta.isInMaintenance(),
-                'not_accesible': not meta.isAccessAllowed(),
-                'in_use': in_use,
-                'to_be_replaced': None,
-                'to_be_replaced_text': '',
-            })
-
-    # Now generic user service
-    for svr in availServices:
-        # Skip pools that are part of meta pools
-        if svr.is_meta:
-            continue
-
-        trans = []
-        for t in svr.transports.all().order_by('priority'):
-            typeTrans = t.getType()
-            if typeTrans is None:  # This may happen if we "remove" a transport type but we have a transport of that kind on DB
-                continue
-            if t.validForIp(request.ip) and typeTrans.supportsOs(os['OS']) and t.validForOs(os['OS']):
-                if typeTrans.ownLink is True:
-                    link = reverse('TransportOwnLink', args=('F' + svr.uuid, t.uuid))
-                else:
-                    link = html.udsAccessLink(request, 'F' + svr.uuid, t.uuid)
-                trans.append(
-                    {
-                        'id': t.uuid,
-                        'name': t.name,
-                        'link': link,
-                        'priority': t.priority
-                    }
-                )
-
-        # If empty transports, do not include it on list
-        if not trans:
-            continue
-
-        if svr.image is not None:
-            imageId = svr.image.uuid
-        else:
-            imageId = 'x'
-
-        # Locate if user service has any already assigned user service for this
-        ads = UserServiceManager.manager().getExistingAssignationForUser(svr, request.user)
-        if ads is None:
-            in_use = False
-        else:
-            in_use = ads.in_use
+    netIds = sorted(NetworkIndex.index().networksFor(request.ip))
 
-        group = svr.servicesPoolGroup.as_dict if svr.servicesPoolGroup else ServicesPoolGroup.default().as_dict
+    if request.user.isStaff():
+        nets = ','.join(Network.objects.filter(id__in=netIds).values_list('name', flat=True))
+        validTrans = ','.join([t.name for t in Transport.objects.prefetch_related('networks') if catalog.transportValidForNets(t, netIds)])
 
-        tbr = svr.toBeReplaced(request.user)
+    # Services list is built from the catalog for the user groups, and user data (in use, to be replaced, ...) is applied over it
+    services = catalog.userCatalog(request.user, os['OS'], netIds)
+    for svr in services:
+        tbr = svr['to_be_replaced']
         if tbr:
             tbr = formats.date_format(tbr, "SHORT_DATETIME_FORMAT")
             tbrt = ugettext('This service is about to be replaced by a new version. Please, close the session before {} and save all your work to avoid loosing it.').format(tbr)
         else:
             tbrt = ''
-
-        services.append({
-            'id': 'F' + svr.uuid,
-            'name': svr.name,
-            'visual_name': svr.visual_name,
-            'description': svr.comments,
-            'group': group,
-            'transports': trans,
-            'imageId': imageId,
-            'show_transports': svr.show_transports,
-            'allow_users_remove': svr.allow_users_remove,
-            'allow_users_reset': svr.allow_users_reset,
-            'maintenance': svr.isInMaintenance(),
-            'not_accesible': not svr.isAccessAllowed(),
-            'in_use': in_use,
-            'to_be_replaced': tbr,
-            'to_be_replaced_text': tbrt,
-        })
+        svr['to_be_replaced'] = tbr
+        svr['to_be_replaced_text'] = tbrt
 
     logger.debug('Services: {0}'.format(services))
 
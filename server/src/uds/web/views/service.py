@@ -119,7 +119,7 @@ def userServiceEnabler(request, idService, idTransport):
             'password': password
         }
 
-        ticket = TicketStore.create(data)
+        ticket = TicketStore.create(data, owner=TicketStore.OWNER_CLIENT)
         error = ''
         url = html.udsLink(request, ticket, scrambler)
     except ServiceNotReadyError as e: